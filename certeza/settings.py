@@ -42,11 +42,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'organisation.middleware.QueryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'organisation.middleware.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +73,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'certeza.wsgi.application'
 
+# The home page and dashboard are async views and are best served over ASGI,
+# e.g. uvicorn certeza.asgi:application
+ASGI_APPLICATION = 'certeza.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -83,6 +89,64 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Use a shared backend (Redis, Memcached) when running more than one process,
+# so that write-driven invalidation reaches every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Questionnaire funnel events are queued in-process and written in batches
+# by a background thread (see prospect.events).
+
+QUESTIONNAIRE_LOG_BUFFER = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+
+# A sampled share of requests reports its query count, database and template
+# time and duplicated queries in a Server-Timing header and a log line
+# (see organisation.middleware). 0 turns sampling off.
+
+REQUEST_PROFILING = {
+    'SAMPLE_RATE': 0.0,
+    'DUPLICATE_THRESHOLD': 3,
+    'SERVER_TIMING': True,
+}
+
+
+# Async views run their independent queries concurrently in a shared pool of
+# this many threads, each holding its own database connection, so it also
+# bounds the extra connections a process opens (see organisation.concurrency).
+
+METRICS_CONCURRENCY = 4
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'organisation.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
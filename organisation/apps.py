@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class OrganisationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'organisation'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import search
+
+        post_migrate.connect(search.ensure_indexes, sender=self)
@@ -0,0 +1,199 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import caching, config
+from .models import DisciplerProfile, Prospect
+
+RATIO_CONFIG_KEY = 'discipler_prospect_ratio'
+BATCH_SIZE = 1000
+
+# Most (prospect, discipler) pairs one assign_batch call accepts
+MAX_BATCH_ASSIGNMENTS = 1000
+
+
+def discipler_capacity():
+    """Most prospects a discipler should carry, from the configured ratio; None when it is not configured.
+
+    A fractional ratio is rounded up, so one under 1 still lets each
+    discipler take a prospect rather than none.
+    """
+    if not config.is_set(RATIO_CONFIG_KEY):
+        return None
+    return math.ceil(config.get(RATIO_CONFIG_KEY))
+
+
+class AssignmentPlan:
+    """Which discipler each unassigned prospect goes to, and how loaded everyone ends up"""
+
+    def __init__(self, assignments, loads, capacity, left_unassigned):
+        # (prospect id, discipler id) pairs, oldest prospect first
+        self.assignments = assignments
+        # Discipler id to prospect count once the plan is applied
+        self.loads = loads
+        self.capacity = capacity
+        # Prospects that found no discipler with room
+        self.left_unassigned = left_unassigned
+
+    def summary(self):
+        return {
+            'assigned': len(self.assignments),
+            'left_unassigned': self.left_unassigned,
+            'capacity': self.capacity,
+            'disciplers': len(self.loads),
+            'max_load': max(self.loads.values(), default=0),
+            'min_load': min(self.loads.values(), default=0),
+        }
+
+
+def plan_assignments(organisation, capacity=None):
+    """Spread an organisation's unassigned prospects over its disciplers, least loaded first.
+
+    A min-heap keyed on (load, discipler id) hands each prospect, oldest
+    first, to whoever carries the fewest prospects, so loads end up as even
+    as the starting point allows. Disciplers at capacity drop out; once every
+    discipler is full the remaining prospects stay unassigned.
+    """
+    if capacity is None:
+        capacity = discipler_capacity()
+
+    heap = list(DisciplerProfile.objects.filter(
+        user__organisation=organisation
+    ).annotate(load=Count('prospects')).values_list('load', 'id'))
+    heapq.heapify(heap)
+
+    prospect_ids = list(Prospect.objects.filter(
+        organisation=organisation, discipler__isnull=True
+    ).order_by('created_at', 'id').values_list('id', flat=True))
+
+    loads = {discipler_id: load for load, discipler_id in heap}
+    assignments = []
+    for prospect_id in prospect_ids:
+        if not heap or (capacity is not None and heap[0][0] >= capacity):
+            break
+        load, discipler_id = heap[0]
+        heapq.heapreplace(heap, (load + 1, discipler_id))
+        loads[discipler_id] = load + 1
+        assignments.append((prospect_id, discipler_id))
+
+    return AssignmentPlan(assignments, loads, capacity, len(prospect_ids) - len(assignments))
+
+
+def auto_assign(organisation, capacity=None, dry_run=False):
+    """Plan and, unless dry_run, apply the assignment of every unassigned prospect.
+
+    The plan is written in one transaction with bulk_update, which bypasses
+    save() signals, so the organisation's cached pages are invalidated here
+    (no rollup counter depends on who disciplines a prospect). Prospects
+    someone else assigned meanwhile are left alone; the returned summary
+    counts only the rows actually updated.
+    """
+    with transaction.atomic():
+        plan = plan_assignments(organisation, capacity)
+        summary = plan.summary()
+        summary['dry_run'] = dry_run
+        if dry_run or not plan.assignments:
+            return summary
+
+        now = timezone.now()
+        prospects = [
+            Prospect(pk=prospect_id, discipler_id=discipler_id, updated_at=now)
+            for prospect_id, discipler_id in plan.assignments
+        ]
+        assigned = Prospect.objects.filter(discipler__isnull=True).bulk_update(
+            prospects, ['discipler', 'updated_at'], batch_size=BATCH_SIZE
+        )
+        summary['left_unassigned'] += summary['assigned'] - assigned
+        summary['assigned'] = assigned
+        transaction.on_commit(lambda: caching.invalidate_organisations([organisation.pk]))
+    return summary
+
+
+def _parse_id(value):
+    """An id from a request as an int; None stays None (no discipler), anything else unparseable raises ValueError"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return int(value)
+
+
+def assign_batch(organisation, pairs):
+    """Apply (prospect id, discipler id) pairs in an organisation and report on each, in order.
+
+    Every prospect and discipler is checked against the organisation with
+    one query per model, and the valid pairs are written with one UPDATE per
+    target discipler that is confined to the organisation and sets nothing
+    but the discipler and updated_at. A discipler id of None unassigns the
+    prospect. A prospect may appear once per batch; repeats are rejected.
+    """
+    parsed = []
+    for prospect_id, discipler_id in pairs:
+        try:
+            parsed.append((_parse_id(prospect_id), _parse_id(discipler_id)))
+        except (TypeError, ValueError):
+            parsed.append(None)
+
+    prospect_ids = {item[0] for item in parsed if item and item[0] is not None}
+    discipler_ids = {item[1] for item in parsed if item and item[1] is not None}
+
+    with transaction.atomic():
+        prospects = {
+            prospect_id: (name, current)
+            for prospect_id, name, current in Prospect.objects.filter(
+                organisation=organisation, pk__in=prospect_ids
+            ).values_list('id', 'name', 'discipler_id')
+        }
+        disciplers = {
+            discipler_id: f'{first_name} {last_name}'.strip() or username
+            for discipler_id, first_name, last_name, username in DisciplerProfile.objects.filter(
+                user__organisation=organisation, pk__in=discipler_ids
+            ).values_list('id', 'user__user__first_name', 'user__user__last_name', 'user__user__username')
+        }
+
+        results = []
+        targets = defaultdict(list)
+        seen = set()
+        for (raw_prospect_id, raw_discipler_id), item in zip(pairs, parsed):
+            result = {'prospect_id': raw_prospect_id, 'discipler_id': raw_discipler_id, 'success': False}
+            results.append(result)
+            if item is None or item[0] is None:
+                result['message'] = 'Invalid id'
+                continue
+            prospect_id, discipler_id = item
+            if prospect_id in seen:
+                result['message'] = 'Prospect listed more than once'
+                continue
+            seen.add(prospect_id)
+            if prospect_id not in prospects:
+                result['message'] = 'Prospect not found'
+                continue
+            if discipler_id is not None and discipler_id not in disciplers:
+                result['message'] = 'Discipler not found'
+                continue
+
+            name, current = prospects[prospect_id]
+            result['success'] = True
+            result['changed'] = current != discipler_id
+            if discipler_id is None:
+                result['message'] = f'{name} unassigned' if result['changed'] else f'{name} was not assigned'
+            elif result['changed']:
+                result['message'] = f'{name} assigned to {disciplers[discipler_id]}'
+            else:
+                result['message'] = f'{name} is already assigned to {disciplers[discipler_id]}'
+            if result['changed']:
+                targets[discipler_id].append(prospect_id)
+
+        now = timezone.now()
+        for discipler_id, ids in targets.items():
+            Prospect.objects.filter(organisation=organisation, pk__in=ids).update(
+                discipler_id=discipler_id, updated_at=now
+            )
+        if targets:
+            transaction.on_commit(lambda: caching.invalidate_organisations([organisation.pk]))
+
+    return results
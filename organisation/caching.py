@@ -0,0 +1,97 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# Cached context dicts never go stale on their own: every write to the data
+# behind them bumps a version counter that is part of their cache key.
+CONTEXT_TIMEOUT = getattr(settings, 'ORGANISATION_CACHE_TIMEOUT', 60 * 60 * 24)
+
+CONFIGS_SCOPE = 'configs'
+# Bumped when stored answers are edited or deleted, not when new submissions arrive
+RESPONSES_SCOPE = 'responses'
+
+
+def organisation_scope(organisation_id):
+    return 'organisation:%s' % organisation_id
+
+
+def _version_key(scope):
+    return 'certeza:version:%s' % scope
+
+
+def get_versions(*scopes):
+    """Current data version of each scope, as a tuple"""
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start a lost or new counter somewhere no earlier counter could have reached
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def organisation_version(organisation):
+    """The data version an organisation's cached pages are keyed on"""
+    return '%s.%s' % get_versions(CONFIGS_SCOPE, organisation_scope(organisation.id))
+
+
+def invalidate_organisations(organisation_ids):
+    for organisation_id in set(organisation_ids):
+        bump_version(organisation_scope(organisation_id))
+
+
+def invalidate_configs():
+    bump_version(CONFIGS_SCOPE)
+
+
+def invalidate_responses():
+    bump_version(RESPONSES_SCOPE)
+
+
+def _context_key(name, organisation, version, key_suffix):
+    if version is None:
+        version = organisation_version(organisation)
+    return 'certeza:context:%s:%s:%s:%s' % (name, organisation.id, version, key_suffix)
+
+
+def _fresh(context):
+    if context is None or (context.get('expires_at') and timezone.now() >= context['expires_at']):
+        return None
+    return context
+
+
+def cached_context(name, organisation, build, version=None, key_suffix=''):
+    """Return build()'s context dict for the organisation, cached against its data version.
+
+    A context may carry an 'expires_at' datetime for figures that change with
+    the clock rather than with writes; it is rebuilt once that time passes.
+    """
+    key = _context_key(name, organisation, version, key_suffix)
+
+    context = _fresh(cache.get(key))
+    if context is None:
+        context = build()
+        cache.set(key, context, CONTEXT_TIMEOUT)
+    return context
+
+
+async def acached_context(name, organisation, abuild, version=None, key_suffix=''):
+    """cached_context() for async views: abuild is awaited to build a missing context"""
+    key = await sync_to_async(_context_key)(name, organisation, version, key_suffix)
+
+    context = _fresh(await cache.aget(key))
+    if context is None:
+        context = await abuild()
+        await cache.aset(key, context, CONTEXT_TIMEOUT)
+    return context
@@ -0,0 +1,76 @@
+import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+
+# Most blocking calls, and so database connections, in flight at once across the whole process
+METRICS_CONCURRENCY = getattr(settings, 'METRICS_CONCURRENCY', 4)
+
+_executor = ThreadPoolExecutor(max_workers=METRICS_CONCURRENCY, thread_name_prefix='certeza-metrics')
+
+_pool_thread = threading.local()
+# Every pool thread's connection wrappers, for shutdown() to close
+_pool_connections = []
+_pool_connections_lock = threading.Lock()
+
+
+def _thread_connections():
+    if not hasattr(_pool_thread, 'connections'):
+        _pool_thread.connections = [connections[alias] for alias in connections]
+        with _pool_connections_lock:
+            _pool_connections.extend(_pool_thread.connections)
+    return _pool_thread.connections
+
+
+def _run(call):
+    # Pool threads keep one connection per database until the pool shuts down, whatever CONN_MAX_AGE
+    # says; only one a database error left unusable is dropped, for the next call to reopen
+    pooled_connections = _thread_connections()
+    try:
+        return call()
+    finally:
+        for pooled in pooled_connections:
+            if pooled.errors_occurred:
+                if pooled.connection is not None and not pooled.is_usable():
+                    pooled.close()
+                pooled.errors_occurred = False
+
+
+def shutdown():
+    """Stop the pool and close the database connections its threads held; registered to run at exit"""
+    _executor.shutdown(wait=True)
+    with _pool_connections_lock:
+        pooled_connections = list(_pool_connections)
+        _pool_connections.clear()
+    for pooled in pooled_connections:
+        # The thread that opened it has exited, so it is closed from this one
+        pooled.inc_thread_sharing()
+        pooled.close()
+
+
+atexit.register(shutdown)
+
+
+def _in_transaction():
+    return connection.in_atomic_block
+
+
+async def gather(*calls):
+    """Run independent blocking calls, ORM queries included, concurrently; their results in order.
+
+    The calls share a pool of METRICS_CONCURRENCY threads, each with its own
+    database connection, so however many requests are waiting no more than
+    that many queries run at once and a page takes as long as its slowest
+    call rather than the sum of them. Inside a transaction other connections
+    cannot see its writes, so the calls run one after another on the
+    request's own connection instead.
+    """
+    if await sync_to_async(_in_transaction)():
+        return await sync_to_async(lambda: [call() for call in calls])()
+    return await asyncio.gather(*(
+        sync_to_async(_run, thread_sensitive=False, executor=_executor)(call) for call in calls
+    ))
@@ -0,0 +1,87 @@
+import logging
+import math
+import threading
+
+from . import caching
+from .models import Configs
+
+logger = logging.getLogger(__name__)
+
+
+def positive_float(value):
+    number = float(value)
+    if math.isnan(number) or math.isinf(number) or number < 0:
+        raise ValueError(value)
+    return number
+
+
+class Setting:
+    """A known Configs key: how to parse its stored text, and what it is when unset or unparseable"""
+
+    def __init__(self, parse, default, description=''):
+        self.parse = parse
+        self.default = default
+        self.description = description
+
+
+SCHEMA = {
+    'discipler_prospect_ratio': Setting(
+        positive_float, 1.0, 'Recommended prospects per discipler; auto-assignment fills disciplers up to it.',
+    ),
+}
+
+
+class ConfigStore:
+    """Per-process snapshot of every Configs row, parsed against SCHEMA.
+
+    The snapshot loads in one query and is kept until the shared configs
+    version moves on, which saving or deleting any Configs row does, so a
+    read is a version check and a dictionary lookup.
+    """
+
+    def __init__(self, schema=SCHEMA):
+        self.schema = schema
+        self._values = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Parsed values of the keys that are set, by key"""
+        version = caching.get_versions(caching.CONFIGS_SCOPE)[0]
+        with self._lock:
+            if self._values is None or version != self._version:
+                self._values = self._load()
+                self._version = version
+            return self._values
+
+    def _load(self):
+        values = {}
+        for key, raw in Configs.objects.values_list('config_key', 'config_value'):
+            setting = self.schema.get(key)
+            if setting is None:
+                continue
+            try:
+                values[key] = setting.parse(raw)
+            except (TypeError, ValueError):
+                logger.warning('Ignoring unparseable value %r for config %s', raw, key)
+        return values
+
+    def get(self, key):
+        """The key's configured value, or its default; KeyError for keys not in the schema"""
+        setting = self.schema[key]
+        return self.snapshot().get(key, setting.default)
+
+    def is_set(self, key):
+        """Whether the key has a valid stored value, rather than falling back to its default"""
+        if key not in self.schema:
+            raise KeyError(key)
+        return key in self.snapshot()
+
+    def clear(self):
+        with self._lock:
+            self._values = None
+
+
+store = ConfigStore()
+get = store.get
+is_set = store.is_set
@@ -0,0 +1,254 @@
+import csv
+import json
+import uuid
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, rollups
+from .models import ActiveQuestionnaire, Organisation, Prospect
+from prospect.models import Question, Questionnaire, Responses, Submission
+
+# Columns with a meaning of their own; in CSV input every other column is an
+# answer, headed by its question's text (the layout export_responses writes).
+PROSPECT_FIELDS = ['name', 'email', 'phone_number', 'prospect_form_id']
+KNOWN_FIELDS = set(PROSPECT_FIELDS) | {'organisation', 'questionnaire', 'submitted_at', 'answers'}
+
+
+def detect_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(path, format='csv'):
+    """Yield each input row as a dict with an 'answers' dict of question text to answer"""
+    with open(path, newline='', encoding='utf-8') as source:
+        if format == 'jsonl':
+            for line in source:
+                if line.strip():
+                    row = json.loads(line)
+                    row.setdefault('answers', {})
+                    yield row
+        else:
+            for record in csv.DictReader(source):
+                row = {key: value for key, value in record.items() if key in KNOWN_FIELDS}
+                row['answers'] = {key: value for key, value in record.items()
+                                  if key not in KNOWN_FIELDS and key is not None}
+                yield row
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_time(value):
+    try:
+        moment = parse_datetime(value) if value else None
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Importer:
+    """Writes chunks of input rows: prospects upserted by email within their organisation, answers by
+    form id and question.
+
+    Organisations, questionnaires and questions are looked up once into
+    in-memory maps, and each chunk costs a fixed handful of queries however
+    many rows it holds. Rerunning a chunk is harmless, which is what makes an
+    interrupted import resumable.
+    """
+
+    def __init__(self, organisation=None, questionnaire=None):
+        self.default_organisation = organisation
+        self.default_questionnaire = questionnaire
+
+        self.organisations = {}
+        for organisation_id, name in Organisation.objects.values_list('id', 'name'):
+            self.organisations[str(organisation_id)] = organisation_id
+            self.organisations.setdefault(name, organisation_id)
+
+        self.questionnaires = {}
+        for questionnaire_id, name in Questionnaire.objects.values_list('id', 'name'):
+            self.questionnaires[str(questionnaire_id)] = questionnaire_id
+            self.questionnaires.setdefault(name, questionnaire_id)
+
+        self.questions = {}
+        for question_id, questionnaire_id, text in Question.objects.values_list('id', 'questionnaire_id', 'text'):
+            self.questions.setdefault(questionnaire_id, {}).setdefault(text, question_id)
+
+        self.organisations_by_questionnaire = {}
+        for questionnaire_id, organisation_id in ActiveQuestionnaire.objects.values_list(
+            'questionnaire_id', 'organisation_id'
+        ).distinct():
+            self.organisations_by_questionnaire.setdefault(questionnaire_id, set()).add(organisation_id)
+
+        self.unknown_questions = set()
+
+    def _lookup(self, mapping, value, default):
+        value = _clean(value)
+        if value is None:
+            return default
+        return mapping.get(value)
+
+    def import_chunk(self, rows):
+        """Write one chunk of rows in a single transaction; returns a Counter of what happened"""
+        stats = Counter(rows=len(rows))
+        with transaction.atomic():
+            affected = self._upsert_prospects(rows, stats)
+            affected |= self._write_answers(rows, stats)
+            transaction.on_commit(lambda: caching.invalidate_organisations(affected))
+        return stats
+
+    def _upsert_prospects(self, rows, stats):
+        # Prospects are matched within the row's organisation; the last row for an email there wins
+        incoming = {}
+        for row in rows:
+            email = _clean(row.get('email'))
+            if not email:
+                continue
+            organisation_id = self._lookup(self.organisations, row.get('organisation'), self.default_organisation)
+            if organisation_id is None:
+                stats['skipped'] += 1
+                continue
+            incoming[(organisation_id, email)] = row
+        if not incoming:
+            return set()
+
+        existing = {
+            (prospect.organisation_id, prospect.email): prospect
+            for prospect in Prospect.objects.filter(
+                organisation_id__in={organisation_id for organisation_id, _ in incoming},
+                email__in={email for _, email in incoming},
+            )
+        }
+        # Emails are unique across organisations: one held by another organisation's prospect, or
+        # already being created for one, is left alone
+        elsewhere = set(Prospect.objects.filter(
+            email__in=[email for (organisation_id, email) in incoming if (organisation_id, email) not in existing]
+        ).values_list('email', flat=True))
+
+        now = timezone.now()
+        to_update, to_create = [], []
+        for (organisation_id, email), row in incoming.items():
+            prospect = existing.get((organisation_id, email))
+            if prospect is not None:
+                prospect.name = _clean(row.get('name')) or prospect.name
+                prospect.phone_number = _clean(row.get('phone_number')) or prospect.phone_number
+                prospect.updated_at = now
+                to_update.append(prospect)
+                continue
+
+            name = _clean(row.get('name'))
+            if email in elsewhere or name is None:
+                stats['skipped'] += 1
+                continue
+            elsewhere.add(email)
+            to_create.append(Prospect(
+                name=name,
+                email=email,
+                phone_number=_clean(row.get('phone_number')),
+                prospect_form_id=_clean(row.get('prospect_form_id')) or uuid.uuid4().hex.upper(),
+                organisation_id=organisation_id,
+            ))
+
+        # A form id already held by another prospect would abort the whole chunk
+        taken = set(Prospect.objects.filter(
+            prospect_form_id__in=[prospect.prospect_form_id for prospect in to_create]
+        ).values_list('prospect_form_id', flat=True))
+        seen = set()
+        creatable = []
+        for prospect in to_create:
+            if prospect.prospect_form_id in taken or prospect.prospect_form_id in seen:
+                stats['skipped'] += 1
+                continue
+            seen.add(prospect.prospect_form_id)
+            creatable.append(prospect)
+
+        Prospect.objects.bulk_update(to_update, ['name', 'phone_number', 'updated_at'])
+        Prospect.objects.bulk_create(creatable)
+        # bulk_create skips the signals that keep the rollup current
+        rollups.apply(Counter(
+            contribution for prospect in creatable for contribution in rollups.contributions(prospect)
+        ))
+
+        stats['prospects_updated'] += len(to_update)
+        stats['prospects_created'] += len(creatable)
+        return {prospect.organisation_id for prospect in to_update + creatable}
+
+    def _write_answers(self, rows, stats):
+        submissions = {}
+        answers = {}
+        for row in rows:
+            form_id = _clean(row.get('prospect_form_id'))
+            if not form_id or not row.get('answers'):
+                continue
+            questionnaire_id = self._lookup(self.questionnaires, row.get('questionnaire'), self.default_questionnaire)
+            if questionnaire_id is None:
+                stats['skipped'] += 1
+                continue
+
+            questions = self.questions.get(questionnaire_id, {})
+            row_answers = {}
+            for text, answer in row['answers'].items():
+                # Like blank prospect fields, a blank answer leaves what is stored alone
+                answer = _clean(answer)
+                if answer is None:
+                    continue
+                question_id = questions.get(text)
+                if question_id is None:
+                    self.unknown_questions.add(text)
+                    continue
+                row_answers[(form_id, question_id)] = answer
+            if not row_answers:
+                continue
+            answers.update(row_answers)
+
+            submitted_at = _parse_time(_clean(row.get('submitted_at')))
+            submissions[form_id] = Submission(
+                prospect_form_id=form_id,
+                questionnaire_id=questionnaire_id,
+                organisation_id=self._lookup(self.organisations, row.get('organisation'), self.default_organisation),
+                submitted_at=submitted_at or timezone.now(),
+            )
+        if not submissions:
+            return set()
+
+        existing = set(Submission.objects.filter(
+            prospect_form_id__in=list(submissions)
+        ).values_list('prospect_form_id', flat=True))
+        new_submissions = [submission for form_id, submission in submissions.items() if form_id not in existing]
+        Submission.objects.bulk_create(new_submissions)
+
+        deltas = Counter()
+        affected = set()
+        for submission in new_submissions:
+            day = timezone.localdate(submission.submitted_at)
+            for organisation_id in self.organisations_by_questionnaire.get(submission.questionnaire_id, ()):
+                deltas[(organisation_id, day, 'submissions')] += 1
+                affected.add(organisation_id)
+        rollups.apply(deltas)
+
+        submission_ids = dict(Submission.objects.filter(
+            prospect_form_id__in=list(submissions)
+        ).values_list('prospect_form_id', 'id'))
+        Responses.objects.bulk_create([
+            Responses(submission_id=submission_ids[form_id], question_id=question_id,
+                      answer_text=answer_text, prospect_form_id=form_id)
+            for (form_id, question_id), answer_text in answers.items()
+        ], update_conflicts=True, unique_fields=['prospect_form_id', 'question'], update_fields=['answer_text'])
+        if existing:
+            # Answers to forms already stored may have changed, which response cubes cannot append
+            transaction.on_commit(caching.invalidate_responses)
+
+        for submission in submissions.values():
+            affected |= self.organisations_by_questionnaire.get(submission.questionnaire_id, set())
+        stats['submissions_created'] += len(new_submissions)
+        stats['answers_written'] += len(answers)
+        return affected
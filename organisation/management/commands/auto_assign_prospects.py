@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from organisation.assignment import auto_assign
+from organisation.models import Organisation
+
+
+class Command(BaseCommand):
+    help = ("Assign an organisation's unassigned prospects to its disciplers, least loaded first, "
+            'without taking anyone past the configured discipler_prospect_ratio.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, required=True, help='Organisation id to assign prospects in.')
+        parser.add_argument('--capacity', type=int, help='Most prospects per discipler (default: the configured ratio).')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be assigned without writing it.')
+
+    def handle(self, *args, **options):
+        organisation = Organisation.objects.filter(pk=options['organisation']).first()
+        if organisation is None:
+            raise CommandError(f"Organisation {options['organisation']} does not exist.")
+
+        started = time.monotonic()
+        summary = auto_assign(organisation, capacity=options['capacity'], dry_run=options['dry_run'])
+        elapsed = time.monotonic() - started
+
+        capacity = 'no limit' if summary['capacity'] is None else summary['capacity']
+        self.stdout.write(
+            f"{summary['disciplers']} disciplers, capacity {capacity}; "
+            f"loads now {summary['min_load']} to {summary['max_load']} prospects."
+        )
+        if summary['left_unassigned']:
+            self.stdout.write(self.style.WARNING(
+                f"{summary['left_unassigned']} prospects left unassigned: no discipler has room."
+            ))
+        verb = 'Would assign' if options['dry_run'] else 'Assigned'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {summary['assigned']} prospects in {elapsed:.1f}s."))
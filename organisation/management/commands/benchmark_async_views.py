@@ -0,0 +1,63 @@
+import statistics
+import time
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from organisation import caching, concurrency, timeseries
+from organisation.metrics import FUNNEL_WINDOWS, dashboard_calls, funnel_cache_key, funnel_metrics, home_calls
+from organisation.models import Organisation
+
+
+def _timed(organisation, function):
+    # Cold, as after a write: nothing may come out of the organisation's context or funnel cache. Only its
+    # own entries are dropped, as the cache may be shared with other processes and applications
+    caching.invalidate_organisations([organisation.id])
+    cache.delete_many([funnel_cache_key(organisation.id, days) for days in FUNNEL_WINDOWS])
+    started = time.perf_counter()
+    function()
+    return (time.perf_counter() - started) * 1000
+
+
+class Command(BaseCommand):
+    help = ("Time the home page and dashboard queries run one after another, as a sync view runs them, "
+            'against running them concurrently, as the async views do, on the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int,
+                            help='Organisation id to benchmark (default: the one with the most prospects).')
+        parser.add_argument('--runs', type=int, default=5, help='Timed runs of each variant; medians are reported.')
+        parser.add_argument('--trend-days', type=int, default=30, choices=timeseries.WINDOWS,
+                            help='Dashboard trend window in days (default: 30).')
+
+    def handle(self, *args, **options):
+        organisations = Organisation.objects.all()
+        if options['organisation'] is not None:
+            organisation = organisations.filter(pk=options['organisation']).first()
+        else:
+            organisation = organisations.annotate(size=Count('prospects')).order_by('-size', 'pk').first()
+        if organisation is None:
+            raise CommandError('No organisation to benchmark.')
+
+        _, trend_calls = timeseries.trend_calls(organisation, options['trend_days'], 'day', None)
+        pages = {
+            'home': home_calls(organisation),
+            'dashboard': dashboard_calls(organisation) + trend_calls + [partial(funnel_metrics, organisation)],
+        }
+
+        def median(function):
+            return statistics.median(_timed(organisation, function) for _ in range(options['runs']))
+
+        self.stdout.write(
+            f'{organisation.name} (id {organisation.pk}), {concurrency.METRICS_CONCURRENCY} concurrent queries at most'
+        )
+        for page, calls in pages.items():
+            slowest = max(median(call) for call in calls)
+            sequential = median(lambda: [call() for call in calls])
+            concurrent = median(lambda: async_to_sync(concurrency.gather)(*calls))
+            self.stdout.write(
+                f'{page:>10}: {len(calls)} calls, slowest alone {slowest:.1f}ms; '
+                f'sync {sequential:.1f}ms, async {concurrent:.1f}ms ({sequential / concurrent:.1f}x)'
+            )
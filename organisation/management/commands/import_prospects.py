@@ -0,0 +1,88 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from organisation.importing import Importer, detect_format, read_rows
+from organisation.models import Organisation
+from prospect.models import Questionnaire
+
+
+class Command(BaseCommand):
+    help = ('Import prospects and their answers from a CSV or JSON lines file, upserting prospects by email '
+            'within their organisation. Rows are committed in chunks and progress is checkpointed, '
+            'so an interrupted import can resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON lines file to import.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension).')
+        parser.add_argument('--organisation', type=int, help='Organisation id for rows that do not name one.')
+        parser.add_argument('--questionnaire', type=int, help='Questionnaire id for rows that do not name one.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows written per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--resume', action='store_true', help='Skip the rows a previous run already committed.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+
+        if options['organisation'] is not None and not Organisation.objects.filter(pk=options['organisation']).exists():
+            raise CommandError(f"Organisation {options['organisation']} does not exist.")
+        if options['questionnaire'] is not None and not Questionnaire.objects.filter(pk=options['questionnaire']).exists():
+            raise CommandError(f"Questionnaire {options['questionnaire']} does not exist.")
+
+        done = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                done = json.load(checkpoint)['rows']
+            self.stdout.write(f'Resuming after row {done}.')
+
+        importer = Importer(organisation=options['organisation'], questionnaire=options['questionnaire'])
+        rows = read_rows(path, options['format'] or detect_format(path))
+        for _ in islice(rows, done):
+            pass
+
+        totals = {}
+        started = time.monotonic()
+        imported = 0
+        while True:
+            chunk = list(islice(rows, options['chunk_size']))
+            if not chunk:
+                break
+            try:
+                stats = importer.import_chunk(chunk)
+            except Exception as e:
+                raise CommandError(
+                    f'Import stopped at row {done + 1}: {e}. Rerun with --resume to continue from there.'
+                )
+
+            done += len(chunk)
+            imported += len(chunk)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+            self._save_checkpoint(checkpoint_path, done)
+
+            rate = imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{done} rows: {totals.get('prospects_created', 0)} prospects created, "
+                f"{totals.get('prospects_updated', 0)} updated, {totals.get('answers_written', 0)} answers, "
+                f"{totals.get('skipped', 0)} skipped ({rate:.0f} rows/s)"
+            )
+
+        if importer.unknown_questions:
+            self.stderr.write(self.style.WARNING(
+                'Ignored answers to unknown questions: %s' % ', '.join(sorted(importer.unknown_questions))
+            ))
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f'Imported {done} rows from {path}.'))
+
+    def _save_checkpoint(self, checkpoint_path, rows):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        temporary = f'{checkpoint_path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'rows': rows}, checkpoint)
+        os.replace(temporary, checkpoint_path)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from organisation.models import Organisation
+from organisation.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-organisation daily metrics rollup from raw data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, help='Only rebuild the rollup for this organisation id.')
+
+    def handle(self, *args, **options):
+        organisation = None
+        if options['organisation'] is not None:
+            try:
+                organisation = Organisation.objects.get(pk=options['organisation'])
+            except Organisation.DoesNotExist:
+                raise CommandError(f"Organisation {options['organisation']} does not exist.")
+
+        rows = rebuild(organisation)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily metrics rows."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from organisation.search import ensure_indexes, rebuild_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create any missing full-text search tables and repopulate them from the prospect and response tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the search index in.')
+
+    def handle(self, *args, **options):
+        ensure_indexes(using=options['database'])
+        models = rebuild_indexes(using=options['database'])
+
+        if not models:
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite 3.34+; searches use LIKE instead.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(models)} full-text search indexes."))
@@ -0,0 +1,308 @@
+from datetime import timedelta
+from functools import partial
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, Min, OuterRef, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import concurrency, config, rollups, timeseries
+from .models import (ActiveQuestionnaire, DisciplerProfile, DiscipleshipFollowUp,
+                     Prospect, TraineeProfile, Training)
+from prospect.funnel import organisation_funnel
+from prospect.models import Submission
+
+# Funnel events are buffered and do not bump the organisation's data version,
+# so funnel figures are cached for a short, fixed time instead.
+FUNNEL_CACHE_TIMEOUT = 300
+FUNNEL_WINDOWS = (7, 30, 90)
+# The home page lists the most overdue follow-ups and counts the rest
+DUE_FOLLOWUPS_SHOWN = 25
+
+
+def _rate(part, whole):
+    return round(part / whole * 100, 1) if whole > 0 else 0
+
+
+def prospect_metrics(organisation):
+    """Acceptance and assignment figures for an organisation in a single query"""
+    # A prospect counts as accepted once a survey submission carries its form id
+    has_responses = Exists(Submission.objects.filter(prospect_form_id=OuterRef('prospect_form_id')))
+
+    totals = Prospect.objects.filter(organisation=organisation).aggregate(
+        total=Count('id'),
+        accepted=Count('id', filter=Q(has_responses)),
+        assigned=Count('id', filter=Q(discipler__isnull=False)),
+    )
+
+    total = totals['total']
+    return {
+        'total': total,
+        'acceptance_data': {
+            'accepted': totals['accepted'],
+            'pending': total - totals['accepted'],
+            'rate': _rate(totals['accepted'], total),
+        },
+        'assignment_data': {
+            'assigned': totals['assigned'],
+            'unassigned': total - totals['assigned'],
+            'rate': _rate(totals['assigned'], total),
+        },
+    }
+
+
+def discipleship_metrics(organisation):
+    """Discipleship path assignments broken down by completion status, read from the daily rollup"""
+    totals = rollups.totals(organisation)
+    completed = totals['assignments_completed']
+    total = sum(totals[field] for field in rollups.METRIC_FIELDS if field.startswith('assignments_'))
+
+    return {
+        'completed': completed,
+        'in_progress': totals['assignments_in_progress'],
+        'not_started': totals['assignments_not_started'],
+        'stalled': totals['assignments_stalled'],
+        'rate': _rate(completed, total),
+    }
+
+
+def discipler_count(organisation):
+    return DisciplerProfile.objects.filter(user__organisation=organisation).count()
+
+
+def ratio_metrics(total_prospects, total_disciplers, recommended_ratio):
+    """Current discipler to prospect ratio against the configured recommendation"""
+    current_ratio = (total_prospects / total_disciplers) if total_disciplers > 0 else 0
+
+    return {
+        'current': round(current_ratio, 1),
+        'recommended': recommended_ratio,
+        'total_disciplers': total_disciplers,
+        'total_prospects': total_prospects,
+        'health': 'healthy' if current_ratio <= recommended_ratio else 'overloaded'
+    }
+
+
+TRAINEE_STATUSES = [status for status, _ in TraineeProfile._meta.get_field('status').choices]
+COHORT_MONTHS = 12
+
+
+def training_metrics(organisation):
+    """Status breakdown of the organisation's trainees per training it offers.
+
+    Two queries however many trainings there are: the trainings, then one
+    count grouped by (training, status).
+    """
+    trainings = list(Training.objects.filter(organisations=organisation).order_by('pk').values_list('id', 'name'))
+
+    breakdown = {training_id: dict.fromkeys(TRAINEE_STATUSES, 0) for training_id, _ in trainings}
+    for training_id, status, count in TraineeProfile.objects.filter(
+        user__organisation=organisation, enrolled_training__in=list(breakdown)
+    ).values_list('enrolled_training_id', 'status').annotate(count=Count('id')).order_by():
+        if status in breakdown[training_id]:
+            breakdown[training_id][status] = count
+
+    training_data = []
+    for training_id, name in trainings:
+        statuses = breakdown[training_id]
+        total = sum(statuses.values())
+        training_data.append({
+            'name': name,
+            'total_trainees': total,
+            'completed': statuses['completed'],
+            'completion_rate': _rate(statuses['completed'], total),
+            'in_progress': statuses['in_progress'],
+            'statuses': statuses,
+        })
+    return training_data
+
+
+def training_cohorts(organisation, months=COHORT_MONTHS):
+    """Completion rate of the organisation's trainees by the month they enrolled, newest first"""
+    tz = timeseries.organisation_timezone(organisation)
+    since = timeseries.truncate(timezone.now(), 'month', tz)
+    for _ in range(months - 1):
+        since = timeseries.truncate(since - timedelta(days=1), 'month', tz)
+
+    cohorts = TraineeProfile.objects.filter(
+        user__organisation=organisation, created_at__gte=since
+    ).values(month=TruncMonth('created_at', tzinfo=tz)).annotate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+        dropped=Count('id', filter=Q(status='dropped')),
+    ).order_by('-month')
+
+    return [{
+        # A date, so templates show the organisation's month rather than converting to theirs
+        'month': cohort['month'].date(),
+        'total': cohort['total'],
+        'completed': cohort['completed'],
+        'dropped': cohort['dropped'],
+        'completion_rate': _rate(cohort['completed'], cohort['total']),
+    } for cohort in cohorts]
+
+
+def submission_counts(questionnaire_ids, since=None):
+    """Submissions per questionnaire id, optionally only those since a given time"""
+    submissions = Submission.objects.filter(questionnaire_id__in=set(questionnaire_ids))
+    if since is not None:
+        submissions = submissions.filter(submitted_at__gte=since)
+
+    return dict(submissions.values_list('questionnaire_id').annotate(
+        submissions=Count('id')
+    ).order_by())
+
+
+def questionnaire_metrics(organisation):
+    """Submission counts over the organisation's active questionnaires"""
+    questionnaire_ids = list(ActiveQuestionnaire.objects.filter(
+        organisation=organisation,
+        is_active=True
+    ).values_list('questionnaire_id', flat=True))
+
+    submissions = submission_counts(questionnaire_ids)
+    total_submissions = sum(submissions.get(qid, 0) for qid in questionnaire_ids)
+    total_questionnaires = len(questionnaire_ids)
+
+    return {
+        'total_questionnaires': total_questionnaires,
+        'total_submissions': total_submissions,
+        'avg_responses_per_questionnaire': round(
+            total_submissions / total_questionnaires if total_questionnaires > 0 else 0, 1
+        ),
+    }
+
+
+def funnel_cache_key(organisation_id, days):
+    return 'certeza:funnel:%s:%s' % (organisation_id, days)
+
+
+def funnel_metrics(organisation, days=30):
+    """Questionnaire funnels over the last `days` days"""
+    key = funnel_cache_key(organisation.id, days)
+    funnels = cache.get(key)
+    if funnels is None:
+        end = timezone.now()
+        funnels = organisation_funnel(organisation, end - timedelta(days=days), end)
+        cache.set(key, funnels, FUNNEL_CACHE_TIMEOUT)
+    return funnels
+
+
+def dashboard_calls(organisation):
+    """The dashboard's figures as independent calls, so they can run one after another or side by side"""
+    return [
+        partial(prospect_metrics, organisation),
+        partial(discipler_count, organisation),
+        partial(config.get, 'discipler_prospect_ratio'),
+        partial(discipleship_metrics, organisation),
+        partial(training_metrics, organisation),
+        partial(training_cohorts, organisation),
+        partial(questionnaire_metrics, organisation),
+    ]
+
+
+def _dashboard_context(prospects, total_disciplers, recommended_ratio, discipleship_data, training_data,
+                       cohorts, questionnaires):
+    return {
+        'acceptance_data': prospects['acceptance_data'],
+        'assignment_data': prospects['assignment_data'],
+        'discipleship_data': discipleship_data,
+        'ratio_data': ratio_metrics(prospects['total'], total_disciplers, recommended_ratio),
+        'training_data': training_data,
+        'training_cohorts': cohorts,
+        'total_trainees': sum(training['total_trainees'] for training in training_data),
+        'avg_responses_per_questionnaire': questionnaires['avg_responses_per_questionnaire'],
+        'total_questionnaires': questionnaires['total_questionnaires'],
+    }
+
+
+def dashboard_metrics(organisation):
+    """All dashboard figures for an organisation.
+
+    The number of queries is fixed: it does not grow with the number of
+    trainings or active questionnaires the organisation has.
+    """
+    return _dashboard_context(*(call() for call in dashboard_calls(organisation)))
+
+
+async def adashboard_metrics(organisation):
+    """dashboard_metrics() with its aggregates run concurrently"""
+    return _dashboard_context(*await concurrency.gather(*dashboard_calls(organisation)))
+
+
+def questionnaire_summaries(organisation):
+    """Name, title and submission count of each of the organisation's active questionnaires"""
+    active_questionnaires = list(ActiveQuestionnaire.objects.filter(
+        organisation=organisation,
+        is_active=True
+    ).select_related('questionnaire'))
+
+    submissions = submission_counts(aq.questionnaire_id for aq in active_questionnaires)
+    return [{
+        'questionnaire_id': aq.questionnaire_id,
+        'name': aq.questionnaire.name,
+        'title': aq.questionnaire.title,
+        'total_responses': submissions.get(aq.questionnaire_id, 0),
+    } for aq in active_questionnaires]
+
+
+def _due(organisation, now):
+    return DiscipleshipFollowUp.objects.filter(
+        prospect__organisation=organisation,
+        follow_up_date__lte=now,
+        follow_up_date__isnull=False
+    )
+
+
+def due_followups(organisation, now, limit=DUE_FOLLOWUPS_SHOWN):
+    """The longest overdue follow-ups, at most limit of them"""
+    return list(_due(organisation, now).select_related(
+        'prospect', 'discipler__user__user'
+    ).order_by('follow_up_date', 'id')[:limit])
+
+
+def due_followup_count(organisation, now):
+    return _due(organisation, now).count()
+
+
+def next_followup_due(organisation, now):
+    return DiscipleshipFollowUp.objects.filter(
+        prospect__organisation=organisation, follow_up_date__gt=now
+    ).aggregate(next_due=Min('follow_up_date'))['next_due']
+
+
+def home_calls(organisation):
+    """The home page's figures as independent calls, like dashboard_calls()"""
+    now = timezone.now()
+    return [
+        partial(rollups.totals, organisation),
+        partial(questionnaire_summaries, organisation),
+        partial(due_followups, organisation, now),
+        partial(due_followup_count, organisation, now),
+        partial(next_followup_due, organisation, now),
+    ]
+
+
+def _home_context(totals, questionnaire_data, due, due_count, next_due):
+    return {
+        'total_prospects': totals['new_prospects'],
+        'total_responses': sum(q['total_responses'] for q in questionnaire_data),
+        'questionnaire_data': questionnaire_data,
+        'due_followups': due,
+        'due_followup_count': due_count,
+        'expires_at': next_due,
+    }
+
+
+def home_metrics(organisation):
+    """Home page figures that only change when the organisation's data does.
+
+    Due follow-ups also change with the clock, so the result expires when the
+    next upcoming follow-up falls due.
+    """
+    return _home_context(*(call() for call in home_calls(organisation)))
+
+
+async def ahome_metrics(organisation):
+    """home_metrics() with its queries run concurrently"""
+    return _home_context(*await concurrency.gather(*home_calls(organisation)))
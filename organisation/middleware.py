@@ -0,0 +1,205 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+from . import tenancy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILING_SETTINGS = {
+    # Share of requests to profile; 0 turns profiling off
+    'SAMPLE_RATE': 0.0,
+    # A query shape run this many times in one request is reported as a duplicate
+    'DUPLICATE_THRESHOLD': 3,
+    'SERVER_TIMING': True,
+}
+
+_active_profile = ContextVar('request_profile', default=None)
+
+
+def profiling_settings():
+    return {**DEFAULT_PROFILING_SETTINGS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+def fingerprint(sql):
+    """The shape of a query: literals, numbers and IN lists collapsed, so repeats of it group together"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'(?:%s|\?)(?:\s*,\s*(?:%s|\?))+', '?', sql.replace('%s', '?'))
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return [(shape, count) for shape, count in self.fingerprints.most_common() if count >= threshold]
+
+
+_template_render = Template.render
+_template_timing_lock = threading.Lock()
+_template_timing_users = 0
+
+
+def _timed_template_render(self, context=None, request=None):
+    profile = _active_profile.get()
+    if profile is None:
+        return _template_render(self, context, request)
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context, request)
+    finally:
+        profile.template_time += time.perf_counter() - started
+
+
+@contextmanager
+def timed_templates():
+    """Time template renders for the profiled requests in flight.
+
+    Template.render is wrapped only while at least one request is being
+    profiled, and the wrapper charges a render to the request whose context
+    it runs in, so requests that are not sampled render untouched.
+    """
+    global _template_timing_users
+    with _template_timing_lock:
+        if not _template_timing_users:
+            Template.render = _timed_template_render
+        _template_timing_users += 1
+    try:
+        yield
+    finally:
+        with _template_timing_lock:
+            _template_timing_users -= 1
+            if not _template_timing_users:
+                Template.render = _template_render
+
+
+class QueryProfileMiddleware:
+    """Samples requests and reports their SQL and template time.
+
+    A sampled request gets a Server-Timing header and one JSON log line with
+    its query count, database and template time, and any query shape it ran
+    DUPLICATE_THRESHOLD or more times (the mark of an N+1 loop). Requests
+    that are not sampled pass straight through, so the middleware can stay
+    installed with REQUEST_PROFILING['SAMPLE_RATE'] at 0.
+
+    It belongs first in MIDDLEWARE so that the session, user and tenant
+    lookups of the middleware below it are counted too. Queries run while a
+    streaming response is consumed are not counted, nor are those an async
+    view runs in the concurrent metrics pool.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled(options):
+        rate = options['SAMPLE_RATE']
+        return rate and random.random() < rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = profiling_settings()
+        if not self.sampled(options):
+            return self.get_response(request)
+        return self.profile(request, options, self.get_response)
+
+    async def __acall__(self, request):
+        options = profiling_settings()
+        if not self.sampled(options):
+            return await self.get_response(request)
+        # Query wrappers are per connection, and so per thread: profile from the
+        # thread the view's own ORM calls are sent back to
+        return await sync_to_async(self.profile)(request, options, async_to_sync(self.get_response))
+
+    def profile(self, request, options, get_response):
+        profile = RequestProfile()
+        token = _active_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(timed_templates())
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = get_response(request)
+        finally:
+            _active_profile.reset(token)
+        total = time.perf_counter() - started
+
+        duplicates = profile.duplicates(options['DUPLICATE_THRESHOLD'])
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join([
+                'db;dur=%.1f;desc="%d queries"' % (profile.db_time * 1000, profile.queries),
+                'tpl;dur=%.1f' % (profile.template_time * 1000),
+                'dup;desc="%d duplicated"' % len(duplicates),
+                'total;dur=%.1f' % (total * 1000),
+            ])
+
+        logger.info(json.dumps({
+            'event': 'request_profile',
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(profile.db_time * 1000, 1),
+            'template_ms': round(profile.template_time * 1000, 1),
+            'queries': profile.queries,
+            'duplicates': [{'sql': shape[:500], 'count': count} for shape, count in duplicates[:10]],
+        }))
+        return response
+
+
+class TenantMiddleware:
+    """Sets request.organisation to the signed-in user's organisation, or None.
+
+    Anonymous requests cost nothing; signed-in ones are answered from the
+    per-process tenant cache after the first.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.organisation = tenancy.resolve_organisation(request.user)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.organisation = await sync_to_async(tenancy.resolve_organisation)(request.user)
+        return await self.get_response(request)
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganisationDailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('new_prospects', models.IntegerField(default=0)),
+                ('submissions', models.IntegerField(default=0)),
+                ('assignments_not_started', models.IntegerField(default=0)),
+                ('assignments_in_progress', models.IntegerField(default=0)),
+                ('assignments_stalled', models.IntegerField(default=0)),
+                ('assignments_completed', models.IntegerField(default=0)),
+                ('trainee_completions', models.IntegerField(default=0)),
+                ('organisation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='organisation.organisation')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='organisationdailymetrics',
+            constraint=models.UniqueConstraint(fields=('organisation', 'day'), name='unique_daily_metrics_per_organisation'),
+        ),
+    ]
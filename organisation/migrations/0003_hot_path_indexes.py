@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0002_organisationdailymetrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discipleshipfollowup',
+            index=models.Index(fields=['follow_up_date'], name='followup_date'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['organisation', 'created_at'], name='prospect_org_created'),
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['organisation', 'discipler'], name='prospect_org_discipler'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='prospect',
+            name='prospect_org_discipler',
+        ),
+        migrations.AddIndex(
+            model_name='prospect',
+            index=models.Index(fields=['organisation', 'discipler', 'name'], name='prospect_org_discipler_name'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:40
+
+from django.db import migrations, models
+import organisation.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0004_unassigned_prospect_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organisation',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=63, validators=[organisation.models.validate_timezone]),
+        ),
+    ]
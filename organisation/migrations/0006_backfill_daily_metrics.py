@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def backfill_daily_metrics(apps, schema_editor):
+    from organisation.rollups import rebuild
+
+    rebuild(apps=apps)
+
+
+def clear_daily_metrics(apps, schema_editor):
+    apps.get_model('organisation', 'OrganisationDailyMetrics').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0005_organisation_timezone'),
+        # Submissions are counted too, so they must exist first
+        ('prospect', '0013_backfill_submissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_metrics, clear_daily_metrics),
+    ]
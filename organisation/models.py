@@ -1,10 +1,32 @@
+import zoneinfo
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+
+def validate_timezone(value):
+    try:
+        zoneinfo.ZoneInfo(value)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f'{value} is not a known time zone')
+
+class RollupCounted:
+    """Saves and deletes in one transaction with the rollup counters their signals move"""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            return super().delete(*args, **kwargs)
 
 class Organisation(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
+    # IANA name, e.g. Africa/Kampala; dashboard trends are bucketed by this zone's days
+    timezone = models.CharField(max_length=63, default='UTC', validators=[validate_timezone])
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -47,7 +69,7 @@ class Training(models.Model):
     def __str__(self):
         return self.name
 
-class TraineeProfile(models.Model):
+class TraineeProfile(RollupCounted, models.Model):
     user = models.OneToOneField(AppUser, on_delete=models.CASCADE)
     enrolled_training = models.ForeignKey(Training, related_name='trainees', on_delete=models.CASCADE)
     status = models.CharField(max_length=50, choices=[
@@ -63,7 +85,7 @@ class TraineeProfile(models.Model):
     def __str__(self):
         return f"Trainee Profile for {self.user.username}"
 
-class Prospect(models.Model):
+class Prospect(RollupCounted, models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
@@ -74,6 +96,13 @@ class Prospect(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['organisation', 'created_at'], name='prospect_org_created'),
+            # Also serves the assignment type-ahead, which walks an organisation's unassigned prospects by name
+            models.Index(fields=['organisation', 'discipler', 'name'], name='prospect_org_discipler_name'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -100,7 +129,7 @@ class DiscipleshipPaths(models.Model):
     def __str__(self):
         return self.name
 
-class DiscipleshipPathsAssignment(models.Model):
+class DiscipleshipPathsAssignment(RollupCounted, models.Model):
     prospect = models.ForeignKey(Prospect, related_name='discipleship_assignments', on_delete=models.CASCADE)
     discipleship_path = models.ForeignKey(DiscipleshipPaths, related_name='assignments', on_delete=models.CASCADE)
     completion_status = models.CharField(max_length=50, choices=[
@@ -124,6 +153,11 @@ class DiscipleshipFollowUp(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['follow_up_date'], name='followup_date'),
+        ]
+
     def __str__(self):
         return f"Follow-up for {self.prospect.name} by {self.discipler.user.username}"
 
@@ -135,3 +169,22 @@ class Configs(models.Model):
 
     def __str__(self):
         return self.config_key
+
+class OrganisationDailyMetrics(models.Model):
+    organisation = models.ForeignKey(Organisation, related_name='daily_metrics', on_delete=models.CASCADE)
+    day = models.DateField()
+    new_prospects = models.IntegerField(default=0)
+    submissions = models.IntegerField(default=0)
+    assignments_not_started = models.IntegerField(default=0)
+    assignments_in_progress = models.IntegerField(default=0)
+    assignments_stalled = models.IntegerField(default=0)
+    assignments_completed = models.IntegerField(default=0)
+    trainee_completions = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organisation', 'day'], name='unique_daily_metrics_per_organisation'),
+        ]
+
+    def __str__(self):
+        return f"Metrics for {self.organisation.name} on {self.day}"
@@ -0,0 +1,119 @@
+from django.core import signing
+from django.db.models import Q
+
+
+def _resolve_field(model, path):
+    """The model field at the end of a double-underscore lookup path"""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, last_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.last_cursor = last_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Cursor pagination over a queryset in a fixed order.
+
+    Pages are found by filtering on the sort key of the row at the edge of the
+    previous page instead of OFFSET, so every page costs the same however deep
+    it is. The ordering must be total (end it with the primary key) and its
+    fields must not be null. Cursors are opaque, signed tokens.
+    """
+
+    def __init__(self, queryset, ordering, per_page, salt='organisation.pagination'):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+        self.salt = salt
+        self.fields = [_resolve_field(queryset.model, name) for name, _ in self.ordering]
+
+    def _cursor(self, direction, obj=None):
+        payload = {'d': direction}
+        if obj is not None:
+            payload['k'] = [self._value(obj, name) for name, _ in self.ordering]
+        return signing.dumps(payload, salt=self.salt, compress=True)
+
+    @staticmethod
+    def _value(obj, path):
+        for name in path.split('__'):
+            obj = getattr(obj, name)
+        # Dates and the like go as full-precision strings; the field parses them back
+        return obj if isinstance(obj, (int, float, str)) else str(obj)
+
+    def _decode(self, cursor):
+        try:
+            payload = signing.loads(cursor, salt=self.salt)
+            keys = payload.get('k')
+            if keys is not None:
+                keys = [field.to_python(value) for field, value in zip(self.fields, keys)]
+            return payload['d'], keys
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return 'next', None
+
+    def _after(self, keys, reverse):
+        """Rows strictly after the given sort key, in the requested direction"""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': keys[i]})
+            for prior_name, _ in self.ordering[:i]:
+                step &= Q(**{prior_name: keys[self._position(prior_name)]})
+            condition |= step
+        return condition
+
+    def _position(self, name):
+        return [field_name for field_name, _ in self.ordering].index(name)
+
+    def _order_by(self, reverse):
+        return ['%s%s' % ('-' if descending != reverse else '', name) for name, descending in self.ordering]
+
+    def get_page(self, cursor=None):
+        direction, keys = self._decode(cursor) if cursor else ('next', None)
+        reverse = direction == 'prev'
+
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if keys is not None:
+            queryset = queryset.filter(self._after(keys, reverse))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([])
+
+        # Going forwards, a cursor means there is something behind us; going back, something ahead
+        if reverse:
+            has_next, has_previous = keys is not None, has_more
+        else:
+            has_next, has_previous = has_more, keys is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor('next', rows[-1]) if has_next else None,
+            previous_cursor=self._cursor('prev', rows[0]) if has_previous else None,
+            last_cursor=self._cursor('prev') if has_next else None,
+        )
@@ -0,0 +1,173 @@
+from collections import Counter, defaultdict
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (ActiveQuestionnaire, DiscipleshipPathsAssignment, OrganisationDailyMetrics,
+                     Prospect, TraineeProfile)
+
+METRIC_FIELDS = [
+    'new_prospects',
+    'submissions',
+    'assignments_not_started',
+    'assignments_in_progress',
+    'assignments_stalled',
+    'assignments_completed',
+    'trainee_completions',
+]
+
+
+def _assignment_field(status):
+    return 'assignments_%s' % status
+
+
+def contributions(instance):
+    """The (organisation id, day, metric) counters a model instance adds to the rollup"""
+    if isinstance(instance, Prospect):
+        return [(instance.organisation_id, timezone.localdate(instance.created_at), 'new_prospects')]
+
+    if isinstance(instance, DiscipleshipPathsAssignment):
+        organisation_id = Prospect.objects.filter(
+            pk=instance.prospect_id
+        ).values_list('organisation_id', flat=True).first()
+        if organisation_id is None:
+            return []
+        return [(organisation_id, timezone.localdate(instance.assigned_at),
+                 _assignment_field(instance.completion_status))]
+
+    if isinstance(instance, TraineeProfile):
+        if instance.status != 'completed':
+            return []
+        organisation_id = instance.user.organisation_id
+        return [(organisation_id, timezone.localdate(instance.updated_at), 'trainee_completions')]
+
+    return []
+
+
+def assignment_contributions(prospect):
+    """The counters a prospect's path assignments add to its organisation's rollup"""
+    return [
+        (prospect.organisation_id, timezone.localdate(assigned_at), _assignment_field(status))
+        for status, assigned_at in DiscipleshipPathsAssignment.objects.filter(
+            prospect_id=prospect.pk
+        ).values_list('completion_status', 'assigned_at')
+    ]
+
+
+def apply(deltas):
+    """Add a Counter of (organisation id, day, metric) deltas onto the rollup rows"""
+    rows = defaultdict(dict)
+    for (organisation_id, day, field), delta in deltas.items():
+        if delta:
+            rows[(organisation_id, day)][field] = delta
+
+    for (organisation_id, day), fields in rows.items():
+        row = OrganisationDailyMetrics.objects.filter(organisation_id=organisation_id, day=day)
+        updates = {field: F(field) + delta for field, delta in fields.items()}
+        if row.update(**updates) or not any(delta > 0 for delta in fields.values()):
+            continue
+        try:
+            with transaction.atomic():
+                OrganisationDailyMetrics.objects.create(organisation_id=organisation_id, day=day, **fields)
+        except IntegrityError:
+            # Another writer created the row between our update and insert
+            row.update(**updates)
+
+
+def _running_organisation_ids(questionnaire_id):
+    return list(ActiveQuestionnaire.objects.filter(
+        questionnaire_id=questionnaire_id
+    ).values_list('organisation_id', flat=True).distinct())
+
+
+def submission_contributions(submission):
+    """The counters a submission adds: one for every organisation that runs its questionnaire"""
+    day = timezone.localdate(submission.submitted_at)
+    return [(organisation_id, day, 'submissions')
+            for organisation_id in _running_organisation_ids(submission.questionnaire_id)]
+
+
+def record_submission(questionnaire_id, submitted_at=None):
+    """Count a new submission for every organisation that runs the questionnaire.
+
+    Returns the ids of those organisations.
+    """
+    day = timezone.localdate(submitted_at or timezone.now())
+    organisation_ids = _running_organisation_ids(questionnaire_id)
+
+    apply(Counter({(organisation_id, day, 'submissions'): 1 for organisation_id in organisation_ids}))
+    return organisation_ids
+
+
+def totals(organisation, since=None):
+    """Sum the organisation's rollup rows, optionally from a given day onwards"""
+    rows = OrganisationDailyMetrics.objects.filter(organisation=organisation)
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+
+    sums = rows.aggregate(**{field: Sum(field) for field in METRIC_FIELDS})
+    return {field: sums[field] or 0 for field in METRIC_FIELDS}
+
+
+def rebuild(organisation=None, apps=global_apps):
+    """Recompute the rollup rows from raw data, for one organisation or all of them.
+
+    A data migration passes its own apps, so the historical models are used.
+    """
+    Prospect = apps.get_model('organisation', 'Prospect')
+    DiscipleshipPathsAssignment = apps.get_model('organisation', 'DiscipleshipPathsAssignment')
+    TraineeProfile = apps.get_model('organisation', 'TraineeProfile')
+    ActiveQuestionnaire = apps.get_model('organisation', 'ActiveQuestionnaire')
+    OrganisationDailyMetrics = apps.get_model('organisation', 'OrganisationDailyMetrics')
+    Submission = apps.get_model('prospect', 'Submission')
+    counters = defaultdict(Counter)
+
+    prospects = Prospect.objects.all()
+    assignments = DiscipleshipPathsAssignment.objects.all()
+    trainees = TraineeProfile.objects.filter(status='completed')
+    active_questionnaires = ActiveQuestionnaire.objects.all()
+    if organisation is not None:
+        prospects = prospects.filter(organisation=organisation)
+        assignments = assignments.filter(prospect__organisation=organisation)
+        trainees = trainees.filter(user__organisation=organisation)
+        active_questionnaires = active_questionnaires.filter(organisation=organisation)
+
+    for row in prospects.values('organisation_id', day=TruncDate('created_at')).annotate(n=Count('id')).order_by():
+        counters[(row['organisation_id'], row['day'])]['new_prospects'] += row['n']
+
+    for row in assignments.values(
+        'completion_status', organisation_id=F('prospect__organisation_id'), day=TruncDate('assigned_at')
+    ).annotate(n=Count('id')).order_by():
+        counters[(row['organisation_id'], row['day'])][_assignment_field(row['completion_status'])] += row['n']
+
+    for row in trainees.values(
+        organisation_id=F('user__organisation_id'), day=TruncDate('updated_at')
+    ).annotate(n=Count('id')).order_by():
+        counters[(row['organisation_id'], row['day'])]['trainee_completions'] += row['n']
+
+    organisations_by_questionnaire = defaultdict(set)
+    for questionnaire_id, organisation_id in active_questionnaires.values_list('questionnaire_id', 'organisation_id'):
+        organisations_by_questionnaire[questionnaire_id].add(organisation_id)
+
+    submissions = Submission.objects.filter(
+        questionnaire_id__in=list(organisations_by_questionnaire)
+    ).values('questionnaire_id', day=TruncDate('submitted_at')).annotate(n=Count('id')).order_by()
+    for row in submissions:
+        for organisation_id in organisations_by_questionnaire[row['questionnaire_id']]:
+            counters[(organisation_id, row['day'])]['submissions'] += row['n']
+
+    with transaction.atomic():
+        existing = OrganisationDailyMetrics.objects.all()
+        if organisation is not None:
+            existing = existing.filter(organisation=organisation)
+        existing.delete()
+
+        OrganisationDailyMetrics.objects.bulk_create([
+            OrganisationDailyMetrics(organisation_id=organisation_id, day=day, **fields)
+            for (organisation_id, day), fields in counters.items()
+        ], batch_size=500)
+
+    return len(counters)
@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Prospect
+from prospect.models import Question, Responses
+
+# Full-text indexes: an FTS5 table over some text columns of a model's table.
+# The trigram tokenizer matches any substring of three or more characters,
+# case-insensitively, which is what the icontains searches did.
+FTS_INDEXES = {
+    Prospect: ['name', 'email', 'phone_number', 'prospect_form_id'],
+    Responses: ['prospect_form_id', 'answer_text'],
+}
+TRIGRAM_LENGTH = 3
+
+
+def fts5_available(connection):
+    # The trigram tokenizer arrived in SQLite 3.34
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 34)
+
+
+def _fts_table(model):
+    return '%s_fts' % model._meta.db_table
+
+
+def _index_sql(model, columns):
+    """DDL for an external-content FTS5 table over the model's table and the triggers that keep it in sync"""
+    table = model._meta.db_table
+    fts = _fts_table(model)
+    column_list = ', '.join(columns)
+    new_values = ', '.join('new.%s' % column for column in columns)
+    old_values = ', '.join('old.%s' % column for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='{table}', "
+        f"content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def _missing_objects(connection, model):
+    fts = _fts_table(model)
+    expected = {fts, f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ', '.join(['%s'] * len(expected)),
+            list(expected),
+        )
+        return expected - {row[0] for row in cursor.fetchall()}
+
+
+def rebuild_indexes(using='default'):
+    """Repopulate every full-text index from its table; returns the models rebuilt"""
+    connection = connections[using]
+    if not fts5_available(connection):
+        return []
+    with connection.cursor() as cursor:
+        for model in FTS_INDEXES:
+            fts = _fts_table(model)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return list(FTS_INDEXES)
+
+
+def ensure_indexes(using='default', **kwargs):
+    """Create any missing full-text table or trigger after migrate, rebuilding what was out of sync.
+
+    SQLite drops a table's triggers whenever a migration remakes the table,
+    so this runs after every migrate rather than once from a migration.
+    """
+    connection = connections[using]
+    if not fts5_available(connection):
+        return
+    for model, columns in FTS_INDEXES.items():
+        if not router.allow_migrate_model(using, model) or not _missing_objects(connection, model):
+            continue
+        fts = _fts_table(model)
+        with connection.cursor() as cursor:
+            for statement in _index_sql(model, columns):
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+class LikeSearch:
+    """Substring search with icontains; works anywhere but scans the table"""
+
+    def prospects(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(email__icontains=query) |
+            Q(phone_number__icontains=query) |
+            Q(prospect_form_id__icontains=query)
+        )
+
+    def responses(self, queryset, query):
+        return queryset.filter(
+            Q(prospect_form_id__icontains=query) |
+            Q(question__questionnaire__name__icontains=query) |
+            Q(question__text__icontains=query) |
+            Q(answer_text__icontains=query)
+        )
+
+
+class FTS5Search(LikeSearch):
+    """Substring search through the SQLite FTS5 trigram indexes.
+
+    Queries shorter than a trigram cannot use the index and fall back to LIKE.
+    """
+
+    def _matches(self, model, query):
+        fts = _fts_table(model)
+        phrase = '"%s"' % query.replace('"', '""')
+        return RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [phrase])
+
+    def prospects(self, queryset, query):
+        if len(query) < TRIGRAM_LENGTH:
+            return super().prospects(queryset, query)
+        return queryset.filter(id__in=self._matches(Prospect, query))
+
+    def responses(self, queryset, query):
+        if len(query) < TRIGRAM_LENGTH:
+            return super().responses(queryset, query)
+        # Questions and questionnaires are few, so match them first and look responses up by question
+        questions = Question.objects.filter(
+            Q(text__icontains=query) | Q(questionnaire__name__icontains=query)
+        ).values('id')
+        return queryset.filter(Q(id__in=self._matches(Responses, query)) | Q(question_id__in=questions))
+
+
+_backend = None
+
+
+def get_backend():
+    """The configured search backend, or FTS5 on SQLite and LIKE elsewhere"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'ORGANISATION_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif fts5_available(connections['default']):
+            _backend = FTS5Search()
+        else:
+            _backend = LikeSearch()
+    return _backend
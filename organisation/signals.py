@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from . import caching, config, rollups, tenancy
+from .models import (ActiveQuestionnaire, AppUser, Configs, DisciplerProfile, DiscipleshipFollowUp,
+                     DiscipleshipPathsAssignment, Organisation, Prospect, TraineeProfile, Training)
+from prospect import analytics
+from prospect.models import Responses, Submission
+
+
+def remember_rollup_contributions(sender, instance, raw=False, **kwargs):
+    """Keep what the stored row contributed, so post_save can move it"""
+    if raw or instance._state.adding:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    instance._rollup_contributions = rollups.contributions(previous) if previous else []
+    if isinstance(instance, Prospect) and previous and previous.organisation_id != instance.organisation_id:
+        # Path assignments count towards the prospect's organisation, so they move with it
+        moved = rollups.assignment_contributions(previous)
+        instance._rollup_contributions += moved
+        instance._rollup_moved = [(instance.organisation_id, day, field) for _, day, field in moved]
+
+
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    # Prospect, DiscipleshipPathsAssignment and TraineeProfile save in a transaction
+    # (models.RollupCounted), so the counters move with the write or not at all
+    if raw:
+        return
+    deltas = Counter(rollups.contributions(instance) + getattr(instance, '_rollup_moved', []))
+    deltas.subtract(getattr(instance, '_rollup_contributions', []))
+    instance._rollup_contributions = []
+    instance._rollup_moved = []
+    rollups.apply(deltas)
+
+
+def update_rollups_on_delete(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(rollups.contributions(instance))
+    rollups.apply(deltas)
+
+
+for model in (Prospect, DiscipleshipPathsAssignment, TraineeProfile):
+    pre_save.connect(remember_rollup_contributions, sender=model)
+    post_save.connect(update_rollups_on_save, sender=model)
+    pre_delete.connect(update_rollups_on_delete, sender=model)
+
+
+def update_rollups_on_submission_delete(sender, instance, **kwargs):
+    # New submissions are counted where they are written (rollups.record_submission and the importer)
+    deltas = Counter()
+    deltas.subtract(rollups.submission_contributions(instance))
+    rollups.apply(deltas)
+
+
+pre_delete.connect(update_rollups_on_submission_delete, sender=Submission)
+
+
+def affected_organisation_ids(instance):
+    """Organisations whose cached pages depend on a model instance"""
+    if isinstance(instance, Organisation):
+        return [instance.pk]
+    if isinstance(instance, (Prospect, AppUser, ActiveQuestionnaire)):
+        return [instance.organisation_id]
+    if isinstance(instance, Submission):
+        return list(ActiveQuestionnaire.objects.filter(
+            questionnaire_id=instance.questionnaire_id
+        ).values_list('organisation_id', flat=True))
+    if isinstance(instance, Responses):
+        return list(ActiveQuestionnaire.objects.filter(
+            questionnaire__questions=instance.question_id
+        ).values_list('organisation_id', flat=True))
+    if isinstance(instance, (DiscipleshipFollowUp, DiscipleshipPathsAssignment)):
+        return list(Prospect.objects.filter(pk=instance.prospect_id).values_list('organisation_id', flat=True))
+    if isinstance(instance, (TraineeProfile, DisciplerProfile)):
+        return list(AppUser.objects.filter(pk=instance.user_id).values_list('organisation_id', flat=True))
+    if isinstance(instance, Training):
+        return list(instance.organisations.values_list('pk', flat=True))
+    return []
+
+
+def invalidate_cached_pages(sender, instance, raw=False, **kwargs):
+    # Bump after commit, so a concurrent reader cannot cache pre-commit data under the new version
+    if raw:
+        return
+    organisation_ids = affected_organisation_ids(instance)
+    transaction.on_commit(lambda: caching.invalidate_organisations(organisation_ids))
+
+
+def invalidate_cached_pages_on_m2m(sender, instance, action, model, pk_set, **kwargs):
+    # Before the change, so a clear still finds the rows it is about to remove
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    organisation_ids = set(affected_organisation_ids(instance))
+    if model is Organisation:
+        organisation_ids |= pk_set or set()
+    elif model is DisciplerProfile:
+        disciplers = instance.disciplerprofile_set.all() if pk_set is None else model.objects.filter(pk__in=pk_set)
+        organisation_ids |= set(disciplers.values_list('user__organisation_id', flat=True))
+    transaction.on_commit(lambda: caching.invalidate_organisations(organisation_ids))
+
+
+# Deletes are handled before the row goes, while the rows that lead to its organisations are still there
+for model in (Prospect, Submission, Responses, DiscipleshipFollowUp, DiscipleshipPathsAssignment, TraineeProfile,
+              AppUser, DisciplerProfile, ActiveQuestionnaire, Training):
+    post_save.connect(invalidate_cached_pages, sender=model)
+    pre_delete.connect(invalidate_cached_pages, sender=model)
+for relation in (Training.organisations, DisciplerProfile.trainings_completed):
+    m2m_changed.connect(invalidate_cached_pages_on_m2m, sender=relation.through)
+
+
+def invalidate_config(sender, instance, **kwargs):
+    # Drop this process's snapshot now; the version bump refreshes every process and every cached page
+    config.store.clear()
+    transaction.on_commit(caching.invalidate_configs)
+
+
+post_save.connect(invalidate_config, sender=Configs)
+post_delete.connect(invalidate_config, sender=Configs)
+
+
+def invalidate_tenants(sender, instance, raw=False, **kwargs):
+    # Drop this process's entries now, and every process's once the change is visible to them
+    tenancy.tenant_cache.clear()
+    transaction.on_commit(tenancy.invalidate)
+
+
+for model in (AppUser, Organisation):
+    post_save.connect(invalidate_tenants, sender=model)
+    post_delete.connect(invalidate_tenants, sender=model)
+
+
+def invalidate_response_cubes(sender, instance, created=False, raw=False, **kwargs):
+    # Response cubes append new submissions themselves; changed or removed answers mean rebuilding them
+    if raw or created:
+        return
+    analytics.cubes.clear()
+    transaction.on_commit(caching.invalidate_responses)
+
+
+post_save.connect(invalidate_response_cubes, sender=Responses)
+post_delete.connect(invalidate_response_cubes, sender=Responses)
+post_delete.connect(invalidate_response_cubes, sender=Submission)
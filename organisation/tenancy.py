@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import caching
+from .models import AppUser
+
+TENANT_CACHE_SIZE = getattr(settings, 'TENANT_CACHE_SIZE', 1024)
+
+# Bumped whenever any user's organisation may have changed, so every process drops its cache
+TENANTS_SCOPE = 'tenants'
+
+_MISSING = object()
+
+
+class TenantCache:
+    """Per-process LRU of user id to organisation (or None for users without one).
+
+    Each lookup first compares the shared tenants version with the one the
+    entries were filled under, and starts over if another process bumped it.
+    """
+
+    def __init__(self, size=TENANT_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def get(self, user_id):
+        version = caching.get_versions(TENANTS_SCOPE)[0]
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            organisation = self._entries.get(user_id, _MISSING)
+            if organisation is not _MISSING:
+                self._entries.move_to_end(user_id)
+            return organisation
+
+    def set(self, user_id, organisation):
+        with self._lock:
+            self._entries[user_id] = organisation
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tenant_cache = TenantCache()
+
+
+def resolve_organisation(user):
+    """The organisation a user works in, or None for anonymous users and users without an AppUser"""
+    if not user.is_authenticated:
+        return None
+
+    organisation = tenant_cache.get(user.pk)
+    if organisation is _MISSING:
+        app_user = AppUser.objects.select_related('organisation').filter(user_id=user.pk).first()
+        organisation = app_user.organisation if app_user else None
+        tenant_cache.set(user.pk, organisation)
+    return organisation
+
+
+def invalidate():
+    tenant_cache.clear()
+    caching.bump_version(TENANTS_SCOPE)
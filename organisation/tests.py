@@ -1,3 +1,1240 @@
-from django.test import TestCase
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.template.backends.django import Template
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import caching, concurrency, config, middleware, rollups, search, timeseries
+from .assignment import auto_assign
+from .importing import Importer
+from .metrics import dashboard_metrics, due_followup_count, due_followups, training_cohorts, training_metrics
+from .models import (ActiveQuestionnaire, AppUser, Configs, DisciplerProfile, DiscipleshipFollowUp,
+                     DiscipleshipPaths, DiscipleshipPathsAssignment, Organisation, OrganisationDailyMetrics, Prospect,
+                     TraineeProfile, Training)
+from .pagination import KeysetPaginator
+from prospect.models import Question, Questionnaire, Responses, SelectOption, Submission
+from prospect.sample_data import SampleDataGenerator
+
+# Tables that grow without bound; a query on any of them must be served by an index
+HOT_TABLES = {
+    'organisation_prospect',
+    'organisation_discipleshipfollowup',
+    'organisation_discipleshippathsassignment',
+    'organisation_traineeprofile',
+    'prospect_responses',
+    'prospect_submission',
+    'prospect_questionnairelog',
+}
+
+
+def build_organisation(name='Certeza', prospects=20, trainings=2):
+    """An organisation with staff, a discipler, an active questionnaire and some activity"""
+    organisation = Organisation.objects.create(name=name, email=f'{name.lower()}@example.com')
+    staff = User.objects.create_user(f'{name.lower()}-staff', password='password')
+    AppUser.objects.create(organisation=organisation, user=staff, role='admin')
+
+    discipler_user = User.objects.create_user(f'{name.lower()}-discipler', first_name='Dan', last_name='Iel')
+    discipler = DisciplerProfile.objects.create(
+        user=AppUser.objects.create(organisation=organisation, user=discipler_user, role='discipler')
+    )
+
+    questionnaire = Questionnaire.objects.create(name=f'{name} survey', title='Survey')
+    text_question = Question.objects.create(questionnaire=questionnaire, text='Your name?', type='text', order=1)
+    select_question = Question.objects.create(questionnaire=questionnaire, text='Pick one', type='select', order=2)
+    for order in range(1, 4):
+        SelectOption.objects.create(text=f'Option {order}', value=f'option-{order}', order=order).questions.add(select_question)
+    active_questionnaire = ActiveQuestionnaire.objects.create(organisation=organisation, questionnaire=questionnaire)
+
+    path = DiscipleshipPaths.objects.create(name='Foundations')
+    for i in range(prospects):
+        form_id = f'{name.upper()}{i:06d}'
+        prospect = Prospect.objects.create(
+            name=f'Prospect {i}', email=f'prospect{i}@{name.lower()}.example.com', prospect_form_id=form_id,
+            organisation=organisation, discipler=discipler if i % 2 else None,
+        )
+        submission = Submission.objects.create(prospect_form_id=form_id, questionnaire=questionnaire,
+                                               organisation=organisation)
+        Responses.objects.bulk_create([
+            Responses(submission=submission, question=text_question, answer_text=f'Prospect {i}', prospect_form_id=form_id),
+            Responses(submission=submission, question=select_question, answer_text='option-1', prospect_form_id=form_id),
+        ])
+        DiscipleshipPathsAssignment.objects.create(prospect=prospect, discipleship_path=path)
+        DiscipleshipFollowUp.objects.create(prospect=prospect, discipler=discipler,
+                                            follow_up_date=timezone.now() - timedelta(days=i % 5))
+
+    for t in range(trainings):
+        training = Training.objects.create(name=f'Training {t}')
+        training.organisations.add(organisation)
+        trainee_user = User.objects.create_user(f'{name.lower()}-trainee-{t}')
+        TraineeProfile.objects.create(
+            user=AppUser.objects.create(organisation=organisation, user=trainee_user, role='trainee'),
+            enrolled_training=training,
+        )
+
+    return {
+        'organisation': organisation,
+        'staff': staff,
+        'questionnaire': questionnaire,
+        'active_questionnaire': active_questionnaire,
+    }
+
+
+def full_scans(sql):
+    """The hot tables a query reads with a full table or index scan, per EXPLAIN QUERY PLAN"""
+    aliases = {alias: table for table, alias in re.findall(r'"(\w+)" (U\d+|T\d+)\b', sql)}
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = [row[-1] for row in cursor.fetchall()]
+
+    scanned = set()
+    for step in plan:
+        match = re.match(r'SCAN (\w+)', step)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in HOT_TABLES:
+                scanned.add(table)
+    return scanned
+
+
+def rollup_rows():
+    """The non-zero daily rollup rows, as rebuild() would write them"""
+    return {
+        (row.pop('organisation_id'), row.pop('day')): row
+        for row in OrganisationDailyMetrics.objects.values('organisation_id', 'day', *rollups.METRIC_FIELDS)
+        if any(row[field] for field in rollups.METRIC_FIELDS)
+    }
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class CachedPageInvalidationTests(TestCase):
+    """Every write behind a cached page's figures moves the organisation's version, so the page is rebuilt"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=4)
+        cls.organisation = cls.data['organisation']
+        cls.other = build_organisation(name='Other', prospects=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.data['staff'])
+
+    def page(self, name):
+        return self.client.get(f'/organisation/{name}/').context
+
+    def disciplers(self):
+        return self.page('dashboard')['ratio_data']['total_disciplers']
+
+    def trainings(self):
+        return [training['name'] for training in self.page('dashboard')['training_data']]
+
+    def test_disciplers(self):
+        self.assertEqual(self.disciplers(), 1)
+
+        user = User.objects.create_user('second-discipler')
+        with self.captureOnCommitCallbacks(execute=True):
+            app_user = AppUser.objects.create(organisation=self.organisation, user=user, role='discipler')
+            DisciplerProfile.objects.create(user=app_user)
+        self.assertEqual(self.disciplers(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DisciplerProfile.objects.filter(user=app_user).delete()
+        self.assertEqual(self.disciplers(), 1)
+
+    def test_active_questionnaires(self):
+        self.assertEqual(self.page('dashboard')['total_questionnaires'], 1)
+        self.assertEqual(len(self.page('home')['questionnaire_data']), 1)
+        self.assertEqual(self.page('survey-responses')['total_responses'], 8)
+
+        # The other organisation's questionnaire, which already holds 4 answers
+        with self.captureOnCommitCallbacks(execute=True):
+            active = ActiveQuestionnaire.objects.create(organisation=self.organisation,
+                                                        questionnaire=self.other['questionnaire'])
+        self.assertEqual(self.page('dashboard')['total_questionnaires'], 2)
+        self.assertEqual(len(self.page('home')['questionnaire_data']), 2)
+        self.assertEqual(self.page('survey-responses')['total_responses'], 12)
+
+        active.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            active.save()
+        self.assertEqual(self.page('dashboard')['total_questionnaires'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            active.delete()
+        self.assertEqual(self.page('survey-responses')['total_responses'], 8)
+
+    def test_trainings(self):
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            training = Training.objects.create(name='Training 2')
+            training.organisations.add(self.organisation)
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1', 'Training 2'])
+
+        training.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            training.save()
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1', 'Renamed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            training.organisations.clear()
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organisation.trainings.add(training)
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1', 'Renamed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            training.delete()
+        self.assertEqual(self.trainings(), ['Training 0', 'Training 1'])
+
+    def test_trainings_completed(self):
+        discipler = DisciplerProfile.objects.get(user__organisation=self.organisation)
+        training = Training.objects.filter(organisations=self.organisation).first()
+
+        for change in (lambda: discipler.trainings_completed.add(training),
+                       lambda: training.disciplerprofile_set.clear()):
+            version = caching.organisation_version(self.organisation)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotEqual(caching.organisation_version(self.organisation), version)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class RollupTests(TestCase):
+    """Signal-maintained rollup rows must always equal a rebuild from raw data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=5)
+        cls.other = build_organisation(name='Other', prospects=3)
+
+    def setUp(self):
+        # build_organisation() writes submissions directly, where the form view would count them
+        rollups.rebuild()
+
+    def assertMatchesRebuild(self):
+        maintained = rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(maintained, rollup_rows())
+
+    def test_prospect_create(self):
+        Prospect.objects.create(name='New', email='new@example.com', prospect_form_id='NEW',
+                                organisation=self.data['organisation'])
+        self.assertEqual(rollups.totals(self.data['organisation'])['new_prospects'], 6)
+        self.assertMatchesRebuild()
+
+    def test_prospect_update(self):
+        prospect = Prospect.objects.filter(organisation=self.data['organisation']).first()
+        prospect.organisation = self.other['organisation']
+        prospect.save()
+        self.assertEqual(rollups.totals(self.data['organisation'])['new_prospects'], 4)
+        self.assertEqual(rollups.totals(self.other['organisation'])['new_prospects'], 4)
+        self.assertMatchesRebuild()
+
+    def test_prospect_delete(self):
+        Prospect.objects.filter(organisation=self.data['organisation']).first().delete()
+        totals = rollups.totals(self.data['organisation'])
+        self.assertEqual((totals['new_prospects'], totals['assignments_not_started']), (4, 4))
+        self.assertMatchesRebuild()
+
+    def test_submission_delete(self):
+        Submission.objects.filter(prospect_form_id='CERTEZA000000').delete()
+        Submission.objects.get(prospect_form_id='OTHER000000').delete()
+        self.assertEqual(rollups.totals(self.data['organisation'])['submissions'], 4)
+        self.assertEqual(rollups.totals(self.other['organisation'])['submissions'], 2)
+        self.assertMatchesRebuild()
+
+    def test_failed_write_leaves_the_rollup_alone(self):
+        before = rollup_rows()
+
+        def fail(**kwargs):
+            raise RuntimeError('later receiver failed')
+
+        post_save.connect(fail, sender=Prospect)
+        try:
+            with self.assertRaises(RuntimeError):
+                Prospect.objects.create(name='New', email='new@example.com', prospect_form_id='NEW',
+                                        organisation=self.data['organisation'])
+        finally:
+            post_save.disconnect(fail, sender=Prospect)
+
+        self.assertFalse(Prospect.objects.filter(prospect_form_id='NEW').exists())
+        self.assertEqual(rollup_rows(), before)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class QueryPlanTests(TestCase):
+    """Every query the views run against a hot table must be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation()
+        build_organisation(name='Other')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.data['staff'])
+
+    def assertIndexedQueries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, 200)
+
+        for query in queries.captured_queries:
+            if query['sql'].startswith('SELECT'):
+                self.assertFalse(full_scans(query['sql']), query['sql'])
+
+    def test_home(self):
+        self.assertIndexedQueries('get', '/organisation/home/')
+
+    def test_dashboard(self):
+        self.assertIndexedQueries('get', '/organisation/dashboard/')
+        self.assertIndexedQueries('get', '/organisation/dashboard/', {'trend_days': 365, 'trend_bucket': 'week'})
+
+    def test_prospects(self):
+        for tab in ('all', 'assigned', 'unassigned'):
+            self.assertIndexedQueries('get', '/organisation/prospects/', {'tab': tab})
+        self.assertIndexedQueries('get', '/organisation/prospects/', {'search': 'prospect1'})
+
+    def test_disciplers(self):
+        for tab in ('all', 'trained', 'not_trained'):
+            self.assertIndexedQueries('get', '/organisation/disciplers/', {'tab': tab})
+        self.assertIndexedQueries('get', '/organisation/api/unassigned-prospects/')
+        self.assertIndexedQueries('get', '/organisation/api/unassigned-prospects/', {'q': 'prospect1'})
+
+    def test_survey_responses(self):
+        self.assertIndexedQueries('get', '/organisation/survey-responses/')
+        self.assertIndexedQueries('get', '/organisation/survey-responses/', {'search': 'Prospect 1'})
+
+    def test_public_form(self):
+        active_questionnaire = self.data['active_questionnaire']
+        self.assertIndexedQueries('get', f'/prospect/form/{active_questionnaire.id}/')
+        self.assertIndexedQueries('post', f'/prospect/form/submit/{self.data["questionnaire"].id}/', {
+            'new_form_id': 'PLANTEST',
+            'active_questionnaire_id': active_questionnaire.id,
+        })
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=12)
+        cls.other = build_organisation(name='Other', prospects=2)
+
+    def setUp(self):
+        if not search.fts5_available(connection):
+            self.skipTest('SQLite has no FTS5 trigram tokenizer')
+        self.fts, self.like = search.FTS5Search(), search.LikeSearch()
+
+    def prospect_names(self, backend, query):
+        return sorted(backend.prospects(Prospect.objects.all(), query).values_list('name', flat=True))
+
+    def response_ids(self, backend, query):
+        return sorted(backend.responses(Responses.objects.all(), query).values_list('id', flat=True))
+
+    def test_prospects_match_any_substring_as_like_does(self):
+        for query in ('OSPECT1', 'prospect1@certeza', 'CERTEZA00001', 'example.com', 'nobody'):
+            with self.subTest(query=query):
+                self.assertEqual(self.prospect_names(self.fts, query), self.prospect_names(self.like, query))
+        # Both organisations have a Prospect 1
+        self.assertEqual(self.prospect_names(self.fts, 'ospect1'),
+                         ['Prospect 1', 'Prospect 1', 'Prospect 10', 'Prospect 11'])
+        self.assertEqual(self.prospect_names(self.fts, '@other.'), ['Prospect 0', 'Prospect 1'])
+
+    def test_responses_match_answers_questions_and_questionnaires(self):
+        for query in ('Prospect 1', 'option-1', 'Pick one', 'Other survey', 'OTHER000001'):
+            with self.subTest(query=query):
+                self.assertEqual(self.response_ids(self.fts, query), self.response_ids(self.like, query))
+        self.assertEqual(len(self.response_ids(self.fts, 'Prospect 1')), 4)
+        self.assertEqual(len(self.response_ids(self.fts, 'Pick one')), 14)
+        self.assertEqual(len(self.response_ids(self.fts, 'Other survey')), 4)
+
+    def test_index_follows_updates_and_deletes(self):
+        prospect = Prospect.objects.get(name='Prospect 3')
+        prospect.name = 'Zebedee'
+        prospect.save()
+        self.assertEqual(self.prospect_names(self.fts, 'ebede'), ['Zebedee'])
+        self.assertNotIn('Prospect 3', self.prospect_names(self.fts, 'Prospect 3'))
+
+        Responses.objects.filter(prospect_form_id=prospect.prospect_form_id).update(answer_text='Quixotic')
+        self.assertEqual(len(self.response_ids(self.fts, 'uixot')), 2)
+
+        prospect.delete()
+        Responses.objects.filter(prospect_form_id=prospect.prospect_form_id).delete()
+        self.assertEqual(self.prospect_names(self.fts, 'ebede'), [])
+        self.assertEqual(self.response_ids(self.fts, 'uixot'), [])
+
+    def test_queries_shorter_than_a_trigram_use_like(self):
+        for query in ('1', 'p1'):
+            with self.subTest(query=query):
+                sql = str(self.fts.prospects(Prospect.objects.all(), query).query)
+                self.assertIn('LIKE', sql)
+                self.assertNotIn('MATCH', sql)
+                self.assertEqual(self.prospect_names(self.fts, query), self.prospect_names(self.like, query))
+        self.assertIn('MATCH', str(self.fts.prospects(Prospect.objects.all(), 'ros').query))
+
+    def test_other_databases_use_like(self):
+        postgres = mock.Mock(vendor='postgresql')
+        with mock.patch.object(search, '_backend', None), mock.patch.object(search, 'connections', {'default': postgres}):
+            self.assertIs(type(search.get_backend()), search.LikeSearch)
+            search.ensure_indexes()
+            self.assertEqual(search.rebuild_indexes(), [])
+        postgres.cursor.assert_not_called()
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organisation = build_organisation(prospects=23)['organisation']
+        # Ties on the sort key: only the id tells these apart
+        moments = [timezone.now() - timedelta(hours=i // 4) for i in range(23)]
+        for prospect, moment in zip(Prospect.objects.order_by('id'), moments):
+            Prospect.objects.filter(pk=prospect.pk).update(created_at=moment, name=f'Name {prospect.pk % 3}')
+        cls.prospects = Prospect.objects.filter(organisation=cls.organisation)
+
+    def paginator(self, ordering=('-created_at', '-id'), salt='tests'):
+        return KeysetPaginator(self.prospects, list(ordering), 5, salt=salt)
+
+    def walk(self, paginator, cursor, step):
+        ids = []
+        while True:
+            page = paginator.get_page(cursor)
+            ids.append([prospect.id for prospect in page])
+            cursor = step(page)
+            if cursor is None:
+                return ids
+
+    def test_next_and_previous_round_trip(self):
+        for ordering in (['-created_at', '-id'], ['name', 'id']):
+            with self.subTest(ordering=ordering):
+                expected = list(self.prospects.order_by(*ordering).values_list('id', flat=True))
+                paginator = self.paginator(ordering)
+
+                forwards = self.walk(paginator, None, lambda page: page.next_cursor)
+                self.assertEqual(sum(forwards, []), expected)
+                self.assertEqual([len(ids) for ids in forwards], [5, 5, 5, 5, 3])
+
+                last = paginator.get_page(paginator.get_page().last_cursor)
+                self.assertEqual([prospect.id for prospect in last], expected[-5:])
+                self.assertFalse(last.has_next())
+                backwards = self.walk(paginator, paginator.get_page().last_cursor, lambda page: page.previous_cursor)
+                self.assertEqual(sum(reversed(backwards), []), expected)
+
+                second = paginator.get_page(paginator.get_page().next_cursor)
+                first = paginator.get_page(second.previous_cursor)
+                self.assertEqual([prospect.id for prospect in first], expected[:5])
+                self.assertFalse(first.has_previous())
+
+    def test_each_page_is_one_query(self):
+        paginator = self.paginator()
+        cursor = paginator.get_page().next_cursor
+        cursor = paginator.get_page(cursor).next_cursor
+        with self.assertNumQueries(1):
+            paginator.get_page(cursor)
+
+    def test_bad_cursors_give_the_first_page(self):
+        paginator = self.paginator()
+        first = [prospect.id for prospect in paginator.get_page()]
+        cursor = paginator.get_page().next_cursor
+
+        tampered = cursor[:-3] + ('aaa' if not cursor.endswith('aaa') else 'bbb')
+        foreign = self.paginator(salt='elsewhere').get_page().next_cursor
+        for bad in (tampered, foreign, 'not-a-cursor'):
+            with self.subTest(cursor=bad):
+                self.assertEqual([prospect.id for prospect in paginator.get_page(bad)], first)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class DisciplerListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=50)
+        build_organisation(name='Other')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.data['staff'])
+
+    def test_counts_come_from_the_listing_query(self):
+        discipler = DisciplerProfile.objects.get(user__organisation=self.data['organisation'])
+        discipler.trainings_completed.set(Training.objects.filter(organisations=self.data['organisation']))
+
+        response = self.client.get('/organisation/disciplers/')
+        row = response.context['disciplers'][0]
+        self.assertEqual(row.prospect_count, 25)
+        self.assertEqual(row.training_count, 2)
+        self.assertEqual(response.context['unassigned_count'], 25)
+        self.assertEqual(response.context['trained_count'], 1)
+
+    def test_unassigned_prospects_are_paged_by_name(self):
+        seen = []
+        cursor = None
+        while True:
+            data = self.client.get('/organisation/api/unassigned-prospects/', {'cursor': cursor or ''}).json()
+            seen.extend(prospect['name'] for prospect in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = Prospect.objects.filter(
+            organisation=self.data['organisation'], discipler__isnull=True
+        ).order_by('name', 'id').values_list('name', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_unassigned_prospects_match_name_or_email_prefix(self):
+        names = [p['name'] for p in self.client.get('/organisation/api/unassigned-prospects/', {'q': 'prospect 4'}).json()['results']]
+        self.assertEqual(names, ['Prospect 4', 'Prospect 40', 'Prospect 42', 'Prospect 44', 'Prospect 46', 'Prospect 48'])
+
+        emails = [p['email'] for p in self.client.get('/organisation/api/unassigned-prospects/', {'q': 'PROSPECT10@'}).json()['results']]
+        self.assertEqual(emails, ['prospect10@certeza.example.com'])
+
+        # Prospects with a discipler, and other organisations' prospects, are never offered
+        self.assertEqual(self.client.get('/organisation/api/unassigned-prospects/', {'q': 'prospect1@'}).json()['results'], [])
+        self.assertEqual(self.client.get('/organisation/api/unassigned-prospects/', {'q': 'prospect0@other'}).json()['results'], [])
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class AutoAssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # One discipler already carries the 15 odd-numbered prospects; 15 are unassigned
+        cls.data = build_organisation(prospects=30)
+        cls.other = build_organisation(name='Other')
+        organisation = cls.data['organisation']
+        for n in range(2):
+            user = User.objects.create_user(f'extra-discipler-{n}')
+            DisciplerProfile.objects.create(
+                user=AppUser.objects.create(organisation=organisation, user=user, role='discipler')
+            )
+
+    def loads(self, organisation):
+        return sorted(DisciplerProfile.objects.filter(
+            user__organisation=organisation
+        ).annotate(load=Count('prospects')).values_list('load', flat=True))
+
+    def test_fills_the_least_loaded_first(self):
+        summary = auto_assign(self.data['organisation'])
+
+        self.assertEqual(summary['assigned'], 15)
+        self.assertEqual(summary['left_unassigned'], 0)
+        self.assertEqual(self.loads(self.data['organisation']), [7, 8, 15])
+        # Other organisations are untouched
+        self.assertEqual(Prospect.objects.filter(organisation=self.other['organisation'], discipler__isnull=True).count(), 10)
+
+    def test_respects_the_configured_ratio(self):
+        self.addCleanup(config.store.clear)
+        Configs.objects.create(config_key='discipler_prospect_ratio', config_value='5')
+
+        summary = auto_assign(self.data['organisation'])
+
+        self.assertEqual(summary['capacity'], 5)
+        self.assertEqual(summary['assigned'], 10)
+        self.assertEqual(summary['left_unassigned'], 5)
+        self.assertEqual(self.loads(self.data['organisation']), [5, 5, 15])
+
+    def test_fractional_ratios_round_up(self):
+        self.addCleanup(config.store.clear)
+        ratio = Configs.objects.create(config_key='discipler_prospect_ratio', config_value='0.5')
+
+        summary = auto_assign(self.data['organisation'], dry_run=True)
+        self.assertEqual((summary['capacity'], summary['assigned']), (1, 2))
+
+        ratio.config_value = '2.2'
+        ratio.save()
+        summary = auto_assign(self.data['organisation'])
+        self.assertEqual((summary['capacity'], summary['assigned'], summary['left_unassigned']), (3, 6, 9))
+        self.assertEqual(self.loads(self.data['organisation']), [3, 3, 15])
+
+    def test_dry_run_writes_nothing(self):
+        # Loads and unassigned prospects, inside a savepoint
+        with self.assertNumQueries(4):
+            summary = auto_assign(self.data['organisation'], capacity=6, dry_run=True)
+
+        self.assertEqual(summary['assigned'], 12)
+        self.assertEqual(Prospect.objects.filter(organisation=self.data['organisation'], discipler__isnull=True).count(), 15)
+
+    def test_endpoint_assigns_in_the_request_organisation(self):
+        self.client.force_login(self.data['staff'])
+
+        preview = self.client.post('/organisation/api/auto-assign-prospects/', {'dry_run': '1'}).json()
+        self.assertEqual((preview['success'], preview['assigned']), (True, 15))
+        result = self.client.post('/organisation/api/auto-assign-prospects/').json()
+        self.assertEqual(result['assigned'], 15)
+        self.assertFalse(Prospect.objects.filter(organisation=self.data['organisation'], discipler__isnull=True).exists())
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class BatchAssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=6)
+        cls.other = build_organisation(name='Other', prospects=2)
+        cls.discipler = DisciplerProfile.objects.get(user__organisation=cls.data['organisation'])
+        cls.other_discipler = DisciplerProfile.objects.get(user__organisation=cls.other['organisation'])
+        cls.prospects = list(Prospect.objects.filter(organisation=cls.data['organisation']).order_by('id'))
+
+    def setUp(self):
+        self.client.force_login(self.data['staff'])
+
+    def post_batch(self, assignments):
+        return self.client.post('/organisation/api/assign-prospects/', json.dumps({'assignments': assignments}),
+                                content_type='application/json').json()
+
+    def test_reports_each_assignment(self):
+        unassigned, assigned = self.prospects[0], self.prospects[1]
+        other_prospect = Prospect.objects.filter(organisation=self.other['organisation']).first()
+
+        # Session, user and tenant; then, in a savepoint, one lookup per model and one UPDATE per target
+        with self.assertNumQueries(9):
+            response = self.post_batch([
+                {'prospect_id': unassigned.id, 'discipler_id': self.discipler.id},
+                {'prospect_id': assigned.id, 'discipler_id': self.discipler.id},
+                {'prospect_id': self.prospects[3].id, 'discipler_id': None},
+                {'prospect_id': other_prospect.id, 'discipler_id': self.discipler.id},
+                {'prospect_id': self.prospects[2].id, 'discipler_id': self.other_discipler.id},
+                {'prospect_id': unassigned.id, 'discipler_id': self.discipler.id},
+                {'prospect_id': 'x', 'discipler_id': self.discipler.id},
+            ])
+
+        self.assertEqual([(r['success'], r['message']) for r in response['results']], [
+            (True, 'Prospect 0 assigned to Dan Iel'),
+            (True, 'Prospect 1 is already assigned to Dan Iel'),
+            (True, 'Prospect 3 unassigned'),
+            (False, 'Prospect not found'),
+            (False, 'Discipler not found'),
+            (False, 'Prospect listed more than once'),
+            (False, 'Invalid id'),
+        ])
+        self.assertEqual((response['changed'], response['failed']), (2, 4))
+        self.assertEqual(Prospect.objects.get(pk=unassigned.pk).discipler_id, self.discipler.id)
+        self.assertIsNone(Prospect.objects.get(pk=self.prospects[3].pk).discipler_id)
+        self.assertIsNone(Prospect.objects.get(pk=self.prospects[2].pk).discipler_id)
+        self.assertIsNone(Prospect.objects.get(pk=other_prospect.pk).discipler_id)
+
+    def test_single_assignment_is_scoped_to_the_organisation(self):
+        other_prospect = Prospect.objects.filter(organisation=self.other['organisation'], discipler__isnull=True).first()
+
+        response = self.client.post('/organisation/api/assign-prospect/', {
+            'prospect_id': other_prospect.id, 'discipler_id': self.discipler.id,
+        }).json()
+        self.assertEqual(response, {'success': False, 'message': 'Prospect not found'})
+
+        response = self.client.post('/organisation/api/assign-prospect-to-discipler/', {
+            'prospect_id': self.prospects[4].id, 'discipler_id': self.discipler.id,
+        }).json()
+        self.assertEqual(response, {'success': True, 'message': 'Prospect 4 assigned to Dan Iel'})
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=2)
+        cls.other = build_organisation(name='Other', prospects=1)
+        cls.organisation = cls.data['organisation']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'prospects.jsonl')
+
+    def write(self, rows):
+        with open(self.path, 'w') as source:
+            for row in rows:
+                source.write(json.dumps(row) + '\n')
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_prospects', self.path, '--organisation', str(self.organisation.id),
+                     '--questionnaire', str(self.data['questionnaire'].id), *args, stdout=out)
+        return out.getvalue()
+
+    def new_rows(self, count):
+        return [{'name': f'Imported {i}', 'email': f'imported{i}@example.com', 'prospect_form_id': f'IMPORT{i}',
+                 'answers': {'Your name?': f'Imported {i}'}} for i in range(count)]
+
+    def test_rows_are_written_in_chunks(self):
+        self.write(self.new_rows(5))
+        output = self.run_import('--chunk-size', '2')
+
+        self.assertIn('5 rows: 5 prospects created, 0 updated, 5 answers', output)
+        self.assertEqual(sum(line.endswith('rows/s)') for line in output.splitlines()), 3)
+        self.assertEqual(Prospect.objects.filter(email__startswith='imported').count(), 5)
+        self.assertEqual(Responses.objects.filter(prospect_form_id__startswith='IMPORT').count(), 5)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+    def test_a_chunk_costs_the_same_queries_whatever_its_size(self):
+        importer = Importer(organisation=self.organisation.id, questionnaire=self.data['questionnaire'].id)
+        rows = self.new_rows(12)
+        with CaptureQueriesContext(connection) as small:
+            importer.import_chunk(rows[:2])
+        with CaptureQueriesContext(connection) as large:
+            importer.import_chunk(rows[2:])
+        self.assertEqual(len(large), len(small))
+
+    def test_prospects_are_matched_within_their_organisation(self):
+        mine = Prospect.objects.filter(organisation=self.organisation).order_by('id').first()
+        theirs = Prospect.objects.get(organisation=self.other['organisation'])
+        self.write([
+            {'name': 'Renamed', 'email': mine.email},
+            {'name': 'Taken', 'email': theirs.email},
+            {'name': 'Moved', 'email': mine.email, 'organisation': 'Other'},
+        ])
+        output = self.run_import()
+
+        self.assertIn('0 prospects created, 1 updated, 0 answers, 2 skipped', output)
+        self.assertEqual(Prospect.objects.get(pk=mine.pk).name, 'Renamed')
+        theirs_now = Prospect.objects.get(pk=theirs.pk)
+        self.assertEqual((theirs_now.name, theirs_now.organisation_id), (theirs.name, self.other['organisation'].id))
+        self.assertEqual(Prospect.objects.get(pk=mine.pk).organisation_id, self.organisation.id)
+
+    def test_resume_continues_from_the_checkpoint(self):
+        self.write(self.new_rows(5))
+        import_chunk = Importer.import_chunk
+
+        def fail_second_chunk(importer, rows):
+            if rows[0]['email'] == 'imported2@example.com':
+                raise ValueError('disk full')
+            return import_chunk(importer, rows)
+
+        with mock.patch.object(Importer, 'import_chunk', fail_second_chunk):
+            with self.assertRaisesMessage(CommandError, 'Import stopped at row 3: disk full'):
+                self.run_import('--chunk-size', '2')
+        with open(self.path + '.checkpoint') as checkpoint:
+            self.assertEqual(json.load(checkpoint), {'rows': 2})
+        self.assertEqual(Prospect.objects.filter(email__startswith='imported').count(), 2)
+
+        # Rows 1 and 2 were committed; were they read again they would count as updates
+        output = self.run_import('--chunk-size', '2', '--resume')
+        self.assertIn('Resuming after row 2.', output)
+        self.assertIn('5 rows: 3 prospects created, 0 updated', output)
+        self.assertEqual(Prospect.objects.filter(email__startswith='imported').count(), 5)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class QueryProfileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=3)
+
+    def setUp(self):
+        self.client.force_login(self.data['staff'])
+        cache.clear()
+
+    @override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0})
+    def test_sampled_requests_report_their_queries_and_templates(self):
+        render = Template.render
+        timed = middleware._timed_template_render
+        wrapped = []
+
+        def spy(template, *args, **kwargs):
+            wrapped.append(template)
+            return timed(template, *args, **kwargs)
+
+        with mock.patch.object(middleware, '_timed_template_render', spy):
+            with self.assertLogs('organisation.middleware', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/organisation/home/')
+
+        # Every query is counted, the session and tenant lookups of the middleware below included
+        self.assertRegex(response['Server-Timing'],
+                         rf'^db;dur=[\d.]+;desc="{len(queries)} queries", tpl;dur=[\d.]+, dup;desc="\d+ duplicated", '
+                         r'total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['event'], record['view'], record['status']),
+                         ('request_profile', 'organisation:home', 200))
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreater(record['template_ms'], 0)
+        # Template.render is only wrapped while the request is profiled
+        self.assertEqual(len(wrapped), 1)
+        self.assertIs(Template.render, render)
+
+    def test_unsampled_requests_pass_through(self):
+        render = Template.render
+        with self.assertNoLogs('organisation.middleware'):
+            response = self.client.get('/organisation/home/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertIs(Template.render, render)
+
+    def test_queries_differing_only_in_literals_are_duplicates(self):
+        self.assertEqual(
+            middleware.fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'it''s' AND tag IN (1, 2, 3)"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND tag IN (?)',
+        )
+        self.assertEqual(middleware.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+                         'SELECT * FROM t WHERE id IN (?)')
+
+        profile = middleware.RequestProfile()
+        for sql in ['SELECT * FROM t WHERE id = 1', 'SELECT * FROM t WHERE id = 2', 'SELECT * FROM t WHERE id = 3',
+                    'SELECT * FROM u WHERE id = 1', 'SELECT * FROM u WHERE id = 2']:
+            profile.record_query(lambda *args: None, sql, (), False, {})
+
+        self.assertEqual(profile.queries, 5)
+        self.assertEqual(profile.duplicates(3), [('SELECT * FROM t WHERE id = ?', 3)])
+        self.assertEqual(profile.duplicates(2), [
+            ('SELECT * FROM t WHERE id = ?', 3), ('SELECT * FROM u WHERE id = ?', 2),
+        ])
+
+
+class ConfigStoreTests(TestCase):
+    def setUp(self):
+        self.addCleanup(config.store.clear)
+        config.store.clear()
+
+    def test_reads_come_from_one_snapshot(self):
+        Configs.objects.create(config_key='discipler_prospect_ratio', config_value=' 12.5 ')
+        Configs.objects.create(config_key='unknown', config_value='ignored')
+
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertEqual(config.get('discipler_prospect_ratio'), 12.5)
+                self.assertTrue(config.is_set('discipler_prospect_ratio'))
+        with self.assertRaises(KeyError):
+            config.get('unknown')
+
+    def test_falls_back_to_the_default(self):
+        self.assertEqual(config.get('discipler_prospect_ratio'), 1.0)
+        self.assertFalse(config.is_set('discipler_prospect_ratio'))
+
+        with self.assertLogs('organisation.config', 'WARNING'):
+            Configs.objects.create(config_key='discipler_prospect_ratio', config_value='-3')
+            self.assertEqual(config.get('discipler_prospect_ratio'), 1.0)
+
+    def test_saving_or_deleting_a_row_refreshes_the_snapshot(self):
+        ratio = Configs.objects.create(config_key='discipler_prospect_ratio', config_value='4')
+        self.assertEqual(config.get('discipler_prospect_ratio'), 4.0)
+
+        ratio.config_value = '6'
+        ratio.save()
+        self.assertEqual(config.get('discipler_prospect_ratio'), 6.0)
+
+        ratio.delete()
+        self.assertEqual(config.get('discipler_prospect_ratio'), 1.0)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class TimeSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organisation = Organisation.objects.create(name='Kampala', email='kampala@example.com',
+                                                       timezone='Africa/Kampala')
+        cls.now = datetime(2026, 3, 18, 12, 0, tzinfo=dt_timezone.utc)
+        # 22:30 UTC is already the next day in Kampala (UTC+3)
+        for moment in ['2026-03-18T08:00', '2026-03-16T22:30', '2026-03-16T20:30', '2026-03-01T09:00', '2025-03-19T09:00']:
+            prospect = Prospect.objects.create(
+                name=moment, email=f'{moment}@example.com', prospect_form_id=moment, organisation=cls.organisation,
+            )
+            Prospect.objects.filter(pk=prospect.pk).update(
+                created_at=datetime.fromisoformat(moment).replace(tzinfo=dt_timezone.utc)
+            )
+        cls.tz = timeseries.organisation_timezone(cls.organisation)
+        cls.prospects = Prospect.objects.filter(organisation=cls.organisation)
+
+    def test_days_follow_the_organisation_timezone(self):
+        with self.assertNumQueries(1):
+            points = timeseries.series(self.prospects, 'created_at', self.tz, 7, 'day', now=self.now)
+
+        self.assertEqual([moment.date().isoformat() for moment, _ in points][-3:], ['2026-03-16', '2026-03-17', '2026-03-18'])
+        self.assertEqual([count for _, count in points], [0, 0, 0, 0, 1, 1, 1])
+        self.assertEqual(points[0][0].utcoffset(), timedelta(hours=3))
+
+    def test_a_year_costs_one_query(self):
+        with self.assertNumQueries(1):
+            points = timeseries.series(self.prospects, 'created_at', self.tz, 365, 'month', now=self.now)
+
+        self.assertEqual(len(points), 13)
+        self.assertEqual(points[0], (datetime(2025, 3, 1, tzinfo=self.tz), 1))
+        self.assertEqual(points[-1], (datetime(2026, 3, 1, tzinfo=self.tz), 4))
+
+        weeks = timeseries.series(self.prospects, 'created_at', self.tz, 30, 'week', now=self.now)
+        self.assertEqual(weeks[-1], (datetime(2026, 3, 16, tzinfo=self.tz), 3))
+        self.assertTrue(all(moment.weekday() == 0 for moment, _ in weeks))
+
+    def test_hourly_buckets_are_limited(self):
+        self.assertEqual(timeseries.bucket_choices(7), ['hour', 'day', 'week', 'month'])
+        self.assertEqual(timeseries.bucket_choices(90), ['day', 'week', 'month'])
+        with self.assertRaises(ValueError):
+            timeseries.series(self.prospects, 'created_at', self.tz, 90, 'hour', now=self.now)
+
+        points = timeseries.series(self.prospects, 'created_at', self.tz, 7, 'hour', now=self.now)
+        self.assertEqual(len(points), 7 * 24)
+        self.assertEqual(sum(count for _, count in points), 3)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class DashboardMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=3, trainings=1)
+        cls.organisation = cls.data['organisation']
+
+    def grow(self):
+        """Many times the prospects, assignments, disciplers, trainings and questionnaires"""
+        statuses = ['not_started', 'in_progress', 'stalled', 'completed']
+        path = DiscipleshipPaths.objects.create(name='Growth')
+        for i in range(40):
+            prospect = Prospect.objects.create(name=f'Grown {i}', email=f'grown{i}@example.com',
+                                               prospect_form_id=f'GROWN{i}', organisation=self.organisation)
+            DiscipleshipPathsAssignment.objects.create(prospect=prospect, discipleship_path=path,
+                                                       completion_status=statuses[i % 4])
+        for i in range(5):
+            discipler = User.objects.create_user(f'grown-discipler-{i}')
+            DisciplerProfile.objects.create(
+                user=AppUser.objects.create(organisation=self.organisation, user=discipler, role='discipler')
+            )
+            training = Training.objects.create(name=f'Grown training {i}')
+            training.organisations.add(self.organisation)
+            trainee = User.objects.create_user(f'grown-trainee-{i}')
+            TraineeProfile.objects.create(
+                user=AppUser.objects.create(organisation=self.organisation, user=trainee, role='trainee'),
+                enrolled_training=training, status='completed',
+            )
+            questionnaire = Questionnaire.objects.create(name=f'Grown survey {i}', title='Survey')
+            ActiveQuestionnaire.objects.create(organisation=self.organisation, questionnaire=questionnaire)
+
+    def measure(self):
+        config.store.clear()
+        # Prospects, disciplers, the config store, the rollup, trainings (2), cohorts and questionnaires (2)
+        with self.assertNumQueries(9):
+            return dashboard_metrics(self.organisation)
+
+    def test_query_count_does_not_grow_with_the_data(self):
+        before = self.measure()
+        self.grow()
+        after = self.measure()
+
+        self.assertEqual((before['ratio_data']['total_prospects'], after['ratio_data']['total_prospects']), (3, 43))
+        self.assertEqual((before['total_questionnaires'], after['total_questionnaires']), (1, 6))
+        self.assertEqual((len(before['training_data']), len(after['training_data'])), (1, 6))
+        self.assertEqual(after['discipleship_data']['completed'], 10)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class TrainingMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(trainings=0)
+        cls.other = build_organisation(name='Other', trainings=0)
+        cls.organisation = cls.data['organisation']
+        cls.trainings = []
+        for t in range(3):
+            training = Training.objects.create(name=f'Course {t}')
+            training.organisations.add(cls.organisation, cls.other['organisation'])
+            cls.trainings.append(training)
+
+        def enrol(organisation, training, status, n, enrolled_at):
+            for _ in range(n):
+                user = User.objects.create_user(f'trainee-{User.objects.count()}')
+                trainee = TraineeProfile.objects.create(
+                    user=AppUser.objects.create(organisation=organisation, user=user, role='trainee'),
+                    enrolled_training=training, status=status,
+                )
+                TraineeProfile.objects.filter(pk=trainee.pk).update(created_at=enrolled_at)
+
+        now = timezone.now()
+        enrol(cls.organisation, cls.trainings[0], 'completed', 3, now)
+        enrol(cls.organisation, cls.trainings[0], 'stalled', 1, now)
+        enrol(cls.organisation, cls.trainings[1], 'dropped', 2, now - timedelta(days=62))
+        enrol(cls.organisation, cls.trainings[1], 'completed', 2, now - timedelta(days=62))
+        # The same trainings taken in another organisation must not count here
+        enrol(cls.other['organisation'], cls.trainings[0], 'in_progress', 5, now)
+
+    def test_breakdown_per_training_in_two_queries(self):
+        with self.assertNumQueries(2):
+            training_data = training_metrics(self.organisation)
+
+        self.assertEqual([t['name'] for t in training_data], ['Course 0', 'Course 1', 'Course 2'])
+        first, second, third = training_data
+        self.assertEqual(first['statuses'], {'enrolled': 0, 'in_progress': 0, 'stalled': 1, 'completed': 3, 'dropped': 0})
+        self.assertEqual((first['total_trainees'], first['completion_rate']), (4, 75.0))
+        self.assertEqual((second['total_trainees'], second['completed'], second['statuses']['dropped']), (4, 2, 2))
+        self.assertEqual((third['total_trainees'], third['completion_rate']), (0, 0))
+
+    def test_cohorts_by_enrollment_month(self):
+        with self.assertNumQueries(1):
+            cohorts = training_cohorts(self.organisation)
+
+        self.assertEqual([(c['total'], c['completed'], c['dropped'], c['completion_rate']) for c in cohorts],
+                         [(4, 3, 0, 75.0), (4, 2, 2, 50.0)])
+        self.assertGreater(cohorts[0]['month'], cohorts[1]['month'])
+        self.assertEqual(cohorts[0]['month'].day, 1)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class AsyncViewTests(TransactionTestCase):
+    """The async pages outside a transaction, where their queries really do run in the metrics pool"""
+
+    def setUp(self):
+        self.tenant = build_organisation()
+        self.async_client.force_login(self.tenant['staff'])
+        self.threads = set()
+
+        def run(call):
+            self.threads.add(threading.current_thread().name)
+            return pooled(call)
+
+        pooled = concurrency._run
+        patcher = mock.patch.object(concurrency, '_run', run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    async def test_dashboard_matches_the_sync_figures(self):
+        response = await self.async_client.get('/organisation/dashboard/', {'trend_days': 30})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.threads)
+        self.assertTrue(all(name.startswith('certeza-metrics') for name in self.threads))
+        organisation = self.tenant['organisation']
+        expected = await sync_to_async(dashboard_metrics)(organisation)
+        for key, value in expected.items():
+            self.assertEqual(response.context[key], value, key)
+        trends = await sync_to_async(timeseries.organisation_trends)(organisation, 30)
+        self.assertEqual(json.loads(response.context['trends']), trends)
+
+    async def test_home_counts_what_is_new_since_the_last_visit(self):
+        response = await self.async_client.get('/organisation/home/')
+        self.assertEqual((response.context['total_prospects'], response.context['total_responses']), (20, 20))
+        self.assertEqual(len(response.context['due_followups']), 20)
+        self.assertEqual(response.context['due_followup_count'], 20)
+
+        await Prospect.objects.acreate(name='Newcomer', email='new@example.com', prospect_form_id='NEW000001',
+                                       organisation=self.tenant['organisation'])
+        response = await self.async_client.get('/organisation/home/')
+        self.assertEqual((response.context['new_prospects'], response.context['total_prospects']), (1, 21))
+
+    def test_due_followups_are_listed_longest_overdue_first_up_to_the_limit(self):
+        organisation, now = self.tenant['organisation'], timezone.now()
+        listed = due_followups(organisation, now, limit=5)
+
+        self.assertEqual(len(listed), 5)
+        self.assertEqual(due_followup_count(organisation, now), 20)
+        # Four follow-ups each fell due 4, 3, 2, 1 and 0 days ago
+        self.assertEqual([(now - followup.follow_up_date).days for followup in listed], [4, 4, 4, 4, 3])
+
+    def test_calls_in_a_transaction_use_its_connection(self):
+        with transaction.atomic():
+            Prospect.objects.filter(organisation=self.tenant['organisation']).delete()
+            counts = async_to_sync(concurrency.gather)(Prospect.objects.count, DisciplerProfile.objects.count)
+
+        self.assertEqual(counts, [0, 1])
+        self.assertFalse(self.threads)
+
+    def test_pool_threads_keep_their_connections_between_calls(self):
+        # Every pool thread takes one of the calls
+        everyone = threading.Barrier(concurrency.METRICS_CONCURRENCY, timeout=5)
+
+        def raw_connection():
+            everyone.wait()
+            connection.ensure_connection()
+            return threading.current_thread().name, connection.connection
+
+        calls = [raw_connection] * concurrency.METRICS_CONCURRENCY
+        # The in-memory test database ignores close(), so watch for the call instead
+        with mock.patch.object(type(connections['default']), 'close', autospec=True) as close:
+            first = dict(async_to_sync(concurrency.gather)(*calls))
+            second = dict(async_to_sync(concurrency.gather)(*calls))
+
+        self.assertEqual(len(first), concurrency.METRICS_CONCURRENCY)
+        self.assertEqual(second, first)
+        close.assert_not_called()
+
+    def test_shutdown_closes_every_pool_thread_connection(self):
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='certeza-metrics-test')
+        everyone = threading.Barrier(2, timeout=5)
+
+        def pooled_connection():
+            everyone.wait()
+            Prospect.objects.count()
+            return connections['default']
+
+        with mock.patch.object(concurrency, '_executor', executor), \
+                mock.patch.object(concurrency, '_pool_connections', []):
+            opened = async_to_sync(concurrency.gather)(pooled_connection, pooled_connection)
+            with mock.patch.object(type(connections['default']), 'close', autospec=True) as close:
+                concurrency.shutdown()
+
+        self.assertEqual({call.args[0] for call in close.call_args_list}, set(opened))
+        self.assertEqual(len(set(opened)), 2)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+
+# ===== Benchmarks =====
+# Each view is timed and its queries counted against a tenant of each size,
+# and compared with the budgets checked in at BENCHMARK_BUDGETS. Only the
+# small tier runs by default, and only query counts are checked, as wall
+# times vary too much from run to run and machine to machine. Set
+# CERTEZA_BENCHMARK_TIERS=small,medium,large for the rest,
+# CERTEZA_BENCHMARK_TIMING=1 to check wall times as well (with
+# CERTEZA_BENCHMARK_TIME_FACTOR to allow a slower machine more time), and
+# CERTEZA_BENCHMARK_RECORD=1 to write the measurements back as the new
+# budgets.
+BENCHMARK_BUDGETS = settings.BASE_DIR / 'benchmark_budgets.json'
+BENCHMARK_TIERS = {
+    'small': {'prospects': 50, 'submissions': 50, 'disciplers': 5, 'trainees': 5,
+              'followups': 50, 'log_events': 200},
+    'medium': {'prospects': 2000, 'submissions': 1000, 'disciplers': 30, 'trainees': 30,
+               'followups': 1000, 'log_events': 5000},
+    'large': {'prospects': 20000, 'submissions': 10000, 'disciplers': 100, 'trainees': 100,
+              'followups': 10000, 'log_events': 50000},
+}
+# Recorded budgets leave this much room over the measured wall time
+BENCHMARK_TIME_HEADROOM = 3
+
+
+def benchmark_tiers():
+    tiers = os.environ.get('CERTEZA_BENCHMARK_TIERS', 'small').split(',')
+    return [tier.strip() for tier in tiers if tier.strip() in BENCHMARK_TIERS]
+
+
+def load_budgets():
+    if not BENCHMARK_BUDGETS.exists():
+        return {}
+    with open(BENCHMARK_BUDGETS) as budgets:
+        return json.load(budgets)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class BenchmarkTestCase(TestCase):
+    """Base for view benchmarks: builds one sample tenant per enabled tier"""
+
+    runs = 3
+    recorded = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = {}
+        for tier in benchmark_tiers():
+            prefix = f'bench{tier}'
+            SampleDataGenerator(prefix=prefix, **BENCHMARK_TIERS[tier]).generate()
+            organisation = Organisation.objects.get(email=f'{prefix}-org-1@example.com')
+            cls.tenants[tier] = {
+                'organisation': organisation,
+                'staff': User.objects.get(username=f'{prefix}-{organisation.id}-admin-0'),
+                'active_questionnaire': ActiveQuestionnaire.objects.filter(
+                    organisation=organisation
+                ).select_related('questionnaire').order_by('pk').first(),
+            }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get('CERTEZA_BENCHMARK_RECORD') and cls.recorded:
+            budgets = load_budgets()
+            for tier, views in cls.recorded.items():
+                budgets.setdefault(tier, {}).update(views)
+            with open(BENCHMARK_BUDGETS, 'w') as output:
+                json.dump(budgets, output, indent=2, sort_keys=True)
+                output.write('\n')
+            cls.recorded = {}
+
+    def measure(self, method, url, data=None, warm=False):
+        """Median wall time in ms and the query count of a request, over several runs.
+
+        data may be a function of the run number, for requests that must differ
+        each time. Runs start with an empty cache unless warm is set, in which
+        case one unmeasured request fills it first.
+        """
+        def request(run):
+            payload = data(run) if callable(data) else data
+            return getattr(self.client, method)(url, payload or {})
+
+        if warm:
+            request(-1)
+
+        timings, query_counts = [], []
+        for run in range(self.runs):
+            if not warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request(run)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, 200, url)
+            query_counts.append(len(queries.captured_queries))
+        return statistics.median(timings), max(query_counts)
+
+    def assertWithinBudget(self, name, method, url, data=None, warm=False, anonymous=False):
+        """Benchmark a view in every enabled tier and fail if it is over budget.
+
+        url and data may be functions of the tier's tenant (data also of the run).
+        Requests are made as the tenant's staff user unless anonymous is set.
+        """
+        budgets = load_budgets()
+        timed = bool(os.environ.get('CERTEZA_BENCHMARK_TIMING'))
+        factor = float(os.environ.get('CERTEZA_BENCHMARK_TIME_FACTOR', 1))
+        for tier, tenant in self.tenants.items():
+            with self.subTest(tier=tier, view=name):
+                if anonymous:
+                    self.client.logout()
+                else:
+                    self.client.force_login(tenant['staff'])
+                resolved = url(tenant) if callable(url) else url
+                payload = (lambda run: data(tenant, run)) if callable(data) else data
+                elapsed, queries = self.measure(method, resolved, payload, warm)
+
+                if os.environ.get('CERTEZA_BENCHMARK_RECORD'):
+                    type(self).recorded.setdefault(tier, {})[name] = {
+                        'queries': queries,
+                        'ms': round(max(elapsed * BENCHMARK_TIME_HEADROOM, 20)),
+                    }
+                    continue
+
+                budget = budgets.get(tier, {}).get(name)
+                if budget is None:
+                    self.fail(f'No {tier} budget for {name}; record one with CERTEZA_BENCHMARK_RECORD=1.')
+                self.assertLessEqual(queries, budget['queries'],
+                                     f'{name} ran {queries} queries on the {tier} tenant, budget {budget["queries"]}')
+                if timed:
+                    self.assertLessEqual(elapsed, budget['ms'] * factor,
+                                         f'{name} took {elapsed:.0f}ms on the {tier} tenant, budget {budget["ms"]}ms')
+
+
+class ViewBenchmarks(BenchmarkTestCase):
+    """Staff pages, timed from a cold cache"""
+
+    def test_home(self):
+        self.assertWithinBudget('home', 'get', '/organisation/home/')
+
+    def test_dashboard(self):
+        self.assertWithinBudget('dashboard', 'get', '/organisation/dashboard/')
+
+    def test_prospects(self):
+        for tab in ('all', 'assigned', 'unassigned'):
+            self.assertWithinBudget(f'prospects_{tab}', 'get', '/organisation/prospects/', {'tab': tab})
+        self.assertWithinBudget('prospects_search', 'get', '/organisation/prospects/', {'search': 'Grace'})
+
+    def test_disciplers(self):
+        self.assertWithinBudget('disciplers', 'get', '/organisation/disciplers/')
+        self.assertWithinBudget('unassigned_prospects', 'get', '/organisation/api/unassigned-prospects/', {'q': 'G'})
+
+    def test_survey_responses(self):
+        self.assertWithinBudget('survey_responses', 'get', '/organisation/survey-responses/')
+        self.assertWithinBudget('survey_responses_search', 'get', '/organisation/survey-responses/',
+                                {'search': 'Option B'})
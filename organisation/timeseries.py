@@ -0,0 +1,155 @@
+import zoneinfo
+from datetime import timedelta
+from functools import partial
+
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import concurrency
+from .models import DiscipleshipFollowUp, DiscipleshipPathsAssignment, Prospect
+from prospect.models import Responses
+
+WINDOWS = (7, 30, 90, 365)
+BUCKETS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+# Hourly buckets over a quarter would be thousands of points nobody can read
+MAX_BUCKETS = 1000
+POINTS_PER_DAY = {'hour': 24, 'day': 1, 'week': 1 / 7, 'month': 1 / 28}
+
+LABEL_FORMATS = {
+    'hour': '%d %b %H:00',
+    'day': '%a %d %b',
+    'week': 'w/c %d %b',
+    'month': '%b %Y',
+}
+
+
+def bucket_choices(days):
+    """The bucket sizes that keep a window of `days` days within MAX_BUCKETS points"""
+    return [bucket for bucket in BUCKETS if days * POINTS_PER_DAY[bucket] <= MAX_BUCKETS]
+
+
+def organisation_timezone(organisation):
+    try:
+        return zoneinfo.ZoneInfo(organisation.timezone)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return timezone.get_default_timezone()
+
+
+def truncate(moment, bucket, tz):
+    """Start of the bucket holding an aware datetime, in the given timezone"""
+    local = moment.astimezone(tz).replace(minute=0, second=0, microsecond=0, fold=0)
+    if bucket == 'hour':
+        return local
+    local = local.replace(hour=0)
+    if bucket == 'week':
+        local -= timedelta(days=local.weekday())
+    elif bucket == 'month':
+        local = local.replace(day=1)
+    return local
+
+
+def _next_bucket(start, bucket, tz):
+    # Aware arithmetic moves the wall clock, so days, weeks and months keep to local midnight across DST
+    if bucket == 'hour':
+        # Absolute steps instead, so a DST change neither skips nor repeats an hour
+        return (start.astimezone(timezone.utc) + timedelta(hours=1)).astimezone(tz)
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def window(days, tz, now=None):
+    """(start, end) of the last `days` local days, today included"""
+    today = truncate(now or timezone.now(), 'day', tz)
+    return today - timedelta(days=days - 1), today + timedelta(days=1)
+
+
+def bucket_starts(start, end, bucket, tz):
+    starts = []
+    moment = truncate(start, bucket, tz)
+    while moment < end:
+        starts.append(moment)
+        moment = _next_bucket(moment, bucket, tz)
+    return starts
+
+
+def series(queryset, field, tz, days=7, bucket='day', now=None):
+    """Rows of a queryset per bucket of a datetime field, over the last `days` days.
+
+    One grouped query whatever the window; buckets with no rows are filled
+    with zero. Buckets follow the calendar of the given timezone, so the
+    first one may start before the window does and only counts from there.
+    Returns a list of (bucket start, count) pairs, oldest first.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'Unknown bucket {bucket!r}')
+    start, end = window(days, tz, now)
+    starts = bucket_starts(start, end, bucket, tz)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f'{days} days in {bucket} buckets is more than {MAX_BUCKETS} points')
+
+    rows = queryset.filter(**{
+        f'{field}__gte': start, f'{field}__lt': end,
+    }).values(bucket_start=BUCKETS[bucket](field, tzinfo=tz)).annotate(count=Count('pk')).order_by()
+    counts = {row['bucket_start']: row['count'] for row in rows}
+
+    return [(moment, counts.get(moment, 0)) for moment in starts]
+
+
+def chart_data(points, bucket):
+    """Labels and counts for a line chart"""
+    return {
+        'labels': [moment.strftime(LABEL_FORMATS[bucket]) for moment, _ in points],
+        'counts': [count for _, count in points],
+    }
+
+
+def trend_calls(organisation, days, bucket, now):
+    """Names of the trends and a series() call for each"""
+    tz = organisation_timezone(organisation)
+    sources = {
+        'responses': (Responses.objects.filter(
+            question__questionnaire__activequestionnaire__organisation=organisation
+        ), 'submitted_at'),
+        'prospects': (Prospect.objects.filter(organisation=organisation), 'created_at'),
+        'assignments': (DiscipleshipPathsAssignment.objects.filter(
+            prospect__organisation=organisation
+        ), 'assigned_at'),
+        'followups': (DiscipleshipFollowUp.objects.filter(
+            prospect__organisation=organisation
+        ), 'follow_up_date'),
+    }
+    return list(sources), [
+        partial(series, queryset, field, tz, days, bucket, now) for queryset, field in sources.values()
+    ]
+
+
+def _trends(names, results, bucket):
+    trends = {}
+    labels = None
+    for name, points in zip(names, results):
+        data = chart_data(points, bucket)
+        labels = data['labels']
+        trends[name] = data['counts']
+    trends['labels'] = labels
+    return trends
+
+
+def organisation_trends(organisation, days=7, bucket='day', now=None):
+    """Responses, new prospects, path assignments and due follow-ups per bucket, one query each"""
+    names, calls = trend_calls(organisation, days, bucket, now)
+    return _trends(names, [call() for call in calls], bucket)
+
+
+async def aorganisation_trends(organisation, days=7, bucket='day', now=None):
+    """organisation_trends() with the four series queried concurrently"""
+    names, calls = trend_calls(organisation, days, bucket, now)
+    return _trends(names, await concurrency.gather(*calls), bucket)
@@ -9,6 +9,11 @@ urlpatterns = [
     path('prospects/', views.prospects, name='prospects'),
     path('disciplers/', views.disciplers, name='disciplers'),
     path('survey-responses/', views.survey_responses, name='survey_responses'),
+    path('survey-responses/export/<int:questionnaire_id>/', views.export_survey_responses, name='export_survey_responses'),
+    path('survey-responses/analytics/<int:questionnaire_id>/', views.survey_response_analytics, name='survey_response_analytics'),
     path('api/assign-prospect/', views.assign_prospect, name='assign_prospect'),
+    path('api/unassigned-prospects/', views.unassigned_prospects, name='unassigned_prospects'),
+    path('api/assign-prospects/', views.assign_prospects_batch, name='assign_prospects_batch'),
+    path('api/auto-assign-prospects/', views.auto_assign_prospects, name='auto_assign_prospects'),
     path('api/assign-prospect-to-discipler/', views.assign_prospect_to_discipler, name='assign_prospect_to_discipler'),
 ]
\ No newline at end of file
@@ -1,276 +1,146 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
-from .models import (Organisation, Prospect, DiscipleshipFollowUp, DisciplerProfile,
-                     DiscipleshipPathsAssignment, Configs, TraineeProfile, Training)
+from .models import Prospect, DisciplerProfile
 from .models import ActiveQuestionnaire
-from prospect.models import Responses, Questionnaire
+from . import caching, concurrency, search, timeseries
+from .pagination import KeysetPaginator
+from .metrics import FUNNEL_WINDOWS, adashboard_metrics, ahome_metrics, funnel_metrics, submission_counts
+from prospect.models import Responses
 import json
 
-def home(request):
-    if request.user.is_authenticated:
-        try:
-            app_user = request.user.appuser
-            organisation = app_user.organisation
-        except:
-            organisation = Organisation.objects.first()
-    else:
-        organisation = Organisation.objects.first()
-    
-    if not organisation:
-        return render(request, 'home.html', {})
-    
+# Prospects per page of the assignment modal's type-ahead
+UNASSIGNED_PAGE_SIZE = 20
+
+def _record_visit(request, organisation):
+    """(last visit, organisation data version then, version now) from the session, which is updated to now"""
     # Get last visit time from session
     last_visit = request.session.get('last_visit')
     if last_visit:
         last_visit = timezone.datetime.fromisoformat(last_visit)
     else:
         last_visit = timezone.now() - timedelta(days=30)  # Default to 30 days ago
+    seen_version = request.session.get('last_visit_version')
+    version = caching.organisation_version(organisation)
     
     # Set current visit time
     request.session['last_visit'] = timezone.now().isoformat()
+    request.session['last_visit_version'] = version
+    return last_visit, seen_version, version
+
+async def home(request):
+    organisation = request.organisation
     
-    # ===== PROSPECTS DATA =====
-    total_prospects = Prospect.objects.filter(organisation=organisation).count()
-    new_prospects = Prospect.objects.filter(
-        organisation=organisation,
-        created_at__gte=last_visit
-    ).count()
-    
-    # ===== QUESTIONNAIRES & RESPONSES DATA =====
-    active_questionnaires = ActiveQuestionnaire.objects.filter(
-        organisation=organisation,
-        is_active=True
-    ).select_related('questionnaire')
-    
-    questionnaire_data = []
-    total_responses = 0
-    new_responses = 0
-    
-    for aq in active_questionnaires:
-        q = aq.questionnaire
-        all_responses = Responses.objects.filter(
-            question__questionnaire=q
-        ).values('prospect_form_id').distinct().count()
-        
-        responses_since_visit = Responses.objects.filter(
-            question__questionnaire=q,
-            submitted_at__gte=last_visit
-        ).values('prospect_form_id').distinct().count()
-        
-        total_responses += all_responses
-        new_responses += responses_since_visit
-        
-        questionnaire_data.append({
-            'name': q.name,
-            'title': q.title,
-            'total_responses': all_responses,
-            'new_responses': responses_since_visit,
-        })
+    if not organisation:
+        return render(request, 'home.html', {})
     
-    # ===== DISCIPLESHIP FOLLOW-UPS DATA =====
-    due_followups = DiscipleshipFollowUp.objects.filter(
-        prospect__organisation=organisation,
-        follow_up_date__lte=timezone.now(),
-        follow_up_date__isnull=False
-    ).select_related('prospect', 'discipler', 'discipler__user').order_by('follow_up_date')
+    # Last visit time from the session, which now records this one
+    last_visit, seen_version, version = await sync_to_async(_record_visit)(request, organisation)
+    
+    summary = await caching.acached_context('home', organisation, lambda: ahome_metrics(organisation), version)
+    
+    # ===== NEW SINCE LAST VISIT =====
+    # Nothing can be new if the organisation's data has not changed since the last visit
+    if seen_version == version:
+        new_prospects = 0
+        new_submissions = {}
+    else:
+        new_prospects, new_submissions = await concurrency.gather(
+            Prospect.objects.filter(organisation=organisation, created_at__gte=last_visit).count,
+            partial(submission_counts, [q['questionnaire_id'] for q in summary['questionnaire_data']],
+                    since=last_visit),
+        )
+    
+    questionnaire_data = [
+        dict(q, new_responses=new_submissions.get(q['questionnaire_id'], 0))
+        for q in summary['questionnaire_data']
+    ]
     
     context = {
-        'total_prospects': total_prospects,
+        'total_prospects': summary['total_prospects'],
         'new_prospects': new_prospects,
-        'total_responses': total_responses,
-        'new_responses': new_responses,
+        'total_responses': summary['total_responses'],
+        'new_responses': sum(q['new_responses'] for q in questionnaire_data),
         'questionnaire_data': questionnaire_data,
-        'due_followups': due_followups,
+        'due_followups': summary['due_followups'],
+        'due_followup_count': summary['due_followup_count'],
         'organisation': organisation,
     }
     
     return render(request, 'home.html', context)
 
-def dashboard(request):
-    if request.user.is_authenticated:
-        try:
-            app_user = request.user.appuser
-            organisation = app_user.organisation
-        except:
-            organisation = Organisation.objects.first()
-    else:
-        organisation = Organisation.objects.first()
+async def dashboard(request):
+    organisation = request.organisation
     
     if not organisation:
         return render(request, 'dashboard.html', {})
     
-    # ===== PROSPECT ACCEPTANCE RATE =====
-    # Count prospects with at least one survey response (accepted)
-    prospects_with_responses = Prospect.objects.filter(
-        organisation=organisation
-    ).annotate(
-        response_count=Count('responses', distinct=True)
-    ).filter(response_count__gt=0).count()
-    
-    total_prospects = Prospect.objects.filter(organisation=organisation).count()
-    acceptance_rate = (prospects_with_responses / total_prospects * 100) if total_prospects > 0 else 0
-    
-    acceptance_data = {
-        'accepted': prospects_with_responses,
-        'pending': total_prospects - prospects_with_responses,
-        'rate': round(acceptance_rate, 1)
-    }
-    
-    # ===== PROSPECT ASSIGNMENT RATE =====
-    # Count prospects assigned to disciplers
-    assigned_prospects = Prospect.objects.filter(
-        organisation=organisation,
-        discipler__isnull=False
-    ).count()
-    
-    unassigned_prospects = total_prospects - assigned_prospects
-    assignment_rate = (assigned_prospects / total_prospects * 100) if total_prospects > 0 else 0
-    
-    assignment_data = {
-        'assigned': assigned_prospects,
-        'unassigned': unassigned_prospects,
-        'rate': round(assignment_rate, 1)
-    }
-    
-    # ===== DISCIPLESHIP COMPLETION RATE =====
-    # Count prospects with completed discipleship paths
-    completed_assignments = DiscipleshipPathsAssignment.objects.filter(
-        prospect__organisation=organisation,
-        completion_status='completed'
-    ).count()
-    
-    total_assignments = DiscipleshipPathsAssignment.objects.filter(
-        prospect__organisation=organisation
-    ).count()
-    
-    completion_rate = (completed_assignments / total_assignments * 100) if total_assignments > 0 else 0
-    
-    discipleship_data = {
-        'completed': completed_assignments,
-        'in_progress': DiscipleshipPathsAssignment.objects.filter(
-            prospect__organisation=organisation,
-            completion_status='in_progress'
-        ).count(),
-        'not_started': DiscipleshipPathsAssignment.objects.filter(
-            prospect__organisation=organisation,
-            completion_status='not_started'
-        ).count(),
-        'stalled': DiscipleshipPathsAssignment.objects.filter(
-            prospect__organisation=organisation,
-            completion_status='stalled'
-        ).count(),
-        'rate': round(completion_rate, 1)
-    }
-    
-    # ===== SURVEY RESPONSES OVER PAST WEEK =====
-    week_ago = timezone.now() - timedelta(days=7)
-    daily_responses = {}
-    
-    for i in range(7):
-        date = timezone.now().date() - timedelta(days=6-i)
-        day_start = timezone.make_aware(timezone.datetime.combine(date, timezone.datetime.min.time()))
-        day_end = timezone.make_aware(timezone.datetime.combine(date, timezone.datetime.max.time()))
-        
-        count = Responses.objects.filter(
-            question__questionnaire__activequestionnaire__organisation=organisation,
-            submitted_at__gte=day_start,
-            submitted_at__lte=day_end
-        ).count()
-        
-        daily_responses[date.strftime('%a')] = count
-    
-    # ===== DISCIPLER-PROSPECT RATIO =====
-    total_disciplers = DisciplerProfile.objects.filter(
-        user__organisation=organisation
-    ).count()
-    
-    # Get recommended ratio from configs
     try:
-        ratio_config = Configs.objects.get(config_key='discipler_prospect_ratio')
-        recommended_ratio = float(ratio_config.config_value)
-    except:
-        recommended_ratio = 1.0  # Default 1:1 or 1:5 depending on preference
-    
-    current_ratio = (total_prospects / total_disciplers) if total_disciplers > 0 else 0
-    
-    ratio_data = {
-        'current': round(current_ratio, 1),
-        'recommended': recommended_ratio,
-        'total_disciplers': total_disciplers,
-        'total_prospects': total_prospects,
-        'health': 'healthy' if current_ratio <= recommended_ratio else 'overloaded'
-    }
+        funnel_days = int(request.GET.get('funnel_days', 30))
+    except ValueError:
+        funnel_days = 30
+    if funnel_days not in FUNNEL_WINDOWS:
+        funnel_days = 30
     
-    # ===== TRAINING COMPLETION RATES =====
-    trainings = Training.objects.filter(organisations=organisation)
-    training_data = []
-    
-    for training in trainings:
-        total_trainees = TraineeProfile.objects.filter(enrolled_training=training).count()
-        completed_trainees = TraineeProfile.objects.filter(
-            enrolled_training=training,
-            status='completed'
-        ).count()
-        
-        completion_rate = (completed_trainees / total_trainees * 100) if total_trainees > 0 else 0
-        
-        training_data.append({
-            'name': training.name,
-            'total_trainees': total_trainees,
-            'completed': completed_trainees,
-            'completion_rate': round(completion_rate, 1),
-            'in_progress': TraineeProfile.objects.filter(
-                enrolled_training=training,
-                status='in_progress'
-            ).count(),
-        })
-    
-    # ===== ADDITIONAL METRICS =====
-    # Average responses per questionnaire
-    active_questionnaires = ActiveQuestionnaire.objects.filter(
-        organisation=organisation,
-        is_active=True
+    try:
+        trend_days = int(request.GET.get('trend_days', 7))
+    except ValueError:
+        trend_days = 7
+    if trend_days not in timeseries.WINDOWS:
+        trend_days = 7
+    trend_bucket = request.GET.get('trend_bucket', 'day')
+    if trend_bucket not in timeseries.bucket_choices(trend_days):
+        trend_bucket = 'day'
+    
+    # Training cohorts run up to the organisation's current month and the
+    # trend window moves with its date, so those are part of the keys
+    today = timezone.localdate(timezone=timeseries.organisation_timezone(organisation))
+    
+    # Metrics, trends and funnels are independent, and so is every aggregate
+    # within them: all of them are in flight together, so a cold dashboard
+    # takes about as long as its slowest query
+    metrics, trends, (funnel_data,) = await asyncio.gather(
+        caching.acached_context(
+            'dashboard', organisation, lambda: adashboard_metrics(organisation), key_suffix=today.strftime('%Y-%m')
+        ),
+        caching.acached_context(
+            'trends', organisation,
+            lambda: timeseries.aorganisation_trends(organisation, trend_days, trend_bucket),
+            key_suffix=f'{trend_days}:{trend_bucket}:{today.isoformat()}'
+        ),
+        concurrency.gather(partial(funnel_metrics, organisation, funnel_days)),
     )
-    
-    total_questionnaire_responses = 0
-    for aq in active_questionnaires:
-        count = Responses.objects.filter(
-            question__questionnaire=aq.questionnaire
-        ).values('prospect_form_id').distinct().count()
-        total_questionnaire_responses += count
-    
-    avg_responses_per_questionnaire = (
-        total_questionnaire_responses / active_questionnaires.count()
-    ) if active_questionnaires.count() > 0 else 0
-    
+
     context = {
         'organisation': organisation,
-        'acceptance_data': acceptance_data,
-        'assignment_data': assignment_data,
-        'discipleship_data': discipleship_data,
-        'daily_responses': json.dumps(daily_responses),
-        'ratio_data': ratio_data,
-        'training_data': training_data,
-        'avg_responses_per_questionnaire': round(avg_responses_per_questionnaire, 1),
-        'total_questionnaires': active_questionnaires.count(),
+        'acceptance_data': metrics['acceptance_data'],
+        'assignment_data': metrics['assignment_data'],
+        'discipleship_data': metrics['discipleship_data'],
+        'trends': json.dumps(trends),
+        'trend_days': trend_days,
+        'trend_bucket': trend_bucket,
+        'trend_windows': timeseries.WINDOWS,
+        'trend_buckets': timeseries.bucket_choices(trend_days),
+        'ratio_data': metrics['ratio_data'],
+        'training_data': metrics['training_data'],
+        'training_cohorts': metrics['training_cohorts'],
+        'total_trainees': metrics['total_trainees'],
+        'avg_responses_per_questionnaire': metrics['avg_responses_per_questionnaire'],
+        'total_questionnaires': metrics['total_questionnaires'],
+        'funnel_days': funnel_days,
+        'funnel_windows': FUNNEL_WINDOWS,
+        'funnel_data': funnel_data,
     }
     
     return render(request, 'dashboard.html', context)
 
 def prospects(request):
-    from django.core.paginator import Paginator
-    from django.db.models import Q
-    
-    if request.user.is_authenticated:
-        try:
-            app_user = request.user.appuser
-            organisation = app_user.organisation
-        except:
-            organisation = Organisation.objects.first()
-    else:
-        organisation = Organisation.objects.first()
+    organisation = request.organisation
     
     if not organisation:
         return render(request, 'prospects.html', {})
@@ -280,7 +150,7 @@ def prospects(request):
     search_query = request.GET.get('search', '')
     
     # Base queryset
-    prospects_qs = Prospect.objects.filter(organisation=organisation).select_related('discipler')
+    prospects_qs = Prospect.objects.filter(organisation=organisation).select_related('discipler__user__user')
     
     # Filter by tab
     if tab == 'assigned':
@@ -290,28 +160,25 @@ def prospects(request):
     
     # Search across all fields
     if search_query:
-        prospects_qs = prospects_qs.filter(
-            Q(name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(prospect_form_id__icontains=search_query)
-        )
-    
-    # Sort by creation date (newest first)
-    prospects_qs = prospects_qs.order_by('-created_at')
+        prospects_qs = search.get_backend().prospects(prospects_qs, search_query)
     
-    # Pagination
-    paginator = Paginator(prospects_qs, 15)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Sort by creation date (newest first), paged by cursor
+    paginator = KeysetPaginator(prospects_qs, ['-created_at', '-id'], 15, salt='organisation.prospects')
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Get counts for tabs
-    all_count = Prospect.objects.filter(organisation=organisation).count()
-    assigned_count = Prospect.objects.filter(organisation=organisation, discipler__isnull=False).count()
-    unassigned_count = Prospect.objects.filter(organisation=organisation, discipler__isnull=True).count()
+    counts = Prospect.objects.filter(organisation=organisation).aggregate(
+        all_count=Count('id'),
+        assigned_count=Count('id', filter=Q(discipler__isnull=False)),
+    )
+    all_count = counts['all_count']
+    assigned_count = counts['assigned_count']
+    unassigned_count = all_count - assigned_count
     
     # Get available disciplers for assignment
-    available_disciplers = DisciplerProfile.objects.filter(user__organisation=organisation)
+    available_disciplers = DisciplerProfile.objects.filter(
+        user__organisation=organisation
+    ).select_related('user__user').order_by('user__user__last_name', 'user__user__first_name')
     
     context = {
         'page_obj': page_obj,
@@ -321,6 +188,9 @@ def prospects(request):
         'all_count': all_count,
         'assigned_count': assigned_count,
         'unassigned_count': unassigned_count,
+        'total_count': None if search_query else {
+            'assigned': assigned_count, 'unassigned': unassigned_count,
+        }.get(tab, all_count),
         'available_disciplers': available_disciplers,
         'organisation': organisation,
     }
@@ -329,44 +199,10 @@ def prospects(request):
 
 def assign_prospect(request):
     """AJAX endpoint to assign a prospect to a discipler"""
-    from django.http import JsonResponse
-    
-    if request.method == 'POST':
-        prospect_id = request.POST.get('prospect_id')
-        discipler_id = request.POST.get('discipler_id')
-        
-        try:
-            prospect = Prospect.objects.get(id=prospect_id)
-            discipler = DisciplerProfile.objects.get(id=discipler_id)
-            
-            prospect.discipler = discipler
-            prospect.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'{prospect.name} assigned to {discipler.user.first_name} {discipler.user.last_name}'
-            })
-        except Prospect.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Prospect not found'})
-        except DisciplerProfile.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Discipler not found'})
-        except Exception as e:
-            return JsonResponse({'success': False, 'message': str(e)})
-    
-    return JsonResponse({'success': False, 'message': 'Invalid request'})
+    return _assign_one(request)
 
 def disciplers(request):
-    from django.core.paginator import Paginator
-    from django.db.models import Count, Q
-    
-    if request.user.is_authenticated:
-        try:
-            app_user = request.user.appuser
-            organisation = app_user.organisation
-        except:
-            organisation = Organisation.objects.first()
-    else:
-        organisation = Organisation.objects.first()
+    organisation = request.organisation
     
     if not organisation:
         return render(request, 'disciplers.html', {})
@@ -375,52 +211,48 @@ def disciplers(request):
     tab = request.GET.get('tab', 'all')
     search_query = request.GET.get('search', '')
     
-    # Base queryset
+    # Base queryset, with the per-row counts computed in the same query
     disciplers_qs = DisciplerProfile.objects.filter(
         user__organisation=organisation
-    ).select_related('user').prefetch_related('trainings_completed', 'prospects')
+    ).select_related('user__user').annotate(
+        prospect_count=Count('prospects', distinct=True),
+        training_count=Count('trainings_completed', distinct=True),
+    )
     
     # Filter by tab (training status)
     if tab == 'trained':
         # Disciplers who have completed at least one training
-        disciplers_qs = disciplers_qs.annotate(
-            training_count=Count('trainings_completed')
-        ).filter(training_count__gt=0)
+        disciplers_qs = disciplers_qs.filter(training_count__gt=0)
     elif tab == 'not_trained':
         # Disciplers who have not completed any training
-        disciplers_qs = disciplers_qs.annotate(
-            training_count=Count('trainings_completed')
-        ).filter(training_count=0)
+        disciplers_qs = disciplers_qs.filter(training_count=0)
     
     # Search across all fields
     if search_query:
         disciplers_qs = disciplers_qs.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
+            Q(user__user__first_name__icontains=search_query) |
+            Q(user__user__last_name__icontains=search_query) |
+            Q(user__user__email__icontains=search_query) |
             Q(bio__icontains=search_query)
         )
     
-    # Sort by last name (alphabetically)
-    disciplers_qs = disciplers_qs.order_by('user__last_name', 'user__first_name')
-    
-    # Pagination
-    paginator = Paginator(disciplers_qs, 15)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Sort by last name (alphabetically), paged by cursor
+    paginator = KeysetPaginator(
+        disciplers_qs, ['user__user__last_name', 'user__user__first_name', 'id'], 15, salt='organisation.disciplers'
+    )
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Get counts for tabs
-    all_count = DisciplerProfile.objects.filter(user__organisation=organisation).count()
-    trained_count = DisciplerProfile.objects.filter(
-        user__organisation=organisation
-    ).annotate(training_count=Count('trainings_completed')).filter(training_count__gt=0).count()
+    counts = DisciplerProfile.objects.filter(user__organisation=organisation).aggregate(
+        all_count=Count('id', distinct=True),
+        trained_count=Count('id', filter=Q(trainings_completed__isnull=False), distinct=True),
+    )
+    all_count = counts['all_count']
+    trained_count = counts['trained_count']
     not_trained_count = all_count - trained_count
     
-    # Get unassigned prospects for assignment modal
-    unassigned_prospects = Prospect.objects.filter(
-        organisation=organisation,
-        discipler__isnull=True
-    ).order_by('name')
+    # The assignment modal looks prospects up on demand, so only the count is needed here
+    unassigned_count = Prospect.objects.filter(organisation=organisation, discipler__isnull=True).count()
     
     context = {
         'page_obj': page_obj,
@@ -430,52 +262,114 @@ def disciplers(request):
         'all_count': all_count,
         'trained_count': trained_count,
         'not_trained_count': not_trained_count,
-        'unassigned_prospects': unassigned_prospects,
+        'total_count': None if search_query else {
+            'trained': trained_count, 'not_trained': not_trained_count,
+        }.get(tab, all_count),
+        'unassigned_count': unassigned_count,
         'organisation': organisation,
     }
     
     return render(request, 'disciplers.html', context)
 
+def unassigned_prospects(request):
+    """AJAX endpoint for the assignment modal: unassigned prospects whose name or email starts with ?q"""
+    from django.http import JsonResponse
+    
+    organisation = request.organisation
+    
+    if not organisation:
+        return JsonResponse({'results': [], 'next_cursor': None})
+    
+    query = request.GET.get('q', '').strip()
+    prospects_qs = Prospect.objects.filter(organisation=organisation, discipler__isnull=True)
+    if query:
+        prospects_qs = prospects_qs.filter(Q(name__istartswith=query) | Q(email__istartswith=query))
+    
+    paginator = KeysetPaginator(
+        prospects_qs.only('id', 'name', 'email'), ['name', 'id'], UNASSIGNED_PAGE_SIZE,
+        salt='organisation.unassigned_prospects',
+    )
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'results': [
+            {'id': prospect.id, 'name': prospect.name, 'email': prospect.email}
+            for prospect in page_obj.object_list
+        ],
+        'next_cursor': page_obj.next_cursor,
+    })
+
+def auto_assign_prospects(request):
+    """AJAX endpoint to spread every unassigned prospect over the organisation's disciplers"""
+    from django.http import JsonResponse
+    from .assignment import auto_assign
+    
+    organisation = request.organisation
+    
+    if request.method == 'POST' and organisation:
+        summary = auto_assign(organisation, dry_run=request.POST.get('dry_run') == '1')
+        return JsonResponse({'success': True, **summary})
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request'})
+
 def assign_prospect_to_discipler(request):
     """AJAX endpoint to assign a prospect to a discipler from disciplers page"""
+    return _assign_one(request)
+
+def _assign_one(request):
     from django.http import JsonResponse
+    from .assignment import assign_batch
+    
+    organisation = request.organisation
     
-    if request.method == 'POST':
+    if request.method == 'POST' and organisation:
         discipler_id = request.POST.get('discipler_id')
         prospect_id = request.POST.get('prospect_id')
         
-        try:
-            discipler = DisciplerProfile.objects.get(id=discipler_id)
-            prospect = Prospect.objects.get(id=prospect_id)
-            
-            prospect.discipler = discipler
-            prospect.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'{prospect.name} assigned to {discipler.user.first_name} {discipler.user.last_name}'
-            })
-        except DisciplerProfile.DoesNotExist:
+        # These endpoints always name a discipler; unassigning goes through the batch endpoint
+        if not discipler_id:
             return JsonResponse({'success': False, 'message': 'Discipler not found'})
-        except Prospect.DoesNotExist:
-            return JsonResponse({'success': False, 'message': 'Prospect not found'})
-        except Exception as e:
-            return JsonResponse({'success': False, 'message': str(e)})
+        
+        result = assign_batch(organisation, [(prospect_id, discipler_id)])[0]
+        return JsonResponse({'success': result['success'], 'message': result['message']})
     
     return JsonResponse({'success': False, 'message': 'Invalid request'})
 
+def assign_prospects_batch(request):
+    """AJAX endpoint to apply many assignments at once.
+    
+    Expects a JSON body {"assignments": [{"prospect_id": 1, "discipler_id": 2}, ...]};
+    a null discipler_id unassigns. Replies with a result per assignment, in order.
+    """
+    from django.http import JsonResponse
+    from .assignment import MAX_BATCH_ASSIGNMENTS, assign_batch
+    
+    organisation = request.organisation
+    
+    if request.method != 'POST' or not organisation:
+        return JsonResponse({'success': False, 'message': 'Invalid request'})
+    
+    try:
+        pairs = [(item['prospect_id'], item['discipler_id']) for item in json.loads(request.body)['assignments']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Expected a JSON list of assignments'})
+    
+    if len(pairs) > MAX_BATCH_ASSIGNMENTS:
+        return JsonResponse({
+            'success': False,
+            'message': f'At most {MAX_BATCH_ASSIGNMENTS} assignments per request',
+        })
+    
+    results = assign_batch(organisation, pairs)
+    return JsonResponse({
+        'success': all(result['success'] for result in results),
+        'changed': sum(1 for result in results if result.get('changed')),
+        'failed': sum(1 for result in results if not result['success']),
+        'results': results,
+    })
+
 def survey_responses(request):
-    from django.core.paginator import Paginator
-    from django.db.models import Q
-    
-    if request.user.is_authenticated:
-        try:
-            app_user = request.user.appuser
-            organisation = app_user.organisation
-        except:
-            organisation = Organisation.objects.first()
-    else:
-        organisation = Organisation.objects.first()
+    organisation = request.organisation
     
     if not organisation:
         return render(request, 'responses.html', {})
@@ -485,33 +379,93 @@ def survey_responses(request):
     # Base queryset - get responses filtered by active questionnaires in the organisation
     responses_qs = Responses.objects.filter(
         question__questionnaire__activequestionnaire__organisation=organisation
-    ).select_related('question', 'question__questionnaire').order_by('-submitted_at')
+    ).select_related('question', 'question__questionnaire')
     
     # Search across relevant fields
     if search_query:
-        responses_qs = responses_qs.filter(
-            Q(prospect_form_id__icontains=search_query) |
-            Q(question__questionnaire__name__icontains=search_query) |
-            Q(question__text__icontains=search_query) |
-            Q(answer_text__icontains=search_query)
-        )
+        responses_qs = search.get_backend().responses(responses_qs, search_query)
     
-    # Pagination
-    paginator = Paginator(responses_qs, 20)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Newest first, paged by cursor
+    paginator = KeysetPaginator(responses_qs, ['-submitted_at', '-id'], 20, salt='organisation.responses')
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Get total counts
-    total_responses = Responses.objects.filter(
-        question__questionnaire__activequestionnaire__organisation=organisation
-    ).count()
+    # The total only changes when responses are written, so count once per data version
+    total_responses = caching.cached_context('responses_total', organisation, lambda: {
+        'total_responses': Responses.objects.filter(
+            question__questionnaire__activequestionnaire__organisation=organisation
+        ).count(),
+    })['total_responses']
     
     context = {
         'page_obj': page_obj,
         'responses': page_obj.object_list,
         'search_query': search_query,
         'total_responses': total_responses,
+        'total_count': None if search_query else total_responses,
+        'export_questionnaires': ActiveQuestionnaire.objects.filter(
+            organisation=organisation
+        ).select_related('questionnaire').order_by('pk'),
         'organisation': organisation,
     }
     
-    return render(request, 'responses.html', context)
\ No newline at end of file
+    return render(request, 'responses.html', context)
+
+def export_survey_responses(request, questionnaire_id):
+    """Stream every answer to a questionnaire, one row per form, as CSV or JSON lines"""
+    from django.http import Http404, StreamingHttpResponse
+    from prospect.export import FORMATS, export_lines
+    
+    organisation = request.organisation
+    
+    # Only questionnaires the organisation runs can be exported
+    active_questionnaire = ActiveQuestionnaire.objects.filter(
+        organisation=organisation, questionnaire_id=questionnaire_id
+    ).select_related('questionnaire').first()
+    if active_questionnaire is None:
+        raise Http404('Questionnaire not found')
+    questionnaire = active_questionnaire.questionnaire
+    
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        export_format = 'csv'
+    
+    response = StreamingHttpResponse(
+        export_lines(questionnaire, export_format),
+        content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{questionnaire.name}-responses.{export_format}"'
+    return response
+
+def survey_response_analytics(request, questionnaire_id):
+    """Answers to a questionnaire's select questions as JSON.
+    
+    ?question=<id> gives that question's answer distribution; ?row=<id>&column=<id>
+    cross-tabulates two of them. Either way the reply lists the select questions.
+    """
+    from django.http import Http404, JsonResponse
+    from prospect.analytics import cubes
+    
+    organisation = request.organisation
+    
+    # Only questionnaires the organisation runs can be analysed
+    if not ActiveQuestionnaire.objects.filter(organisation=organisation, questionnaire_id=questionnaire_id).exists():
+        raise Http404('Questionnaire not found')
+    
+    cube = cubes.get(questionnaire_id)
+    data = {
+        'submissions': cube.size,
+        'questions': [
+            {'id': question.id, 'text': question.text, 'options': question.labels}
+            for question in cube.questions.values()
+        ],
+    }
+    
+    try:
+        if request.GET.get('row') and request.GET.get('column'):
+            data['crosstab'] = cube.crosstab(int(request.GET['row']), int(request.GET['column']))
+        elif request.GET.get('question'):
+            data['distribution'] = cube.distribution(int(request.GET['question']))
+    except (KeyError, ValueError):
+        return JsonResponse({'message': 'Not a select question of this questionnaire'}, status=400)
+    
+    return JsonResponse(data)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Questionnaire, Question, SelectOption, Responses, QuestionnaireLog
+from .models import Questionnaire, Question, SelectOption, Submission, Responses, QuestionnaireLog
 
 
 # class SelectOptionInline(admin.TabularInline):
@@ -18,4 +18,5 @@ admin.site.index_title = "Welcome to Certeza Admin Portal"
 admin.site.register(Questionnaire)
 admin.site.register(Question)
 admin.site.register(SelectOption)
+admin.site.register(Submission)
 admin.site.register(Responses)
\ No newline at end of file
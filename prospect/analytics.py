@@ -0,0 +1,173 @@
+import operator
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from itertools import repeat
+
+from django.conf import settings
+
+from organisation import caching
+from .models import Question, Responses, SelectOption, Submission
+from .schema import SCHEMA_SCOPE
+
+CHUNK_SIZE = 2000
+CUBE_CACHE_SIZE = getattr(settings, 'RESPONSE_CUBE_CACHE_SIZE', 16)
+
+# Every column codes a missing or blank answer as 0
+NO_ANSWER = 0
+
+
+class CubeQuestion:
+    """A select question's option labels and the code each stored answer maps to"""
+
+    def __init__(self, question_id, text, options):
+        self.id = question_id
+        self.text = text
+        # 0 is no answer, 1..n the options in SelectOption order, n + 1 an answer matching none of them
+        self.labels = ['No answer'] + [label for _, label in options] + ['Other']
+        self.other = len(self.labels) - 1
+        self.codes = {}
+        for code, (value, label) in enumerate(options, start=1):
+            # The public form posts option values; imports may carry the option text instead
+            if value:
+                self.codes.setdefault(value, code)
+            self.codes.setdefault(label, code)
+
+    def code(self, answer):
+        answer = (answer or '').strip()
+        if not answer:
+            return NO_ANSWER
+        return self.codes.get(answer, self.other)
+
+
+class ResponseCube:
+    """A questionnaire's select answers held as one integer-coded column per select question.
+
+    Row i of every column is the questionnaire's i-th submission in id order.
+    Columns are array('H'), two bytes an answer, so a million submissions
+    over ten select questions take 20MB, and counting runs over the arrays
+    in C rather than over model instances. refresh() appends submissions
+    newer than the last one loaded.
+    """
+
+    def __init__(self, questionnaire_id):
+        self.questionnaire_id = questionnaire_id
+        self.questions = self._load_questions()
+        self.columns = {question_id: array('H') for question_id in self.questions}
+        self.size = 0
+        self.last_submission_id = 0
+        self._lock = threading.Lock()
+
+    def _load_questions(self):
+        options = {}
+        for question_id, value, label in SelectOption.questions.through.objects.filter(
+            question__questionnaire_id=self.questionnaire_id, question__type='select'
+        ).values_list('question_id', 'selectoption__value', 'selectoption__text').order_by(
+            'selectoption__order', 'selectoption__id'
+        ):
+            options.setdefault(question_id, []).append((value, label))
+
+        return {
+            question_id: CubeQuestion(question_id, text, options.get(question_id, []))
+            for question_id, text in Question.objects.filter(
+                questionnaire_id=self.questionnaire_id, type='select'
+            ).order_by('order', 'id').values_list('id', 'text')
+        }
+
+    def refresh(self, chunk_size=CHUNK_SIZE):
+        """Append the submissions made since the last refresh; returns how many were added"""
+        with self._lock:
+            added = 0
+            submissions = Submission.objects.filter(questionnaire_id=self.questionnaire_id).order_by('id')
+            while True:
+                chunk = list(submissions.filter(
+                    id__gt=self.last_submission_id
+                ).values_list('id', 'prospect_form_id')[:chunk_size])
+                if not chunk:
+                    return added
+                self._append(chunk)
+                added += len(chunk)
+
+    def _append(self, chunk):
+        rows = {form_id: self.size + i for i, (_, form_id) in enumerate(chunk)}
+        blank = array('H', [NO_ANSWER]) * len(chunk)
+        for column in self.columns.values():
+            column.extend(blank)
+
+        if self.columns:
+            for form_id, question_id, answer in Responses.objects.filter(
+                prospect_form_id__in=list(rows), question_id__in=list(self.columns)
+            ).values_list('prospect_form_id', 'question_id', 'answer_text'):
+                self.columns[question_id][rows[form_id]] = self.questions[question_id].code(answer)
+
+        self.size += len(chunk)
+        self.last_submission_id = chunk[-1][0]
+
+    def distribution(self, question_id):
+        """[{'label', 'count', 'share'}] for each code of a select question, no answer first"""
+        question = self.questions[question_id]
+        with self._lock:
+            counts = Counter(self.columns[question_id])
+            total = self.size
+        return [{
+            'label': label,
+            'count': counts[code],
+            'share': round(counts[code] / total * 100, 1) if total else 0,
+        } for code, label in enumerate(question.labels)]
+
+    def crosstab(self, row_question_id, column_question_id):
+        """Submissions per pair of answers to two select questions, as a matrix of counts"""
+        row_question = self.questions[row_question_id]
+        column_question = self.questions[column_question_id]
+        width = len(column_question.labels)
+        with self._lock:
+            # Fold each pair of codes into one integer, so a single Counter pass tallies the pairs
+            counts = Counter(map(
+                operator.add,
+                map(operator.mul, self.columns[row_question_id], repeat(width)),
+                self.columns[column_question_id],
+            ))
+        return {
+            'rows': row_question.labels,
+            'columns': column_question.labels,
+            'counts': [[counts[row * width + column] for column in range(width)]
+                       for row in range(len(row_question.labels))],
+        }
+
+
+class CubeCache:
+    """Per-process LRU of questionnaire id to ResponseCube.
+
+    New submissions are appended on each get(). Edited or deleted answers
+    bump the shared responses version instead, and every cube is rebuilt; so
+    does an edit to any questionnaire's questions or options, which bumps the
+    schema version, as a cube's columns and codes are drawn from them.
+    """
+
+    def __init__(self, size=CUBE_CACHE_SIZE):
+        self.size = size
+        self._cubes = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def get(self, questionnaire_id):
+        version = caching.get_versions(caching.RESPONSES_SCOPE, SCHEMA_SCOPE)
+        with self._lock:
+            if version != self._version:
+                self._cubes.clear()
+                self._version = version
+            cube = self._cubes.get(questionnaire_id)
+            if cube is None:
+                cube = self._cubes[questionnaire_id] = ResponseCube(questionnaire_id)
+            self._cubes.move_to_end(questionnaire_id)
+            while len(self._cubes) > self.size:
+                self._cubes.popitem(last=False)
+        cube.refresh()
+        return cube
+
+    def clear(self):
+        with self._lock:
+            self._cubes.clear()
+
+
+cubes = CubeCache()
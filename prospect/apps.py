@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProspectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prospect'
+
+    def ready(self):
+        from . import signals  # noqa: F401
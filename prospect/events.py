@@ -0,0 +1,139 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import QuestionnaireLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SETTINGS = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+
+def buffer_settings():
+    return {**DEFAULT_BUFFER_SETTINGS, **getattr(settings, 'QUESTIONNAIRE_LOG_BUFFER', {})}
+
+
+class LogBuffer:
+    """Bounded in-process queue of QuestionnaireLog rows, written in batches by a background thread.
+
+    The thread flushes when BATCH_SIZE events are waiting or FLUSH_INTERVAL
+    seconds have passed, and the buffer is drained at interpreter exit. When
+    the buffer is full the caller flushes it inline rather than drop events.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's thread and locks did not come with us
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopping = False
+                    self._thread = threading.Thread(target=self._run, name='questionnaire-log-writer', daemon=True)
+                    self._thread.start()
+
+    def add(self, event):
+        options = buffer_settings()
+        self._ensure_started()
+
+        with self._lock:
+            full = len(self._events) >= options['MAX_SIZE']
+        if full:
+            self.flush()
+
+        with self._lock:
+            self._events.append(event)
+            pending = len(self._events)
+        if pending >= options['BATCH_SIZE']:
+            self._wakeup.set()
+
+    def _take(self, size):
+        with self._lock:
+            return [self._events.popleft() for _ in range(min(size, len(self._events)))]
+
+    def flush(self):
+        """Write every queued event; returns how many were written"""
+        batch_size = buffer_settings()['BATCH_SIZE']
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take(batch_size)
+                if not batch:
+                    return written
+                try:
+                    QuestionnaireLog.objects.bulk_create(batch)
+                    written += len(batch)
+                except Exception:
+                    logger.exception('Dropped %d questionnaire log events', len(batch))
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(buffer_settings()['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def stop(self):
+        """Stop the writer thread and drain whatever is still queued"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def __len__(self):
+        return len(self._events)
+
+
+log_buffer = LogBuffer()
+atexit.register(log_buffer.stop)
+
+
+def build_event(form_id, action, active_questionnaire_id=None):
+    """An unsaved QuestionnaireLog row for a funnel event, with its form id normalised"""
+    form_key, parsed_active_questionnaire_id = QuestionnaireLog.parse_form_id(form_id)
+    return QuestionnaireLog(
+        form_id=form_id,
+        form_key=form_key,
+        active_questionnaire_id=active_questionnaire_id or parsed_active_questionnaire_id,
+        action=action,
+        timestamp=timezone.now(),
+    )
+
+
+def log_event(form_id, action, active_questionnaire_id=None):
+    """Record a funnel event for a form, buffered unless buffering is disabled.
+
+    Callers pass the active questionnaire the form was served from: an earlier
+    event of the same form may still be queued in another process's buffer,
+    so it cannot be looked up here.
+    """
+    event = build_event(form_id, action, active_questionnaire_id)
+    if buffer_settings()['ENABLED']:
+        log_buffer.add(event)
+    else:
+        event.save()
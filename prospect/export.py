@@ -0,0 +1,82 @@
+import csv
+import json
+
+from .models import Question, Responses, Submission
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+
+class _Echo:
+    """A file-like object whose write() hands back the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def export_questions(questionnaire):
+    return list(Question.objects.filter(questionnaire=questionnaire).order_by('order', 'id'))
+
+
+def iter_submissions(questionnaire, questions, chunk_size=CHUNK_SIZE):
+    """(prospect_form_id, submitted_at, {question_id: answer}) per form, in form id order.
+
+    Forms are paged off the questionnaire's submissions in form id order, each
+    page resuming after the last form id of the one before, and the answers
+    for a page are fetched by form id; memory is bounded by the chunk size.
+    """
+    question_ids = [question.id for question in questions]
+    submissions = Submission.objects.filter(questionnaire=questionnaire).order_by('prospect_form_id')
+
+    last = None
+    while True:
+        page = submissions if last is None else submissions.filter(prospect_form_id__gt=last)
+        forms = list(page.values_list('prospect_form_id', 'submitted_at')[:chunk_size])
+        if not forms:
+            return
+
+        answers = {}
+        for form_id, question_id, answer_text in Responses.objects.filter(
+            prospect_form_id__in=[form_id for form_id, _ in forms],
+            question_id__in=question_ids,
+        ).values_list('prospect_form_id', 'question_id', 'answer_text'):
+            answers.setdefault(form_id, {})[question_id] = answer_text
+
+        for form_id, submitted_at in forms:
+            yield form_id, submitted_at, answers.get(form_id, {})
+        last = forms[-1][0]
+
+
+def csv_lines(questionnaire, chunk_size=CHUNK_SIZE):
+    """The questionnaire's answers as CSV lines: one row per form, one column per question"""
+    questions = export_questions(questionnaire)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['prospect_form_id', 'submitted_at'] + [question.text for question in questions])
+    for form_id, submitted_at, answers in iter_submissions(questionnaire, questions, chunk_size):
+        yield writer.writerow(
+            [form_id, submitted_at.isoformat()] + [answers.get(question.id, '') for question in questions]
+        )
+
+
+def jsonl_lines(questionnaire, chunk_size=CHUNK_SIZE):
+    """The questionnaire's answers as JSON lines, one object per form with its answers in question order.
+
+    Question texts need not be unique, so each answer names its question by
+    id and carries the text only as a label.
+    """
+    questions = export_questions(questionnaire)
+    for form_id, submitted_at, answers in iter_submissions(questionnaire, questions, chunk_size):
+        yield json.dumps({
+            'prospect_form_id': form_id,
+            'submitted_at': submitted_at.isoformat(),
+            'answers': [
+                {'question_id': question.id, 'question': question.text, 'answer': answers.get(question.id)}
+                for question in questions
+            ],
+        }) + '\n'
+
+
+def export_lines(questionnaire, format='csv', chunk_size=CHUNK_SIZE):
+    if format == 'jsonl':
+        return jsonl_lines(questionnaire, chunk_size)
+    return csv_lines(questionnaire, chunk_size)
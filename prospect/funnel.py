@@ -0,0 +1,78 @@
+from django.db.models import Count
+
+from .models import QuestionnaireLog
+from organisation.models import ActiveQuestionnaire
+
+# The main path through the public form, in order, and the exits off it
+FUNNEL_STAGES = [
+    'form_viewed',
+    'form_submitted',
+    'prospect_signing_up',
+    'prospect_signed_up',
+    'prospect_final_success',
+]
+FUNNEL_EXITS = [
+    'prospect_declined',
+    'prospect_self_study_signup',
+]
+
+
+def _rate(part, whole):
+    return round(part / whole * 100, 1) if whole > 0 else 0
+
+
+def stage_counts(active_questionnaire_ids, start, end):
+    """Distinct forms reaching each action between start and end, per active questionnaire.
+
+    Every event is written with the active questionnaire its form was served
+    from (see events.log_event), so this is one grouped query over the
+    (active questionnaire, action, timestamp) index.
+    """
+    rows = QuestionnaireLog.objects.filter(
+        active_questionnaire_id__in=list(active_questionnaire_ids),
+        action__in=FUNNEL_STAGES + FUNNEL_EXITS,
+        timestamp__gte=start,
+        timestamp__lt=end,
+    ).values_list('active_questionnaire_id', 'action').annotate(
+        forms=Count('form_key', distinct=True)
+    ).order_by()
+
+    counts = {}
+    for active_questionnaire_id, action, forms in rows:
+        counts.setdefault(active_questionnaire_id, {})[action] = forms
+    return counts
+
+
+def organisation_funnel(organisation, start, end):
+    """Per-questionnaire funnel for an organisation with conversion and drop-off between stages"""
+    active_questionnaires = list(ActiveQuestionnaire.objects.filter(
+        organisation=organisation
+    ).select_related('questionnaire').order_by('pk'))
+    counts = stage_counts((aq.id for aq in active_questionnaires), start, end)
+
+    funnels = []
+    for aq in active_questionnaires:
+        actions = counts.get(aq.id, {})
+        stages = []
+        previous = None
+        for action in FUNNEL_STAGES:
+            forms = actions.get(action, 0)
+            conversion = _rate(forms, previous) if previous is not None else 100
+            stages.append({
+                'action': action,
+                'forms': forms,
+                'conversion': conversion,
+                'drop_off': round(100 - conversion, 1) if previous else 0,
+            })
+            previous = forms
+
+        viewed = actions.get('form_viewed', 0)
+        funnels.append({
+            'active_questionnaire_id': aq.id,
+            'name': aq.questionnaire.name,
+            'title': aq.questionnaire.title,
+            'stages': stages,
+            'exits': {action: actions.get(action, 0) for action in FUNNEL_EXITS},
+            'overall_conversion': _rate(actions.get(FUNNEL_STAGES[-1], 0), viewed),
+        })
+    return funnels
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from prospect.export import CHUNK_SIZE, FORMATS, export_lines
+from prospect.models import Questionnaire
+
+
+class Command(BaseCommand):
+    help = 'Export all answers to a questionnaire as one row per prospect form and one column per question.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('questionnaire', type=int, help='Id of the questionnaire to export.')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default: csv).')
+        parser.add_argument('--output', help='File to write to instead of standard output.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Forms read per query; the answers to each batch of forms are read together.')
+
+    def handle(self, *args, **options):
+        try:
+            questionnaire = Questionnaire.objects.get(pk=options['questionnaire'])
+        except Questionnaire.DoesNotExist:
+            raise CommandError(f"Questionnaire {options['questionnaire']} does not exist.")
+
+        lines = export_lines(questionnaire, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"Exported {questionnaire.name} to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -1,55 +1,41 @@
+import time
+
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from prospect.models import Questionnaire, Question, Responses, SelectOption
+from prospect.sample_data import DEFAULTS, SampleDataGenerator
 
 
 class Command(BaseCommand):
-    help = 'Seed database with 3 questionnaires, each with 5 questions and responses.'
-
-    def handle(self, *args, **options):
-        with transaction.atomic():
-            created_qs = []
-            for qidx in range(1, 4):
-                name = f"questionnaire_{qidx}"
-                title = f"Sample Questionnaire {qidx}"
-                desc = f"Auto-generated sample questionnaire {qidx}."
-                questionnaire = Questionnaire.objects.create(name=name, title=title, description=desc)
-                created_qs.append(questionnaire)
+    help = ('Seed the database with deterministic synthetic tenants: organisations with disciplers, trainees, '
+            'questionnaires, submissions, prospects, follow-ups and funnel events. Scales to millions of rows.')
 
-                # choose two orders to be 'select' type
-                select_orders = {2, 4}
-                for order in range(1, 6):
-                    q_type = 'select' if order in select_orders else 'text'
-                    q_text = f"Question {order} for {title}"
-                    question = Question.objects.create(
-                        questionnaire=questionnaire,
-                        text=q_text,
-                        type=q_type,
-                        order=order,
-                    )
+    def add_arguments(self, parser):
+        parser.add_argument('--organisations', type=int, help=f"Organisations to create (default: {DEFAULTS['organisations']}).")
+        parser.add_argument('--questionnaires', type=int, help=f"Questionnaires per organisation (default: {DEFAULTS['questionnaires']}).")
+        parser.add_argument('--questions', type=int, help=f"Questions per questionnaire (default: {DEFAULTS['questions']}).")
+        parser.add_argument('--submissions', type=int, help=f"Submitted forms per questionnaire (default: {DEFAULTS['submissions']}).")
+        parser.add_argument('--prospects', type=int, help=f"Prospects per organisation (default: {DEFAULTS['prospects']}).")
+        parser.add_argument('--disciplers', type=int, help=f"Disciplers per organisation (default: {DEFAULTS['disciplers']}).")
+        parser.add_argument('--trainees', type=int, help=f"Trainees per organisation (default: {DEFAULTS['trainees']}).")
+        parser.add_argument('--trainings', type=int, help=f"Trainings per organisation (default: {DEFAULTS['trainings']}).")
+        parser.add_argument('--followups', type=int, help=f"Follow-ups per organisation (default: {DEFAULTS['followups']}).")
+        parser.add_argument('--log-events', type=int, help=f"Funnel log events per questionnaire (default: {DEFAULTS['log_events']}).")
+        parser.add_argument('--days', type=int, help=f"Spread timestamps over this many past days (default: {DEFAULTS['days']}).")
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert.')
+        parser.add_argument('--prefix', default='sample', help='Prefix for generated names, so several runs can coexist.')
 
-                    # create select options for select questions
-                    if q_type == 'select':
-                        opts = ['Option A', 'Option B', 'Option C']
-                        for idx, opt_text in enumerate(opts, start=1):
-                            SelectOption.objects.create(
-                                question=question,
-                                text=opt_text,
-                                value=opt_text,
-                                order=idx,
-                            )
+    def handle(self, *args, **options):
+        generator = SampleDataGenerator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            **{size: options[size] for size in DEFAULTS},
+        )
 
-                # create one response per question for this questionnaire
-                prospect_form_id = f"sample_form_{qidx}"
-                for question in questionnaire.questions.all():
-                    if question.type == 'select':
-                        answer = 'Option A'
-                    else:
-                        answer = f"Sample answer for {question.text}"
-                    Responses.objects.create(
-                        question=question,
-                        answer_text=answer,
-                        prospect_form_id=prospect_form_id,
-                    )
+        started = time.monotonic()
+        counts = generator.generate()
+        elapsed = time.monotonic() - started
 
-            self.stdout.write(self.style.SUCCESS(f"Created {len(created_qs)} questionnaires with questions and responses."))
+        for label, count in sorted(counts.items()):
+            self.stdout.write(f'{count:>12}  {label}')
+        self.stdout.write(self.style.SUCCESS(f'Created {sum(counts.values())} rows in {elapsed:.1f}s.'))
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_responses(apps, schema_editor):
+    """Keep the first answer of each (form, question) that a resubmitted form stored twice"""
+    Responses = apps.get_model('prospect', 'Responses')
+    duplicates = Responses.objects.filter(prospect_form_id__isnull=False).values(
+        'prospect_form_id', 'question_id'
+    ).annotate(keep=Min('id'), answers=Count('id')).filter(answers__gt=1).order_by()
+
+    for group in list(duplicates):
+        Responses.objects.filter(
+            prospect_form_id=group['prospect_form_id'], question_id=group['question_id']
+        ).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0008_delete_prospect'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_responses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='responses',
+            constraint=models.UniqueConstraint(fields=('prospect_form_id', 'question'), name='unique_response_per_form_question'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0009_responses_unique_form_question'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='questionnairelog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:08
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, StrIndex, Substr
+import django.db.models.deletion
+
+
+def split_form_ids(apps, schema_editor):
+    # Set-based, so it stays a few statements however many log rows there are
+    QuestionnaireLog = apps.get_model('prospect', 'QuestionnaireLog')
+    dash = StrIndex('form_id', Value('-'))
+
+    QuestionnaireLog.objects.filter(form_id__regex=r'-[0-9]+$').update(
+        form_key=Substr('form_id', 1, dash - 1),
+        active_questionnaire_id=Cast(Substr('form_id', dash + 1), models.BigIntegerField()),
+    )
+    QuestionnaireLog.objects.filter(form_key='').update(form_key=F('form_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0002_organisationdailymetrics'),
+        ('prospect', '0010_questionnairelog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionnairelog',
+            name='active_questionnaire',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='organisation.activequestionnaire'),
+        ),
+        migrations.AddField(
+            model_name='questionnairelog',
+            name='form_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(split_form_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='questionnairelog',
+            index=models.Index(fields=['action', 'timestamp'], name='questionnairelog_action_time'),
+        ),
+        migrations.AddIndex(
+            model_name='questionnairelog',
+            index=models.Index(fields=['form_key', 'action'], name='questionnairelog_form_action'),
+        ),
+    ]
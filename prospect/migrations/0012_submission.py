@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organisation', '0002_organisationdailymetrics'),
+        ('prospect', '0011_questionnairelog_form_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prospect_form_id', models.CharField(max_length=100, unique=True)),
+                ('submitted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('organisation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='submissions', to='organisation.organisation')),
+                ('questionnaire', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='prospect.questionnaire')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='responses',
+            name='submission',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='prospect.submission'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['questionnaire', 'submitted_at'], name='submission_questionnaire_time'),
+        ),
+    ]
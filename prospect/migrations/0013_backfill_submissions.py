@@ -0,0 +1,85 @@
+from django.db import migrations
+from django.db.models import Min, OuterRef, Subquery
+
+BATCH_SIZE = 2000
+
+
+def organisation_lookup(apps):
+    """Organisation for a form: from its form_viewed log row, else the questionnaire's only organisation"""
+    ActiveQuestionnaire = apps.get_model('organisation', 'ActiveQuestionnaire')
+    QuestionnaireLog = apps.get_model('prospect', 'QuestionnaireLog')
+
+    organisations_by_questionnaire = {}
+    for questionnaire_id, organisation_id in ActiveQuestionnaire.objects.values_list('questionnaire_id', 'organisation_id'):
+        organisations_by_questionnaire.setdefault(questionnaire_id, set()).add(organisation_id)
+    organisation_by_active_questionnaire = dict(ActiveQuestionnaire.objects.values_list('id', 'organisation_id'))
+
+    def lookup(rows):
+        viewed = dict(QuestionnaireLog.objects.filter(
+            action='form_viewed',
+            form_key__in=[row['prospect_form_id'] for row in rows],
+            active_questionnaire_id__isnull=False,
+        ).values_list('form_key', 'active_questionnaire_id'))
+
+        organisations = {}
+        for row in rows:
+            organisation_id = organisation_by_active_questionnaire.get(viewed.get(row['prospect_form_id']))
+            if organisation_id is None:
+                candidates = organisations_by_questionnaire.get(row['questionnaire_id'], set())
+                organisation_id = next(iter(candidates)) if len(candidates) == 1 else None
+            organisations[row['prospect_form_id']] = organisation_id
+        return organisations
+
+    return lookup
+
+
+def backfill_submissions(apps, schema_editor):
+    Responses = apps.get_model('prospect', 'Responses')
+    Submission = apps.get_model('prospect', 'Submission')
+    lookup = organisation_lookup(apps)
+
+    headers = Responses.objects.filter(prospect_form_id__isnull=False).values('prospect_form_id').annotate(
+        questionnaire_id=Min('question__questionnaire_id'),
+        submitted_at=Min('submitted_at'),
+    ).order_by('prospect_form_id')
+
+    batch = []
+    for row in headers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            create_submissions(Submission, batch, lookup(batch))
+            batch = []
+    if batch:
+        create_submissions(Submission, batch, lookup(batch))
+
+    Responses.objects.filter(prospect_form_id__isnull=False).update(submission_id=Subquery(
+        Submission.objects.filter(prospect_form_id=OuterRef('prospect_form_id')).values('id')[:1]
+    ))
+
+
+def create_submissions(Submission, rows, organisations):
+    Submission.objects.bulk_create([
+        Submission(
+            prospect_form_id=row['prospect_form_id'],
+            questionnaire_id=row['questionnaire_id'],
+            organisation_id=organisations[row['prospect_form_id']],
+            submitted_at=row['submitted_at'],
+        )
+        for row in rows
+    ])
+
+
+def remove_submissions(apps, schema_editor):
+    apps.get_model('prospect', 'Responses').objects.update(submission=None)
+    apps.get_model('prospect', 'Submission').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0012_submission'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_submissions, remove_submissions),
+    ]
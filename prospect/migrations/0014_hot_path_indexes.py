@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0013_backfill_submissions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='responses',
+            index=models.Index(fields=['question', 'submitted_at'], name='responses_question_submitted'),
+        ),
+    ]
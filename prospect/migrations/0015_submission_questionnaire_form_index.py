@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['questionnaire', 'prospect_form_id'], name='submission_questionnaire_form'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:08
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def attribute_logged_events(apps, schema_editor):
+    """Give every logged event after a form view the view's active questionnaire"""
+    QuestionnaireLog = apps.get_model('prospect', 'QuestionnaireLog')
+
+    def update(form_keys_by_questionnaire):
+        for active_questionnaire_id, form_keys in form_keys_by_questionnaire.items():
+            QuestionnaireLog.objects.filter(
+                form_key__in=form_keys, active_questionnaire_id__isnull=True
+            ).update(active_questionnaire_id=active_questionnaire_id)
+
+    views = QuestionnaireLog.objects.filter(
+        action='form_viewed', active_questionnaire_id__isnull=False
+    ).exclude(form_key='').values_list('form_key', 'active_questionnaire_id').order_by()
+
+    batch, size = defaultdict(list), 0
+    for form_key, active_questionnaire_id in views.iterator(chunk_size=BATCH_SIZE):
+        batch[active_questionnaire_id].append(form_key)
+        size += 1
+        if size == BATCH_SIZE:
+            update(batch)
+            batch, size = defaultdict(list), 0
+    update(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prospect', '0015_submission_questionnaire_form_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(attribute_logged_events, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='questionnairelog',
+            index=models.Index(fields=['active_questionnaire', 'action', 'timestamp'], name='questionnairelog_aq_action'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Questionnaire(models.Model):
@@ -33,19 +34,69 @@ class SelectOption(models.Model):
     def __str__(self):
         return "Option for %s" % (self.text)
 
+class Submission(models.Model):
+    prospect_form_id = models.CharField(max_length=100, unique=True)
+    questionnaire = models.ForeignKey(Questionnaire, related_name='submissions', on_delete=models.CASCADE)
+    organisation = models.ForeignKey('organisation.Organisation', related_name='submissions',
+                                     on_delete=models.SET_NULL, blank=True, null=True)
+    submitted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['questionnaire', 'submitted_at'], name='submission_questionnaire_time'),
+            models.Index(fields=['questionnaire', 'prospect_form_id'], name='submission_questionnaire_form'),
+        ]
+
+    def __str__(self):
+        return "Submission %s to %s" % (self.prospect_form_id, self.questionnaire.name)
+
 class Responses(models.Model):
+    submission = models.ForeignKey(Submission, related_name='responses', on_delete=models.CASCADE,
+                                   blank=True, null=True)
     question = models.ForeignKey(Question, related_name='responses', on_delete=models.CASCADE)
     answer_text = models.TextField(blank=True, null=True)
     prospect_form_id = models.CharField(max_length=100, blank=True, null=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # The unique constraint's index also serves lookups by prospect_form_id alone
+        constraints = [
+            models.UniqueConstraint(fields=['prospect_form_id', 'question'], name='unique_response_per_form_question'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'submitted_at'], name='responses_question_submitted'),
+        ]
+
     def __str__(self):
         return "Response to %s - %s at %s" % (self.question.questionnaire.name, self.question.text, self.submitted_at)
 
 class QuestionnaireLog(models.Model):
     form_id = models.CharField(max_length=200)
+    # form_id as logged is "<form key>-<active questionnaire id>" for form views
+    # and the bare form key afterwards; both parts are stored normalised, and
+    # later events take the active questionnaire of the form's earlier ones.
+    form_key = models.CharField(max_length=100, blank=True, default='')
+    active_questionnaire = models.ForeignKey('organisation.ActiveQuestionnaire', related_name='logs',
+                                             on_delete=models.SET_NULL, blank=True, null=True,
+                                             db_constraint=False)
     action = models.CharField(max_length=100)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when a buffered write reaches the database
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['action', 'timestamp'], name='questionnairelog_action_time'),
+            models.Index(fields=['form_key', 'action'], name='questionnairelog_form_action'),
+            models.Index(fields=['active_questionnaire', 'action', 'timestamp'], name='questionnairelog_aq_action'),
+        ]
+
+    @staticmethod
+    def parse_form_id(form_id):
+        """Split a logged form id into its form key and active questionnaire id"""
+        form_key, _, active_questionnaire_id = form_id.rpartition('-')
+        if form_key and active_questionnaire_id.isdigit():
+            return form_key, int(active_questionnaire_id)
+        return form_id, None
 
     def __str__(self):
         return "Log for %s at %s" % (self.form_id, self.timestamp)
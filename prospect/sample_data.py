@@ -0,0 +1,323 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Question, Questionnaire, QuestionnaireLog, Responses, SelectOption, Submission
+from organisation import caching, rollups, tenancy
+from organisation.models import (ActiveQuestionnaire, AppUser, DisciplerProfile, DiscipleshipFollowUp,
+                                 DiscipleshipPaths, DiscipleshipPathsAssignment, Organisation, Prospect,
+                                 TraineeProfile, Training)
+
+DEFAULTS = {
+    'organisations': 1,
+    'questionnaires': 3,
+    'questions': 5,
+    'submissions': 20,
+    'prospects': 20,
+    'disciplers': 5,
+    'trainees': 5,
+    'trainings': 3,
+    'followups': 20,
+    'log_events': 100,
+    'days': 365,
+}
+
+FIRST_NAMES = ['Amani', 'Baraka', 'Chloe', 'David', 'Esther', 'Faith', 'Grace', 'Hosea', 'Imani', 'Joel',
+               'Kezia', 'Levi', 'Miriam', 'Nathan', 'Olive', 'Peter', 'Ruth', 'Samuel', 'Tabitha', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Banda', 'Cole', 'Dlamini', 'Eze', 'Falk', 'Gitau', 'Hall', 'Ibe', 'Juma',
+              'Kato', 'Lema', 'Mwangi', 'Nkosi', 'Okello', 'Phiri', 'Quist', 'Sato', 'Tembo', 'Wanjiru']
+SELECT_OPTIONS = ['Option A', 'Option B', 'Option C']
+TRAINEE_STATUSES = ['enrolled', 'in_progress', 'stalled', 'completed', 'dropped']
+ASSIGNMENT_STATUSES = ['not_started', 'in_progress', 'stalled', 'completed']
+
+# Chance of a form going on to each next funnel step, and where it leaves otherwise
+FUNNEL = [
+    ('form_submitted', 0.7, None),
+    ('prospect_signing_up', 0.6, 'prospect_declined'),
+    ('prospect_signed_up', 0.5, 'prospect_self_study_signup'),
+    ('prospect_final_success', 0.8, None),
+]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def _auto_timestamp_fields(model):
+    return [field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the given auto_now/auto_now_add values instead of stamping the current time.
+
+    This flips the flags on the shared model fields, so for as long as the
+    block runs every save of those models in the process, on any thread, keeps
+    its own timestamps too. It is not thread-safe: only use it from a
+    single-threaded process such as the seed_sample_data command or a test.
+    """
+    fields = [field for model in models for field in _auto_timestamp_fields(model)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _stamps(model, moment):
+    """Every auto timestamp field of the model, set to the given moment"""
+    return {field.name: moment for field in _auto_timestamp_fields(model)}
+
+
+class SampleDataGenerator:
+    """Deterministic synthetic tenants for development and benchmarking.
+
+    Every value comes from one seeded Random, so the same seed and sizes
+    always give the same rows (timestamps are spread back from today). Rows
+    are written with bulk_create in batches, one organisation per transaction,
+    and the rollup and cached pages are brought up to date at the end.
+
+    Sizes are per organisation, except submissions and log_events, which are
+    per questionnaire.
+    """
+
+    def __init__(self, seed=42, batch_size=5000, prefix='sample', **sizes):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.sizes = {**DEFAULTS, **{key: value for key, value in sizes.items() if value is not None}}
+        self.now = timezone.now()
+        self.counts = Counter()
+        self.password = make_password(None)
+
+    def _insert(self, model, objects, keep=False):
+        """bulk_create an iterable of instances in batches; returns them when keep is set"""
+        kept = []
+        for batch in _chunks(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+            self.counts[model._meta.label] += len(batch)
+            if keep:
+                kept.extend(batch)
+        return kept
+
+    def _moment(self):
+        return self.now - timedelta(seconds=self.random.randrange(self.sizes['days'] * 86400))
+
+    def _person(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def generate(self):
+        with explicit_timestamps(Prospect, Responses, DiscipleshipPathsAssignment, DiscipleshipFollowUp,
+                                 TraineeProfile):
+            with transaction.atomic():
+                paths = self._insert(DiscipleshipPaths, (
+                    DiscipleshipPaths(name=f'{self.prefix} path {n}', description='Generated discipleship path.')
+                    for n in range(1, 4)
+                ), keep=True)
+
+            organisations = []
+            for number in range(1, self.sizes['organisations'] + 1):
+                with transaction.atomic():
+                    organisations.append(self._organisation(number, paths))
+
+        rollups.rebuild()
+        caching.invalidate_organisations(organisation.id for organisation in organisations)
+        # bulk_create skips the signals that refresh the tenant cache
+        tenancy.invalidate()
+        return self.counts
+
+    def _users(self, organisation, role, count):
+        """count auth users with their AppUser rows for one role; returns the AppUsers"""
+        label = f'{self.prefix}-{organisation.id}-{role}'
+        users = []
+        for n in range(count):
+            first_name, last_name = self._person()
+            users.append(User(
+                username=f'{label}-{n}', first_name=first_name, last_name=last_name,
+                email=f'{label}-{n}@example.com', password=self.password,
+            ))
+        users = self._insert(User, users, keep=True)
+        return self._insert(AppUser, (
+            AppUser(organisation=organisation, user=user, role=role) for user in users
+        ), keep=True)
+
+    def _organisation(self, number, paths):
+        sizes = self.sizes
+        organisation = Organisation.objects.create(
+            name=f'{self.prefix.title()} Organisation {number}',
+            email=f'{self.prefix}-org-{number}@example.com',
+        )
+        self.counts[Organisation._meta.label] += 1
+        self._users(organisation, 'admin', 1)
+
+        trainings = self._insert(Training, (
+            Training(name=f'{organisation.name} training {n}', description='Generated training.')
+            for n in range(1, sizes['trainings'] + 1)
+        ), keep=True)
+        Training.organisations.through.objects.bulk_create([
+            Training.organisations.through(training_id=training.id, organisation_id=organisation.id)
+            for training in trainings
+        ])
+
+        disciplers = self._insert(DisciplerProfile, (
+            DisciplerProfile(user=app_user, bio='Generated discipler.')
+            for app_user in self._users(organisation, 'discipler', sizes['disciplers'])
+        ), keep=True)
+        if trainings:
+            self._insert(DisciplerProfile.trainings_completed.through, (
+                DisciplerProfile.trainings_completed.through(disciplerprofile_id=discipler.id, training_id=training.id)
+                for discipler in disciplers
+                for training in self.random.sample(trainings, self.random.randint(0, len(trainings)))
+            ))
+
+            trainees = self._users(organisation, 'trainee', sizes['trainees'])
+            self._insert(TraineeProfile, (
+                TraineeProfile(user=app_user, enrolled_training=self.random.choice(trainings),
+                               status=self.random.choice(TRAINEE_STATUSES), **_stamps(TraineeProfile, self._moment()))
+                for app_user in trainees
+            ))
+
+        form_ids = []
+        for n in range(1, sizes['questionnaires'] + 1):
+            form_ids.extend(self._questionnaire(organisation, n))
+
+        self._prospects(organisation, form_ids, disciplers, paths)
+        return organisation
+
+    def _questionnaire(self, organisation, number):
+        """A questionnaire with its questions, submissions, answers and funnel events; returns the form ids"""
+        sizes = self.sizes
+        questionnaire = Questionnaire.objects.create(
+            name=f'{organisation.name} questionnaire {number}',
+            title=f'Sample Questionnaire {number}',
+            description=f'Auto-generated sample questionnaire {number}.',
+        )
+        self.counts[Questionnaire._meta.label] += 1
+        active_questionnaire = ActiveQuestionnaire.objects.create(organisation=organisation, questionnaire=questionnaire)
+
+        # Every other question is a select
+        questions = self._insert(Question, (
+            Question(questionnaire=questionnaire, text=f'Question {order} for {questionnaire.title}',
+                     type='select' if order % 2 == 0 else 'text', order=order)
+            for order in range(1, sizes['questions'] + 1)
+        ), keep=True)
+        options = self._insert(SelectOption, (
+            SelectOption(text=text, value=text, order=order) for order, text in enumerate(SELECT_OPTIONS, start=1)
+        ), keep=True)
+        SelectOption.questions.through.objects.bulk_create([
+            SelectOption.questions.through(selectoption_id=option.id, question_id=question.id)
+            for question in questions if question.type == 'select' for option in options
+        ])
+
+        form_ids = ['%s%04d%03d%08d' % (self.prefix.upper(), organisation.id, number, n)
+                    for n in range(sizes['submissions'])]
+        for batch in _chunks(form_ids, self.batch_size):
+            submissions = self._insert(Submission, (
+                Submission(prospect_form_id=form_id, questionnaire=questionnaire, organisation=organisation,
+                           submitted_at=self._moment())
+                for form_id in batch
+            ), keep=True)
+            self._insert(Responses, (
+                Responses(submission=submission, question=question, prospect_form_id=submission.prospect_form_id,
+                          answer_text=(self.random.choice(SELECT_OPTIONS) if question.type == 'select'
+                                       else f'Answer {self.random.randrange(1000)} to {question.text}'),
+                          submitted_at=submission.submitted_at)
+                for submission in submissions for question in questions
+            ))
+
+        self._insert(QuestionnaireLog, self._log_events(form_ids, active_questionnaire.id))
+        return form_ids
+
+    def _log_events(self, form_ids, active_questionnaire_id):
+        """Funnel events: every submitted form's path through the funnel, then views that went no further"""
+        remaining = self.sizes['log_events']
+        views = 0
+        while remaining > 0:
+            if views < len(form_ids):
+                form_key, submitted = form_ids[views], True
+            else:
+                form_key, submitted = '%s%s%08d' % (self.prefix.upper(), 'V', self.random.randrange(10 ** 8)), False
+            views += 1
+
+            moment = self._moment()
+            events = [(f'{form_key}-{active_questionnaire_id}', 'form_viewed', active_questionnaire_id)]
+            if submitted:
+                for action, chance, exit_action in FUNNEL:
+                    if action != 'form_submitted' and self.random.random() > chance:
+                        if exit_action:
+                            events.append((form_key, exit_action, active_questionnaire_id))
+                        break
+                    events.append((form_key, action, active_questionnaire_id))
+
+            for form_id, action, aq_id in events[:remaining]:
+                yield QuestionnaireLog(form_id=form_id, form_key=form_key, active_questionnaire_id=aq_id,
+                                       action=action, timestamp=moment)
+                moment += timedelta(minutes=self.random.randint(1, 30))
+            remaining -= len(events)
+
+    def _prospects(self, organisation, form_ids, disciplers, paths):
+        """Prospects from the organisation's submitted forms (then fresh form ids), with assignments and follow-ups"""
+        sizes = self.sizes
+        assigned = []
+
+        def prospects():
+            for n in range(sizes['prospects']):
+                first_name, last_name = self._person()
+                form_id = form_ids[n] if n < len(form_ids) else '%sP%04d%08d' % (self.prefix.upper(), organisation.id, n)
+                discipler = self.random.choice(disciplers) if disciplers and self.random.random() < 0.6 else None
+                yield Prospect(
+                    name=f'{first_name} {last_name}',
+                    email=f'{self.prefix}-{organisation.id}-prospect-{n}@example.com',
+                    phone_number='07%08d' % self.random.randrange(10 ** 8),
+                    prospect_form_id=form_id,
+                    organisation=organisation,
+                    discipler=discipler,
+                    **_stamps(Prospect, self._moment()),
+                )
+
+        for batch in _chunks(prospects(), self.batch_size):
+            batch = self._insert(Prospect, batch, keep=True)
+            assigned.extend((prospect.id, prospect.discipler_id, prospect.created_at)
+                            for prospect in batch if prospect.discipler_id)
+
+            self._insert(DiscipleshipPathsAssignment, (
+                DiscipleshipPathsAssignment(
+                    prospect_id=prospect.id, discipleship_path=self.random.choice(paths),
+                    completion_status=self.random.choice(ASSIGNMENT_STATUSES),
+                    **_stamps(DiscipleshipPathsAssignment, prospect.created_at),
+                )
+                for prospect in batch if prospect.discipler_id
+            ))
+
+        if not assigned:
+            return
+
+        def followups():
+            for _ in range(sizes['followups']):
+                prospect_id, discipler_id, created_at = self.random.choice(assigned)
+                yield DiscipleshipFollowUp(
+                    prospect_id=prospect_id, discipler_id=discipler_id, notes='Generated follow-up.',
+                    # Spread around today, so some are overdue and some still to come
+                    follow_up_date=self.now + timedelta(days=self.random.randint(-30, 30)),
+                    **_stamps(DiscipleshipFollowUp, created_at),
+                )
+
+        self._insert(DiscipleshipFollowUp, followups())
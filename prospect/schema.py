@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Question, Questionnaire, SelectOption
+from organisation import caching
+from organisation.models import ActiveQuestionnaire
+
+# Compiled questionnaires are keyed on a single schema version, bumped by any
+# admin edit to a questionnaire, its questions, their options or activation.
+SCHEMA_SCOPE = 'questionnaire-schema'
+
+
+def _cache_key(kind, object_id):
+    version, = caching.get_versions(SCHEMA_SCOPE)
+    return 'certeza:schema:%s:%s:%s' % (version, kind, object_id)
+
+
+def compile_questionnaire(questionnaire_id):
+    """Plain-data form of a questionnaire with its ordered questions and options"""
+    questionnaire = Questionnaire.objects.filter(pk=questionnaire_id).values(
+        'id', 'name', 'title', 'description'
+    ).first()
+    if questionnaire is None:
+        return None
+
+    questions = Question.objects.filter(questionnaire_id=questionnaire_id).order_by('order', 'id').prefetch_related(
+        Prefetch('options', queryset=SelectOption.objects.order_by('order', 'id'))
+    )
+    questionnaire['questions'] = [{
+        'id': question.id,
+        'text': question.text,
+        'type': question.type,
+        'order': question.order,
+        'options': [{'text': option.text, 'value': option.value} for option in question.options.all()],
+    } for question in questions]
+    return questionnaire
+
+
+def get_questionnaire_schema(questionnaire_id):
+    """The compiled questionnaire, or None if it does not exist"""
+    key = _cache_key('questionnaire', questionnaire_id)
+    schema = cache.get(key)
+    if schema is None:
+        schema = compile_questionnaire(questionnaire_id)
+        cache.set(key, schema, timeout=None)
+    return schema
+
+
+def get_active_questionnaire(active_questionnaire_id):
+    """The questionnaire, organisation and active flag of an ActiveQuestionnaire, or None if it does not exist"""
+    key = _cache_key('active', active_questionnaire_id)
+    active = cache.get(key)
+    if active is None:
+        active = ActiveQuestionnaire.objects.filter(pk=active_questionnaire_id).values(
+            'questionnaire_id', 'organisation_id', 'is_active'
+        ).first()
+        cache.set(key, active, timeout=None)
+    return active
+
+
+def invalidate():
+    caching.bump_version(SCHEMA_SCOPE)
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from . import schema
+from .models import Question, Questionnaire, SelectOption
+from organisation.models import ActiveQuestionnaire
+
+
+def invalidate_questionnaire_schema(sender, raw=False, action=None, **kwargs):
+    if raw or (action is not None and not action.startswith('post_')):
+        return
+    transaction.on_commit(schema.invalidate)
+
+
+for model in (Questionnaire, Question, SelectOption, ActiveQuestionnaire):
+    post_save.connect(invalidate_questionnaire_schema, sender=model)
+    post_delete.connect(invalidate_questionnaire_schema, sender=model)
+m2m_changed.connect(invalidate_questionnaire_schema, sender=SelectOption.questions.through)
@@ -1,3 +1,584 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
 
-# Create your tests here.
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from organisation.models import (DisciplerProfile, DiscipleshipFollowUp, DiscipleshipPathsAssignment, Prospect,
+                                 TraineeProfile)
+from organisation.tests import BenchmarkTestCase, build_organisation
+from .analytics import ResponseCube, cubes
+from .events import LogBuffer, build_event, log_event
+from .export import export_lines
+from .funnel import organisation_funnel, stage_counts
+from .models import Question, QuestionnaireLog, Responses, SelectOption, Submission
+from .sample_data import SampleDataGenerator
+
+
+def form_url(tenant):
+    return f"/prospect/form/{tenant['active_questionnaire'].id}/"
+
+
+class PublicFormBenchmarks(BenchmarkTestCase):
+    """The public questionnaire pages, for anonymous visitors and with the schema cache warm as in steady state"""
+
+    def test_form(self):
+        self.assertWithinBudget('prospect_form', 'get', form_url, warm=True, anonymous=True)
+
+    def test_form_submit(self):
+        def submit_url(tenant):
+            return f"/prospect/form/submit/{tenant['active_questionnaire'].questionnaire_id}/"
+
+        def submission(tenant, run):
+            # Every run submits a new form; a repeated form id would take the rejection path
+            return {
+                'new_form_id': f"BENCHMARK{tenant['organisation'].id}X{run + 1}",
+                'active_questionnaire_id': tenant['active_questionnaire'].id,
+                'question_1': 'Benchmark answer',
+            }
+
+        self.assertWithinBudget('prospect_form_submit', 'post', submit_url, submission, warm=True, anonymous=True)
+
+    def test_join(self):
+        def join_url(tenant):
+            return f"/prospect/form/prospect/BENCHMARK1/join?active_questionnaire_id={tenant['active_questionnaire'].id}"
+
+        self.assertWithinBudget('prospect_join', 'get', join_url, warm=True, anonymous=True)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class FormSchemaTests(TestCase):
+    """The public form is served from the compiled schema, which admin edits must invalidate"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=0)
+        cls.questionnaire = cls.data['questionnaire']
+        cls.name = Question.objects.get(questionnaire=cls.questionnaire, type='text')
+        cls.pick = Question.objects.get(questionnaire=cls.questionnaire, type='select')
+        cls.admin = User.objects.create_superuser('admin', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def form(self):
+        response = self.client.get(form_url(self.data))
+        self.assertTemplateUsed(response, 'form.html')
+        return response.content.decode()
+
+    def admin_post(self, path, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/prospect/{path}', data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_warm_form_makes_no_schema_queries(self):
+        self.client.logout()
+        self.form()
+        # Only the form_viewed event is written; the schema and active questionnaire come from the cache
+        with self.assertNumQueries(1):
+            self.form()
+
+    def test_admin_edits_show_on_the_form(self):
+        self.assertIn('Survey', self.form())
+
+        self.admin_post(f'questionnaire/{self.questionnaire.id}/change/', {
+            'name': self.questionnaire.name, 'title': 'Tell us about yourself', 'description': '',
+        })
+        self.assertIn('Tell us about yourself', self.form())
+
+        self.admin_post(f'question/{self.name.id}/change/', {
+            'questionnaire': self.questionnaire.id, 'text': 'What should we call you?', 'type': 'text', 'order': 1,
+        })
+        self.assertIn('What should we call you?', self.form())
+
+        self.admin_post('selectoption/add/', {'questions': [self.pick.id], 'text': 'Option 4', 'value': 'option-4',
+                                              'order': 4})
+        self.assertIn('Option 4', self.form())
+        option = SelectOption.objects.get(value='option-4')
+
+        # Moved off the select question, whose options are the only ones the form lists
+        self.admin_post(f'selectoption/{option.id}/change/', {'questions': [self.name.id], 'text': 'Option 4',
+                                                              'value': 'option-4', 'order': 4})
+        self.assertNotIn('Option 4', self.form())
+
+        first = SelectOption.objects.get(value='option-1')
+        self.admin_post(f'selectoption/{first.id}/delete/', {'post': 'yes'})
+        self.assertNotIn('Option 1', self.form())
+
+        self.admin_post('question/add/', {
+            'questionnaire': self.questionnaire.id, 'text': 'Anything else?', 'type': 'text', 'order': 3,
+        })
+        self.assertIn('Anything else?', self.form())
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class FormSubmitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, form_id, answer):
+        questionnaire = self.data['questionnaire']
+        question = Question.objects.filter(questionnaire=questionnaire).order_by('order').first()
+        return self.client.post(f'/prospect/form/submit/{questionnaire.id}/', {
+            'new_form_id': form_id,
+            'active_questionnaire_id': self.data['active_questionnaire'].id,
+            f'question_{question.id}': answer,
+        })
+
+    def test_resubmitted_form_stores_no_more_answers(self):
+        self.assertEqual(self.post('RESUBMIT', 'First').status_code, 200)
+        answers = list(Responses.objects.filter(prospect_form_id='RESUBMIT').order_by('question_id').values_list(
+            'question_id', 'answer_text'))
+        self.assertEqual(len(answers), 2)
+
+        response = self.post('RESUBMIT', 'Second')
+
+        self.assertTemplateUsed(response, 'join.html')
+        self.assertEqual(list(Responses.objects.filter(prospect_form_id='RESUBMIT').order_by('question_id').values_list(
+            'question_id', 'answer_text')), answers)
+        self.assertEqual(Submission.objects.filter(prospect_form_id='RESUBMIT').count(), 1)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class FunnelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=0)
+        cls.other = build_organisation(name='Other', prospects=0)
+        cls.aq = cls.data['active_questionnaire']
+        cls.other_aq = cls.other['active_questionnaire']
+
+        def visit(form_key, active_questionnaire, *actions):
+            log_event(f'{form_key}-{active_questionnaire.id}', 'form_viewed', active_questionnaire.id)
+            for action in actions:
+                log_event(form_key, action, active_questionnaire.id)
+
+        visit('A', cls.aq, 'form_submitted', 'prospect_signing_up', 'prospect_signed_up')
+        visit('B', cls.aq, 'form_submitted', 'prospect_declined')
+        visit('C', cls.aq)
+        visit('D', cls.other_aq, 'form_submitted', 'prospect_signing_up')
+        cls.start = timezone.now() - timedelta(hours=1)
+        cls.end = timezone.now() + timedelta(hours=1)
+
+    def test_later_events_carry_the_viewed_questionnaire(self):
+        self.assertFalse(QuestionnaireLog.objects.filter(active_questionnaire__isnull=True).exists())
+        self.assertEqual(QuestionnaireLog.objects.filter(form_key='D', active_questionnaire=self.other_aq).count(), 3)
+
+    def test_stage_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = stage_counts([self.aq.id, self.other_aq.id], self.start, self.end)
+
+        self.assertEqual(counts[self.aq.id], {
+            'form_viewed': 3, 'form_submitted': 2, 'prospect_signing_up': 1,
+            'prospect_signed_up': 1, 'prospect_declined': 1,
+        })
+        self.assertEqual(counts[self.other_aq.id], {'form_viewed': 1, 'form_submitted': 1, 'prospect_signing_up': 1})
+        self.assertEqual(stage_counts([self.aq.id], self.end, self.end + timedelta(hours=1)), {})
+
+    def test_organisation_funnel_rates(self):
+        funnel, = organisation_funnel(self.data['organisation'], self.start, self.end)
+
+        self.assertEqual([(stage['forms'], stage['conversion']) for stage in funnel['stages']],
+                         [(3, 100), (2, 66.7), (1, 50.0), (1, 100.0), (0, 0)])
+        self.assertEqual(funnel['exits'], {'prospect_declined': 1, 'prospect_self_study_signup': 0})
+        self.assertEqual(funnel['overall_conversion'], 0)
+
+    def test_every_page_of_the_form_logs_the_questionnaire_it_was_served_from(self):
+        response = self.client.get(f'/prospect/form/{self.other_aq.id}/')
+        form_id = response.context['new_form_id']
+        response = self.client.post(f"/prospect/form/submit/{self.other['questionnaire'].id}/", {
+            'new_form_id': form_id, 'active_questionnaire_id': self.other_aq.id,
+        })
+        join = f'/prospect/form/prospect/{form_id}/join?active_questionnaire_id={self.other_aq.id}'
+        self.assertContains(response, join)
+
+        # The id comes with the request: no earlier event is read back to find it
+        with self.assertNumQueries(1):
+            self.client.get(join)
+        self.client.post(join)
+        self.client.get(f'/prospect/form/prospect/{form_id}/no-join?active_questionnaire_id={self.other_aq.id}')
+
+        self.assertEqual(list(QuestionnaireLog.objects.filter(form_key=form_id).order_by('id').values_list(
+            'action', 'active_questionnaire_id')), [
+            ('form_viewed', self.other_aq.id), ('form_submitted', self.other_aq.id),
+            ('prospect_signing_up', self.other_aq.id), ('prospect_signed_up', self.other_aq.id),
+            ('prospect_declined', self.other_aq.id),
+        ])
+
+    def test_a_page_without_a_known_questionnaire_logs_none(self):
+        for query in ['', '?active_questionnaire_id=999999', '?active_questionnaire_id=x']:
+            self.client.get(f'/prospect/form/prospect/A/final-success{query}')
+        self.assertEqual(list(QuestionnaireLog.objects.filter(
+            form_key='A', action='prospect_final_success').values_list('active_questionnaire_id', flat=True)),
+            [None, None, None])
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class ResponseCubeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 20 forms, all answering option-1 to the select question
+        cls.data = build_organisation(prospects=20)
+        cls.questionnaire = cls.data['questionnaire']
+        cls.pick = Question.objects.get(questionnaire=cls.questionnaire, type='select')
+        cls.colour = Question.objects.create(questionnaire=cls.questionnaire, text='Colour', type='select', order=3)
+        for order, colour in enumerate(['Red', 'Blue'], start=1):
+            SelectOption.objects.create(text=colour, value=colour.lower(), order=order).questions.add(cls.colour)
+
+    def setUp(self):
+        cache.clear()
+        cubes.clear()
+        self.addCleanup(cubes.clear)
+
+    def submit(self, form_id, pick, colour):
+        submission = Submission.objects.create(prospect_form_id=form_id, questionnaire=self.questionnaire)
+        Responses.objects.bulk_create([
+            Responses(submission=submission, question=self.pick, answer_text=pick, prospect_form_id=form_id),
+            Responses(submission=submission, question=self.colour, answer_text=colour, prospect_form_id=form_id),
+        ])
+
+    def test_columns_are_coded_by_option_order(self):
+        self.submit('CUBE1', 'option-2', 'blue')
+        self.submit('CUBE2', 'Option 3', 'Red')
+        self.submit('CUBE3', 'something else', '')
+
+        cube = ResponseCube(self.questionnaire.id)
+        cube.refresh(chunk_size=7)
+
+        self.assertEqual(cube.size, 23)
+        self.assertEqual(list(cube.columns[self.colour.id][-3:]), [2, 1, 0])
+        self.assertEqual([(d['label'], d['count']) for d in cube.distribution(self.pick.id)], [
+            ('No answer', 0), ('Option 1', 20), ('Option 2', 1), ('Option 3', 1), ('Other', 1),
+        ])
+        crosstab = cube.crosstab(self.pick.id, self.colour.id)
+        self.assertEqual(crosstab['columns'], ['No answer', 'Red', 'Blue', 'Other'])
+        self.assertEqual(crosstab['counts'][1], [20, 0, 0, 0])
+        self.assertEqual(crosstab['counts'][2], [0, 0, 1, 0])
+        self.assertEqual(crosstab['counts'][3], [0, 1, 0, 0])
+        self.assertEqual(crosstab['counts'][4], [1, 0, 0, 0])
+
+    def test_new_submissions_are_appended(self):
+        cube = cubes.get(self.questionnaire.id)
+        self.assertEqual(cube.size, 20)
+
+        self.submit('CUBE1', 'option-2', 'red')
+        # Two queries for the new forms and their answers, one more to find there are no others
+        with self.assertNumQueries(3):
+            self.assertIs(cubes.get(self.questionnaire.id), cube)
+        self.assertEqual(cube.size, 21)
+        self.assertEqual(cube.distribution(self.colour.id)[1]['count'], 1)
+
+    def test_edited_answers_rebuild_the_cube(self):
+        cube = cubes.get(self.questionnaire.id)
+
+        answer = Responses.objects.filter(question=self.pick).first()
+        answer.answer_text = 'option-3'
+        answer.save()
+
+        rebuilt = cubes.get(self.questionnaire.id)
+        self.assertIsNot(rebuilt, cube)
+        self.assertEqual(rebuilt.distribution(self.pick.id)[3]['count'], 1)
+
+    def test_schema_edits_rebuild_the_cube(self):
+        self.submit('CUBE1', 'option-2', 'green')
+        cube = cubes.get(self.questionnaire.id)
+        other = cube.distribution(self.colour.id)[-1]
+        self.assertEqual((other['label'], other['count']), ('Other', 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SelectOption.objects.create(text='Green', value='green', order=3).questions.add(self.colour)
+        rebuilt = cubes.get(self.questionnaire.id)
+        self.assertIsNot(rebuilt, cube)
+        self.assertEqual([(d['label'], d['count']) for d in rebuilt.distribution(self.colour.id)], [
+            ('No answer', 20), ('Red', 0), ('Blue', 0), ('Green', 1), ('Other', 0),
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            size = Question.objects.create(questionnaire=self.questionnaire, text='Size', type='select', order=4)
+            SelectOption.objects.create(text='Small', value='small', order=1).questions.add(size)
+        Responses.objects.create(submission=Submission.objects.get(prospect_form_id='CUBE1'), question=size,
+                                 answer_text='small', prospect_form_id='CUBE1')
+        cube = cubes.get(self.questionnaire.id)
+        self.assertIsNot(cube, rebuilt)
+        self.assertEqual([(d['label'], d['count']) for d in cube.distribution(size.id)], [
+            ('No answer', 20), ('Small', 1), ('Other', 0),
+        ])
+
+    def test_endpoint_is_scoped_to_the_organisation(self):
+        other = build_organisation(name='Other', prospects=0)
+        self.client.force_login(self.data['staff'])
+
+        url = f'/organisation/survey-responses/analytics/{self.questionnaire.id}/'
+        data = self.client.get(url, {'question': self.pick.id}).json()
+        self.assertEqual(data['submissions'], 20)
+        self.assertEqual([q['text'] for q in data['questions']], ['Pick one', 'Colour'])
+        self.assertEqual(data['distribution'][1], {'label': 'Option 1', 'count': 20, 'share': 100.0})
+
+        crosstab = self.client.get(url, {'row': self.pick.id, 'column': self.colour.id}).json()['crosstab']
+        self.assertEqual(crosstab['counts'][1][0], 20)
+        self.assertEqual(self.client.get(url, {'question': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            f'/organisation/survey-responses/analytics/{other["questionnaire"].id}/'
+        ).status_code, 404)
+
+
+@override_settings(QUESTIONNAIRE_LOG_BUFFER={'ENABLED': False})
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_organisation(prospects=5)
+        cls.questionnaire = cls.data['questionnaire']
+        # Shares its text with the first question; its answers must not overwrite that one's
+        cls.repeat = Question.objects.create(questionnaire=cls.questionnaire, text='Your name?', type='text', order=3)
+        submission = Submission.objects.get(prospect_form_id='CERTEZA000000')
+        Responses.objects.create(submission=submission, question=cls.repeat, answer_text='Again',
+                                 prospect_form_id='CERTEZA000000')
+
+    def export(self, format):
+        self.client.force_login(self.data['staff'])
+        response = self.client.get(
+            f'/organisation/survey-responses/export/{self.questionnaire.id}/', {'format': format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_is_streamed_one_row_per_form(self):
+        rows = list(csv.reader(StringIO(self.export('csv'))))
+        self.assertEqual(rows[0], ['prospect_form_id', 'submitted_at', 'Your name?', 'Pick one', 'Your name?'])
+        self.assertEqual([row[0] for row in rows[1:]], [f'CERTEZA{i:06d}' for i in range(5)])
+        self.assertEqual(rows[1][2:], ['Prospect 0', 'option-1', 'Again'])
+        self.assertEqual(rows[2][2:], ['Prospect 1', 'option-1', ''])
+
+    def test_jsonl_keeps_answers_to_questions_sharing_a_text(self):
+        lines = [json.loads(line) for line in self.export('jsonl').splitlines()]
+        self.assertEqual(len(lines), 5)
+        name, pick = Question.objects.filter(questionnaire=self.questionnaire, order__lt=3).order_by('order')
+        self.assertEqual(lines[0]['prospect_form_id'], 'CERTEZA000000')
+        self.assertEqual([(a['question_id'], a['question'], a['answer']) for a in lines[0]['answers']], [
+            (name.id, 'Your name?', 'Prospect 0'),
+            (pick.id, 'Pick one', 'option-1'),
+            (self.repeat.id, 'Your name?', 'Again'),
+        ])
+        self.assertIsNone(lines[1]['answers'][2]['answer'])
+
+    def test_chunk_size_does_not_change_the_output(self):
+        for format in ('csv', 'jsonl'):
+            whole = list(export_lines(self.questionnaire, format, chunk_size=100))
+            self.assertEqual(list(export_lines(self.questionnaire, format, chunk_size=2)), whole)
+
+    def test_command_writes_the_export(self):
+        out = StringIO()
+        call_command('export_responses', str(self.questionnaire.id), '--format', 'jsonl', '--chunk-size', '2',
+                     stdout=out)
+        self.assertEqual(out.getvalue(), ''.join(export_lines(self.questionnaire, 'jsonl')))
+
+    def test_export_is_scoped_to_the_organisation(self):
+        other = build_organisation(name='Other', prospects=0)
+        self.client.force_login(self.data['staff'])
+        self.assertEqual(self.client.get(
+            f'/organisation/survey-responses/export/{other["questionnaire"].id}/'
+        ).status_code, 404)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class SampleDataTests(TestCase):
+    SIZES = {'questionnaires': 2, 'submissions': 8, 'prospects': 12, 'followups': 10, 'log_events': 30}
+
+    def generate(self, seed):
+        """The rows one run writes, keyed by their generated names rather than primary keys, then rolled back"""
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now().replace(microsecond=0)):
+            with transaction.atomic():
+                SampleDataGenerator(seed=seed, **self.SIZES).generate()
+                rows = {
+                    'users': list(User.objects.order_by('username').values_list(
+                        'username', 'first_name', 'last_name', 'appuser__role')),
+                    'trainees': list(TraineeProfile.objects.order_by('user__user__username').values_list(
+                        'user__user__username', 'enrolled_training__name', 'status', 'created_at')),
+                    'trainings_completed': list(DisciplerProfile.trainings_completed.through.objects.order_by(
+                        'disciplerprofile__user__user__username', 'training__name').values_list(
+                        'disciplerprofile__user__user__username', 'training__name')),
+                    'submissions': list(Submission.objects.order_by('prospect_form_id').values_list(
+                        'prospect_form_id', 'questionnaire__name', 'submitted_at')),
+                    'responses': list(Responses.objects.order_by('prospect_form_id', 'question__order').values_list(
+                        'prospect_form_id', 'question__text', 'answer_text', 'submitted_at')),
+                    'events': list(QuestionnaireLog.objects.order_by('form_key', 'timestamp', 'action').values_list(
+                        'form_id', 'form_key', 'action', 'timestamp')),
+                    'prospects': list(Prospect.objects.order_by('email').values_list(
+                        'name', 'email', 'phone_number', 'prospect_form_id', 'discipler__user__user__username',
+                        'created_at')),
+                    'assignments': list(DiscipleshipPathsAssignment.objects.order_by('prospect__email').values_list(
+                        'prospect__email', 'discipleship_path__name', 'completion_status', 'created_at')),
+                    'followups': list(DiscipleshipFollowUp.objects.order_by(
+                        'prospect__email', 'follow_up_date', 'discipler__user__user__username').values_list(
+                        'prospect__email', 'discipler__user__user__username', 'follow_up_date', 'created_at')),
+                }
+                transaction.set_rollback(True)
+        return rows
+
+    def test_same_seed_gives_the_same_rows(self):
+        first = self.generate(seed=7)
+        self.assertTrue(all(first.values()))
+        self.assertEqual(self.generate(seed=7), first)
+        self.assertNotEqual(self.generate(seed=8), first)
+
+
+class LogBufferTests(TransactionTestCase):
+    """The writer thread commits on its own connection, so these run outside a test transaction"""
+
+    def setUp(self):
+        self.buffer = LogBuffer()
+        self.addCleanup(self.buffer.stop)
+
+    def add(self, count):
+        for i in range(count):
+            self.buffer.add(build_event(f'FORM{i}', 'form_viewed'))
+
+    def flushed(self):
+        # The in-memory test database refuses reads of a table another connection is writing, so
+        # wait for the writer thread to take the events and finish its flush rather than poll the table
+        emptied = wait_for(lambda: not len(self.buffer))
+        with self.buffer._flush_lock:
+            return emptied
+
+    @override_settings(QUESTIONNAIRE_LOG_BUFFER={'MAX_SIZE': 100, 'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 60})
+    def test_flushes_once_a_batch_is_waiting(self):
+        self.add(2)
+        time.sleep(0.1)
+        self.assertEqual(QuestionnaireLog.objects.count(), 0)
+
+        self.add(1)
+        self.assertTrue(self.flushed())
+        self.assertEqual(QuestionnaireLog.objects.count(), 3)
+
+    @override_settings(QUESTIONNAIRE_LOG_BUFFER={'MAX_SIZE': 100, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 0.05})
+    def test_flushes_after_the_interval(self):
+        self.add(1)
+        self.assertTrue(self.flushed())
+        self.assertEqual(QuestionnaireLog.objects.count(), 1)
+
+    @override_settings(QUESTIONNAIRE_LOG_BUFFER={'MAX_SIZE': 2, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60})
+    def test_full_buffer_is_flushed_by_the_caller(self):
+        self.add(2)
+        self.assertEqual(QuestionnaireLog.objects.count(), 0)
+
+        self.add(1)
+        # Written before add() returned, on the caller's thread
+        self.assertEqual(QuestionnaireLog.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 1)
+
+    @override_settings(QUESTIONNAIRE_LOG_BUFFER={'MAX_SIZE': 100, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60})
+    def test_stop_drains_the_buffer(self):
+        self.add(5)
+        self.buffer.stop()
+
+        self.assertEqual(QuestionnaireLog.objects.count(), 5)
+        self.assertFalse(self.buffer._thread.is_alive())
+
+    def test_queued_events_are_written_at_exit(self):
+        script = textwrap.dedent("""
+            import django
+            django.setup()
+            from django.conf import settings
+            from prospect import events
+            settings.QUESTIONNAIRE_LOG_BUFFER = {'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 60}
+            events.QuestionnaireLog.objects.bulk_create = lambda batch: print('written', len(batch))
+            for i in range(3):
+                events.log_event(f'FORM{i}-1', 'form_viewed')
+            print('queued', len(events.log_buffer))
+        """)
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=60,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'certeza.settings'},
+        )
+
+        self.assertEqual(result.stdout.split('\n')[:2], ['queued 3', 'written 3'], result.stderr)
+
+
+class SubmissionBackfillTests(TransactionTestCase):
+    """prospect 0013 turns the answers already stored into one Submission per form"""
+
+    before = [('prospect', '0012_submission'), ('organisation', '0002_organisationdailymetrics')]
+    after = [('prospect', '0013_backfill_submissions'), ('organisation', '0002_organisationdailymetrics')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_one_submission_per_form(self):
+        apps = self.migrate(self.before)
+        Organisation = apps.get_model('organisation', 'Organisation')
+        ActiveQuestionnaire = apps.get_model('organisation', 'ActiveQuestionnaire')
+        Questionnaire = apps.get_model('prospect', 'Questionnaire')
+        Question = apps.get_model('prospect', 'Question')
+        Responses = apps.get_model('prospect', 'Responses')
+        QuestionnaireLog = apps.get_model('prospect', 'QuestionnaireLog')
+
+        first, second = (Organisation.objects.create(name=name, email=f'{name}@example.com') for name in 'xy')
+        shared, own = (Questionnaire.objects.create(name=name, title=name) for name in ('shared', 'own'))
+        ActiveQuestionnaire.objects.create(organisation=first, questionnaire=shared)
+        served = ActiveQuestionnaire.objects.create(organisation=second, questionnaire=shared)
+        ActiveQuestionnaire.objects.create(organisation=first, questionnaire=own)
+        QuestionnaireLog.objects.create(form_id=f'VIEWED-{served.id}', form_key='VIEWED',
+                                        active_questionnaire=served, action='form_viewed')
+
+        started = timezone.now() - timedelta(days=3)
+        for form_id, questionnaire in [('VIEWED', shared), ('OWN', own), ('UNKNOWN', shared)]:
+            for order in range(2):
+                question, _ = Question.objects.get_or_create(questionnaire=questionnaire, order=order,
+                                                             defaults={'text': f'Q{order}', 'type': 'text'})
+                answer = Responses.objects.create(question=question, prospect_form_id=form_id, answer_text='a')
+                Responses.objects.filter(pk=answer.pk).update(submitted_at=started + timedelta(hours=order))
+
+        apps = self.migrate(self.after)
+        Submission = apps.get_model('prospect', 'Submission')
+        Responses = apps.get_model('prospect', 'Responses')
+
+        submissions = {
+            submission.prospect_form_id: submission for submission in Submission.objects.all()
+        }
+        self.assertEqual(set(submissions), {'VIEWED', 'OWN', 'UNKNOWN'})
+        self.assertEqual(
+            {form_id: (s.questionnaire_id, s.organisation_id) for form_id, s in submissions.items()},
+            # A questionnaire run by two organisations needs the form view to say which one
+            {'VIEWED': (shared.id, second.id), 'OWN': (own.id, first.id), 'UNKNOWN': (shared.id, None)},
+        )
+        self.assertTrue(all(s.submitted_at == started for s in submissions.values()))
+        self.assertFalse(Responses.objects.filter(submission__isnull=True).exists())
+        self.assertTrue(all(
+            answer.submission.prospect_form_id == answer.prospect_form_id
+            for answer in Responses.objects.select_related('submission')
+        ))
@@ -1,29 +1,38 @@
 import uuid
 
+from django.db import IntegrityError, transaction
 from django.shortcuts import render
-from .models import Questionnaire, Question, Responses, QuestionnaireLog
+from .models import Responses, Submission
+from .events import build_event, log_event
+from .schema import get_active_questionnaire, get_questionnaire_schema
+from organisation.caching import invalidate_organisations
+from organisation.rollups import record_submission
+
+def _passed_active_questionnaire_id(request):
+    """The active questionnaire a funnel page's link says the form was served from, if it exists"""
+    value = request.GET.get('active_questionnaire_id', '')
+    if value.isdigit() and get_active_questionnaire(int(value)):
+        return int(value)
+    return None
 
 def prospect_form(request, questionnaire_id=None):
     if request.method == 'GET' and questionnaire_id:
-        active_questionnaire = organisation.ActiveQuestionnaire.objects.get(id=questionnaire_id)
+        active_questionnaire = get_active_questionnaire(questionnaire_id)
 
-        if not active_questionnaire or not active_questionnaire.is_active:
+        if not active_questionnaire or not active_questionnaire['is_active']:
             return render(request, 'error.html', {'message': 'Questionnaire not found or not active'})
 
-        questionnaire = active_questionnaire.questionnaire
-        questions = questionnaire.questions.all()
+        # Compiled and cached: only the form id below is specific to this visitor
+        questionnaire = get_questionnaire_schema(active_questionnaire['questionnaire_id'])
 
         new_form_id = uuid.uuid4().hex.upper()
 
-        log = QuestionnaireLog.objects.create(
-            form_id="{}-{}".format(new_form_id, active_questionnaire.id),
-            action='form_viewed'
-        )
-        log.save()
+        log_event("{}-{}".format(new_form_id, questionnaire_id), 'form_viewed', questionnaire_id)
 
         context = {
             'questionnaire': questionnaire,
-            'questions': questions,
+            'questions': questionnaire['questions'],
+            'active_questionnaire_id': questionnaire_id,
             'new_form_id': new_form_id,
         }
         return render(request, 'form.html', context)
@@ -32,51 +41,63 @@ def prospect_form(request, questionnaire_id=None):
 def prospect_form_submit(request, questionnaire_id=None):
     if request.method == 'POST' and questionnaire_id:
         new_form_id = request.POST.get('new_form_id')
-        questionnaire = Questionnaire.objects.get(id=questionnaire_id)
-
-        logged = QuestionnaireLog.objects.filter(
-            form_id=new_form_id,
-            action='form_submitted',
-        )
-
-        if logged.count() > 0:
-            # return render(request, 'error.html', {'message': 'Form already submitted'})
-            return render(request, 'join.html', {'questionnaire': questionnaire, 'prospect_form_id': new_form_id})
-
-        questions = questionnaire.questions.all()
-
-        for question in questions:
-            answer = request.POST.get(f'question_{question.id}', '')
-            Responses.objects.create(
-                question=question,
-                answer_text=answer,
-                prospect_form_id=new_form_id,
-            )
-
-        log = QuestionnaireLog.objects.create(
-            form_id=new_form_id,
-            action='form_submitted',
-        )
-        log.save()
-
-        return render(request, 'join.html', {'questionnaire': questionnaire, 'prospect_form_id': new_form_id})
+        questionnaire = get_questionnaire_schema(questionnaire_id)
+        if not new_form_id or not questionnaire:
+            return render(request, 'error.html', {'message': 'Invalid request'})
+
+        # The form says which organisation's active questionnaire it was served from
+        posted_active_questionnaire = request.POST.get('active_questionnaire_id', '')
+        active_questionnaire = None
+        if posted_active_questionnaire.isdigit():
+            active_questionnaire = get_active_questionnaire(int(posted_active_questionnaire))
+        organisation_id = None
+        active_questionnaire_id = None
+        if active_questionnaire and active_questionnaire['questionnaire_id'] == questionnaire['id']:
+            organisation_id = active_questionnaire['organisation_id']
+            active_questionnaire_id = int(posted_active_questionnaire)
+
+        # The unique prospect_form_id on the submission (and on each answer) rejects
+        # a resubmitted form, so a retry rolls back here and falls through to the join page.
+        try:
+            with transaction.atomic():
+                submission = Submission.objects.create(
+                    prospect_form_id=new_form_id,
+                    questionnaire_id=questionnaire['id'],
+                    organisation_id=organisation_id,
+                )
+                Responses.objects.bulk_create([
+                    Responses(
+                        submission=submission,
+                        question_id=question['id'],
+                        answer_text=request.POST.get(f'question_{question["id"]}', ''),
+                        prospect_form_id=new_form_id,
+                    )
+                    for question in questionnaire['questions']
+                ])
+                build_event(new_form_id, 'form_submitted', active_questionnaire_id).save()
+                organisation_ids = record_submission(questionnaire['id'], submission.submitted_at)
+                transaction.on_commit(lambda: invalidate_organisations(organisation_ids))
+        except IntegrityError:
+            pass
+
+        return render(request, 'join.html', {
+            'questionnaire': questionnaire,
+            'prospect_form_id': new_form_id,
+            'active_questionnaire_id': active_questionnaire_id,
+        })
 
     return render(request, 'error.html', {'message': 'Invalid request'})
 
 def prospect_join(request, prospect_form_id=None):
     if request.method == 'GET' and prospect_form_id:
-        log = QuestionnaireLog.objects.create(
-            form_id=prospect_form_id,
-            action='prospect_signing_up',
-        )
-        log.save()
-        return render(request, 'train.html', {'prospect_form_id': prospect_form_id})
+        active_questionnaire_id = _passed_active_questionnaire_id(request)
+        log_event(prospect_form_id, 'prospect_signing_up', active_questionnaire_id)
+        return render(request, 'train.html', {
+            'prospect_form_id': prospect_form_id,
+            'active_questionnaire_id': active_questionnaire_id,
+        })
     if request.method == 'POST' and prospect_form_id:
-        log = QuestionnaireLog.objects.create(
-            form_id=prospect_form_id,
-            action='prospect_signed_up',
-        )
-        log.save()
+        log_event(prospect_form_id, 'prospect_signed_up', _passed_active_questionnaire_id(request))
         # p = Prospect.objects.create(
         #     name=request.POST.get('name'),
         #     email=request.POST.get('email'),
@@ -89,30 +110,31 @@ def prospect_join(request, prospect_form_id=None):
 
 def prospect_no_join(request, prospect_form_id=None):
     if request.method == 'GET' and prospect_form_id:
-        log = QuestionnaireLog.objects.create(
-            form_id=prospect_form_id,
-            action='prospect_declined',
-        )
-        log.save()
-        return render(request, 'nojoin.html', {'prospect_form_id': prospect_form_id})
+        active_questionnaire_id = _passed_active_questionnaire_id(request)
+        log_event(prospect_form_id, 'prospect_declined', active_questionnaire_id)
+        return render(request, 'nojoin.html', {
+            'prospect_form_id': prospect_form_id,
+            'active_questionnaire_id': active_questionnaire_id,
+        })
     return render(request, 'error.html', {'message': 'Invalid request'})
 
 def prospect_join_self_study(request, prospect_form_id=None):
     if request.method == 'GET' and prospect_form_id:
-        log = QuestionnaireLog.objects.create(
-            form_id=prospect_form_id,
-            action='prospect_self_study_signup',
-        )
-        log.save()
-        return render(request, 'selfstudy.html', {'prospect_form_id': prospect_form_id, 'self_study': True})
+        active_questionnaire_id = _passed_active_questionnaire_id(request)
+        log_event(prospect_form_id, 'prospect_self_study_signup', active_questionnaire_id)
+        return render(request, 'selfstudy.html', {
+            'prospect_form_id': prospect_form_id,
+            'active_questionnaire_id': active_questionnaire_id,
+            'self_study': True,
+        })
     return render(request, 'error.html', {'message': 'Invalid request'})
 
 def prospect_final_success(request, prospect_form_id=None):
     if request.method == 'GET' and prospect_form_id:
-        log = QuestionnaireLog.objects.create(
-            form_id=prospect_form_id,
-            action='prospect_final_success',
-        )
-        log.save()
-        return render(request, 'finalsuccess.html', {'prospect_form_id': prospect_form_id})
+        active_questionnaire_id = _passed_active_questionnaire_id(request)
+        log_event(prospect_form_id, 'prospect_final_success', active_questionnaire_id)
+        return render(request, 'finalsuccess.html', {
+            'prospect_form_id': prospect_form_id,
+            'active_questionnaire_id': active_questionnaire_id,
+        })
     return render(request, 'error.html', {'message': 'Invalid request'})
\ No newline at end of file